@@ -0,0 +1,124 @@
+import time
+import logging
+import operator
+import threading
+from datetime import datetime
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+}
+
+WILDCARD = '*'
+
+@dataclass
+class AlertRule:
+    name: str
+    metric: str
+    op: str
+    threshold: float
+    device_id: str = WILDCARD
+    hysteresis: float = 0.0       # distance back past the threshold needed to clear
+    dedupe_seconds: float = 300.0 # minimum time between two notifications
+    severity: str = 'warning'
+    check: Callable = field(init=False, repr=False)
+    clear_threshold: float = field(init=False)
+
+    def __post_init__(self):
+        if self.op not in OPERATORS:
+            raise ValueError(f"Unsupported operator in rule {self.name}: {self.op}")
+        self.check = OPERATORS[self.op]
+        # For upper bounds the alert clears below threshold - hysteresis,
+        # for lower bounds above threshold + hysteresis
+        if self.op in ('>', '>='):
+            self.clear_threshold = self.threshold - self.hysteresis
+        else:
+            self.clear_threshold = self.threshold + self.hysteresis
+
+    def is_cleared(self, value: float) -> bool:
+        if self.op in ('>', '>='):
+            return value <= self.clear_threshold
+        return value >= self.clear_threshold
+
+
+class AlertEngine:
+    """Threshold rules evaluated inline for every incoming reading.
+
+    Rules are indexed by (device_id, metric) so a reading only touches the
+    rules that can match it; state lives in memory and nothing is read
+    from the database.
+    """
+
+    def __init__(self, rules: List[AlertRule]):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.index: Dict[Tuple[str, str], List[AlertRule]] = {}
+        self.metrics = set()
+        # (rule name, device_id) -> [active, notified, last_notified]
+        self.state: Dict[Tuple[str, str], list] = {}
+
+        for rule in rules:
+            self.index.setdefault((rule.device_id, rule.metric), []).append(rule)
+            self.metrics.add(rule.metric)
+
+    @classmethod
+    def from_config(cls, rules: List[Dict]) -> 'AlertEngine':
+        """Compile rule definitions from configuration"""
+        return cls([AlertRule(**rule) for rule in rules])
+
+    def evaluate(self, reading: Dict) -> List[Dict]:
+        """Evaluate a reading and return triggered/resolved alert events"""
+        device_id = reading['device_id']
+        events = []
+        now = time.time()
+
+        for metric in self.metrics:
+            value = reading.get(metric)
+            if value is None:
+                continue
+
+            rules = self.index.get((device_id, metric), []) + self.index.get((WILDCARD, metric), [])
+            for rule in rules:
+                event = self._apply(rule, device_id, value, now)
+                if event:
+                    events.append(event)
+
+        return events
+
+    def _apply(self, rule: AlertRule, device_id: str, value: float, now: float):
+        """Advance the state machine of one rule for one device"""
+        key = (rule.name, device_id)
+        with self.lock:
+            state = self.state.setdefault(key, [False, False, 0.0])
+            active, notified, last_notified = state
+
+            if not active and rule.check(value, rule.threshold):
+                state[0] = True
+                # Flapping alerts inside the dedupe window are tracked but not re-sent
+                state[1] = now - last_notified >= rule.dedupe_seconds
+                if state[1]:
+                    state[2] = now
+                    return self._event(rule, device_id, value, 'triggered')
+            elif active and rule.is_cleared(value):
+                state[0] = False
+                state[1] = False
+                if notified:
+                    return self._event(rule, device_id, value, 'resolved')
+        return None
+
+    def _event(self, rule: AlertRule, device_id: str, value: float, state: str) -> Dict:
+        self.logger.warning(f"Alert {rule.name} {state} for {device_id}: {rule.metric}={value}")
+        return {
+            'rule': rule.name,
+            'device_id': device_id,
+            'metric': rule.metric,
+            'value': value,
+            'threshold': rule.threshold,
+            'severity': rule.severity,
+            'state': state,
+            'created_at': datetime.now().isoformat()
+        }
\ No newline at end of file
@@ -0,0 +1,168 @@
+import time
+import sqlite3
+import logging
+import warnings
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from profiling import connect
+from sharding import attach_shards
+
+METRICS = ('temperature', 'humidity', 'light_level', 'voltage')
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+class SensorAnalytics:
+    """Vectorized statistics over windows of sensor readings.
+
+    A window is loaded with a single query and laid out as a
+    (devices x samples) matrix per metric, padded with NaN, so every
+    statistic is computed for all devices at once.
+    """
+
+    def __init__(self, db_path: str, rolling_window: int = 5,
+                 zscore_threshold: float = 3.0, max_anomalies: int = 100, shards: int = 1):
+        self.db_path = db_path
+        self.shards = shards
+        self.rolling_window = rolling_window
+        self.zscore_threshold = zscore_threshold
+        self.max_anomalies = max_anomalies
+        self.logger = logging.getLogger(__name__)
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Create database connection"""
+        conn = connect(self.db_path)
+        attach_shards(conn, self.db_path, self.shards)
+        return conn
+
+    def load_window(self, hours: float, device_id: Optional[str] = None) -> Dict:
+        """Load readings of the last `hours` into padded per-device matrices"""
+        conn = self.get_connection()
+        try:
+            query = '''
+                SELECT k.device_id, r.ts / 1000,
+                       temperature, humidity, light_level, voltage
+                FROM sensor_readings r JOIN device_keys k ON k.device_key = r.device_key
+                WHERE r.ts >= ?
+            '''
+            params = [int((time.time() - float(hours) * 3600) * 1000)]
+            if device_id:
+                query += ' AND k.device_id = ?'
+                params.append(device_id)
+            query += ' ORDER BY k.device_id, r.ts'
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+        if not rows:
+            return {'devices': [], 'counts': np.zeros(0, dtype=np.int64),
+                    'timestamps': np.empty((0, 0)), 'metrics': {m: np.empty((0, 0)) for m in METRICS}}
+
+        columns = list(zip(*rows))
+        devices, inverse, counts = np.unique(np.array(columns[0]), return_inverse=True, return_counts=True)
+
+        # Rows arrive sorted by device, so the offset inside a device's
+        # block gives the column of each reading in the padded matrix.
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        positions = np.arange(len(rows)) - starts[inverse]
+        shape = (len(devices), int(counts.max()))
+
+        def to_matrix(values) -> np.ndarray:
+            matrix = np.full(shape, np.nan)
+            matrix[inverse, positions] = np.array(values, dtype=float)
+            return matrix
+
+        return {
+            'devices': devices.tolist(),
+            'counts': counts,
+            'timestamps': to_matrix(columns[1]),
+            'metrics': {metric: to_matrix(columns[i + 2]) for i, metric in enumerate(METRICS)}
+        }
+
+    def rolling_mean(self, matrix: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """Mean of the last `rolling_window` valid samples of every row"""
+        valid = ~np.isnan(matrix)
+        sums = np.concatenate((np.zeros((len(matrix), 1)), np.cumsum(np.where(valid, matrix, 0.0), axis=1)), axis=1)
+        totals = np.concatenate((np.zeros((len(matrix), 1)), np.cumsum(valid, axis=1)), axis=1)
+
+        rows = np.arange(len(matrix))
+        begin = np.maximum(counts - self.rolling_window, 0)
+        window_sum = sums[rows, counts] - sums[rows, begin]
+        window_n = totals[rows, counts] - totals[rows, begin]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(window_n > 0, window_sum / window_n, np.nan)
+
+    def discharge_slope(self, timestamps: np.ndarray, voltage: np.ndarray) -> np.ndarray:
+        """Least-squares voltage slope per device, in volts per hour"""
+        mask = ~np.isnan(timestamps) & ~np.isnan(voltage)
+        n = mask.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t_mean = np.where(mask, timestamps, 0.0).sum(axis=1) / n
+            v_mean = np.where(mask, voltage, 0.0).sum(axis=1) / n
+            dt = np.where(mask, timestamps - t_mean[:, None], 0.0)
+            dv = np.where(mask, voltage - v_mean[:, None], 0.0)
+            slope = (dt * dv).sum(axis=1) / (dt * dt).sum(axis=1)
+        return slope * 3600
+
+    def find_anomalies(self, devices: List[str], timestamps: np.ndarray,
+                       metrics: Dict[str, np.ndarray], means: Dict[str, np.ndarray],
+                       stds: Dict[str, np.ndarray]) -> List[Dict]:
+        """Readings whose z-score exceeds the configured threshold"""
+        anomalies = []
+        for metric, matrix in metrics.items():
+            with np.errstate(invalid='ignore', divide='ignore'):
+                zscores = (matrix - means[metric][:, None]) / stds[metric][:, None]
+            hits = np.argwhere(np.abs(zscores) > self.zscore_threshold)
+            for row, col in hits:
+                anomalies.append({
+                    'device_id': devices[row],
+                    'metric': metric,
+                    'timestamp': int(timestamps[row, col]),
+                    'value': float(matrix[row, col]),
+                    'zscore': round(float(zscores[row, col]), 2)
+                })
+
+        anomalies.sort(key=lambda a: abs(a['zscore']), reverse=True)
+        return anomalies[:self.max_anomalies]
+
+    def compute(self, hours: float = 24, device_id: Optional[str] = None) -> Dict:
+        """Compute percentiles, rolling means, anomalies and discharge slopes"""
+        window = self.load_window(hours, device_id)
+        devices = window['devices']
+        counts = window['counts']
+        metrics = window['metrics']
+
+        means, stds = {}, {}
+        device_stats = [{'device_id': d, 'samples': int(c)} for d, c in zip(devices, counts)]
+        with warnings.catch_warnings():
+            # All-NaN rows (e.g. sensors without a light meter) are expected
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            for metric, matrix in metrics.items():
+                means[metric] = np.nanmean(matrix, axis=1) if devices else np.zeros(0)
+                stds[metric] = np.nanstd(matrix, axis=1) if devices else np.zeros(0)
+                percentiles = np.nanpercentile(matrix, PERCENTILES, axis=1) if devices else np.zeros((len(PERCENTILES), 0))
+                rolling = self.rolling_mean(matrix, counts)
+
+                for i, stats in enumerate(device_stats):
+                    stats[metric] = {
+                        'mean': _round(means[metric][i]),
+                        'std': _round(stds[metric][i]),
+                        'rolling_mean': _round(rolling[i]),
+                        'percentiles': {f'p{p}': _round(percentiles[j][i]) for j, p in enumerate(PERCENTILES)}
+                    }
+
+        slopes = self.discharge_slope(window['timestamps'], metrics['voltage'])
+        for i, stats in enumerate(device_stats):
+            stats['voltage_slope_per_hour'] = _round(slopes[i], 4)
+
+        return {
+            'window_hours': hours,
+            'devices': device_stats,
+            'anomalies': self.find_anomalies(devices, window['timestamps'], metrics, means, stds)
+        }
+
+
+def _round(value: float, digits: int = 2) -> Optional[float]:
+    """Round a numpy scalar for JSON output, mapping NaN/inf to None"""
+    return round(float(value), digits) if np.isfinite(value) else None
\ No newline at end of file
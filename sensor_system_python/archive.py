@@ -0,0 +1,228 @@
+import time
+import sqlite3
+import logging
+import threading
+from itertools import groupby
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import numpy as np
+
+from compression import METRICS, encode_block, decode_block
+from database import ARCHIVE_TOTALS, ARCHIVE_TOTALS_UPSERT, apply_pragmas, from_epoch_ms
+from profiling import connect
+from sharding import attach_shards, shard_paths
+
+
+def archive_rows(conn: sqlite3.Connection, params: Dict, chunk_ms: int) -> int:
+    """Move readings before :cutoff with id up to :watermark into compressed chunks.
+
+    Runs in the caller's write transaction; replicas replay it with the
+    leader's parameters and get the same chunks.
+    """
+    rows = conn.execute(f'''
+        SELECT device_key, ts, {', '.join(METRICS)}
+        FROM sensor_readings
+        WHERE ts < :cutoff AND id <= :watermark
+        ORDER BY device_key, ts
+    ''', params).fetchall()
+    if not rows:
+        return 0
+
+    for (device_key, chunk_start), chunk in groupby(rows, key=lambda r: (r[0], r[1] // chunk_ms * chunk_ms)):
+        _store_chunk(conn, device_key, chunk_start, list(chunk))
+
+    # Statistics keep counting the readings through their totals
+    conn.execute(f'''
+        INSERT INTO archive_totals (device_key, {', '.join(ARCHIVE_TOTALS)})
+        SELECT device_key, COUNT(*), MIN(ts), MAX(ts),
+               {', '.join(f'TOTAL({m}), COUNT({m})' for m in METRICS)}
+        FROM sensor_readings
+        WHERE ts < :cutoff AND id <= :watermark
+        GROUP BY device_key
+        {ARCHIVE_TOTALS_UPSERT}
+    ''', params)
+    conn.execute('DELETE FROM sensor_readings WHERE ts < :cutoff AND id <= :watermark', params)
+    conn.execute('''
+        INSERT INTO archive_state (name, cutoff, watermark) VALUES ('sensor_readings', :cutoff, :watermark)
+        ON CONFLICT (name) DO UPDATE SET cutoff = max(cutoff, excluded.cutoff),
+                                         watermark = max(watermark, excluded.watermark)
+    ''', params)
+    return len(rows)
+
+
+def _store_chunk(conn: sqlite3.Connection, device_key: int, chunk_start: int, rows: list):
+    columns = list(zip(*rows))
+    timestamps = np.array(columns[1], dtype=np.int64)
+    values = {metric: np.array(columns[i + 2], dtype=float) for i, metric in enumerate(METRICS)}
+
+    # Late readings for an already archived chunk are merged into it
+    existing = conn.execute('''
+        SELECT data FROM sensor_chunks WHERE device_key = ? AND chunk_start = ?
+    ''', (device_key, chunk_start)).fetchone()
+    if existing:
+        block = decode_block(existing[0])
+        timestamps = np.concatenate((block['ts'], timestamps))
+        values = {metric: np.concatenate((block[metric], values[metric])) for metric in METRICS}
+        order = np.argsort(timestamps, kind='stable')
+        timestamps = timestamps[order]
+        values = {metric: column[order] for metric, column in values.items()}
+
+    conn.execute('''
+        INSERT OR REPLACE INTO sensor_chunks (device_key, chunk_start, chunk_end, count, data)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (device_key, chunk_start, int(timestamps[-1]), len(timestamps),
+          encode_block(timestamps.tolist(), values)))
+
+
+def archived_rows(conn: sqlite3.Connection) -> Iterator[tuple]:
+    """Archived readings in the sensor_data row shape, chunk by chunk.
+
+    Blocks keep only time and metrics, so id and seq are None.
+    """
+    chunks = conn.execute('''
+        SELECT k.device_id, c.device_key, c.data
+        FROM sensor_chunks c JOIN device_keys k ON k.device_key = c.device_key
+        ORDER BY c.device_key, c.chunk_start
+    ''')
+    for device_id, device_key, data in chunks:
+        block = decode_block(data)
+        columns = [[None if np.isnan(value) else value for value in block[metric].tolist()] for metric in METRICS]
+        light = METRICS.index('light_level')
+        columns[light] = [None if value is None else int(value) for value in columns[light]]
+        for ts, *values in zip(block['ts'].tolist(), *columns):
+            yield (None, device_id, *values,
+                   datetime.fromtimestamp(ts // 1000, timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+                   from_epoch_ms(ts), None, device_key, ts)
+
+
+class ReadingArchive:
+    """Compressed long-term storage of old readings.
+
+    Readings older than the configured age are moved out of
+    sensor_readings into one compressed block per device and chunk
+    (one hour by default) in sensor_chunks. Only readings already folded
+    into the rollups are archived, so charts over archived time keep
+    working from sensor_rollups; range scans of raw values go through
+    read_range, which decodes the blocks into NumPy arrays.
+    """
+
+    def __init__(self, db_path: str, after_hours: float, chunk_seconds: int = 3600,
+                 interval: float = 300.0, pragmas: Optional[Dict[str, Any]] = None, shards: int = 1,
+                 changelog=None):
+        self.db_path = db_path
+        # Archiving passes are logged for replicas when the leader has a change log
+        self.changelog = changelog
+        self.shards = shards
+        self.after_hours = after_hours
+        self.chunk_ms = chunk_seconds * 1000
+        # Seconds between archiving passes started by run_if_due
+        self.interval = interval
+        self.last_run = 0.0
+        self.pragmas = pragmas
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def get_connection(self, path: Optional[str] = None) -> sqlite3.Connection:
+        """Connection to one shard file, or to all shards when path is None"""
+        conn = connect(path or self.db_path)
+        apply_pragmas(conn, self.pragmas)
+        if path is None:
+            attach_shards(conn, self.db_path, self.shards)
+        return conn
+
+    def archive(self, older_than: float) -> int:
+        """Compress whole chunks of readings received before `older_than` (epoch seconds)"""
+        cutoff = int(older_than * 1000) // self.chunk_ms * self.chunk_ms
+        with self.lock:
+            # The watermark only grows, so reading it first is safe
+            conn = self.get_connection(self.db_path)
+            try:
+                row = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'sensor_rollups'").fetchone()
+            finally:
+                conn.close()
+
+            params = {'cutoff': cutoff, 'watermark': row[0] if row else 0}
+            return sum(self._archive_shard(path, params) for path in shard_paths(self.db_path, self.shards))
+
+    def _archive_shard(self, path: str, params: Dict) -> int:
+        conn = self.get_connection(path)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            archived = archive_rows(conn, params, self.chunk_ms)
+            if not archived:
+                conn.rollback()
+                return 0
+            if self.changelog:
+                self.changelog.commit(conn, ['archive', params['cutoff'], params['watermark'], self.chunk_ms])
+            else:
+                conn.commit()
+            self.logger.info(f"Archived {archived} readings")
+            return archived
+
+        except sqlite3.Error as e:
+            conn.rollback()
+            self.logger.error(f"Archiving failed: {e}")
+            return 0
+        finally:
+            conn.close()
+
+    def read_range(self, start: float, end: float,
+                   device_ids: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, np.ndarray]]:
+        """Readings between two epoch timestamps from archived chunks and live rows.
+
+        Returns {device_id: {'ts': int64 epoch ms, metric: float64}} with
+        each device's arrays sorted by time.
+        """
+        params = {'start': int(start * 1000), 'end': int(end * 1000)}
+        device_filter = ''
+        if device_ids is not None:
+            device_ids = list(device_ids)
+            names = [f'd{i}' for i in range(len(device_ids))]
+            device_filter = f" AND k.device_id IN ({', '.join(':' + name for name in names)})"
+            params.update(zip(names, device_ids))
+
+        conn = self.get_connection()
+        try:
+            chunks = conn.execute(f'''
+                SELECT k.device_id, c.data
+                FROM sensor_chunks c JOIN device_keys k ON k.device_key = c.device_key
+                WHERE c.chunk_end >= :start AND c.chunk_start < :end{device_filter}
+                ORDER BY k.device_id, c.chunk_start
+            ''', params).fetchall()
+            rows = conn.execute(f'''
+                SELECT k.device_id, r.ts, {', '.join('r.' + m for m in METRICS)}
+                FROM sensor_readings r JOIN device_keys k ON k.device_key = r.device_key
+                WHERE r.ts >= :start AND r.ts < :end{device_filter}
+                ORDER BY k.device_id, r.ts
+            ''', params).fetchall()
+        finally:
+            conn.close()
+
+        parts: Dict[str, list] = {}
+        for device_id, data in chunks:
+            parts.setdefault(device_id, []).append(decode_block(data))
+        for device_id, group in groupby(rows, key=lambda r: r[0]):
+            columns = list(zip(*group))
+            parts.setdefault(device_id, []).append({
+                'ts': np.array(columns[1], dtype=np.int64),
+                **{metric: np.array(columns[i + 2], dtype=float) for i, metric in enumerate(METRICS)}
+            })
+
+        series = {}
+        for device_id, blocks in sorted(parts.items()):
+            timestamps = np.concatenate([block['ts'] for block in blocks])
+            mask = (timestamps >= params['start']) & (timestamps < params['end'])
+            order = np.argsort(timestamps[mask], kind='stable')
+            series[device_id] = {'ts': timestamps[mask][order]}
+            for metric in METRICS:
+                series[device_id][metric] = np.concatenate([block[metric] for block in blocks])[mask][order]
+        return series
+
+    def run_if_due(self) -> int:
+        """Archive readings older than after_hours at most once per interval"""
+        now = time.time()
+        if now - self.last_run < self.interval:
+            return 0
+        self.last_run = now
+        return self.archive(now - self.after_hours * 3600)
\ No newline at end of file
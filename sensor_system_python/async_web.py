@@ -0,0 +1,206 @@
+import io
+import sys
+import json
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import socketio
+
+from live_feed import HEARTBEAT, StreamFilter, open_stream, parse_last_event_id
+
+
+class AsyncWebServer:
+    """ASGI front end for WebInterface.
+
+    HTTP requests are handed to the Flask app on a bounded thread pool,
+    so the blocking SQLite work of one request (say a large export) only
+    holds one pool thread while the event loop keeps serving the others.
+    Response bodies are sent chunk by chunk as the app yields them.
+    Socket.IO runs on the event loop and realtime broadcasts from the
+    update thread are scheduled onto it, so idle dashboard clients cost
+    no threads. /api/stream is served on the loop as well, for the same
+    reason.
+    """
+
+    def __init__(self, web, db_threads: int = 8):
+        self.web = web
+        self.pool = ThreadPoolExecutor(max_workers=db_threads, thread_name_prefix='web-db')
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # Replaced by a fresh event after every wakeup of the SSE streams
+        self.feed_event: Optional[asyncio.Event] = None
+        self.logger = logging.getLogger(__name__)
+        self.sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+        self.sio.on('connect', self.on_connect)
+        self.sio.on('resync', self.on_resync)
+        self.sio.on('disconnect', self.on_disconnect)
+        self.app = socketio.ASGIApp(self.sio, other_asgi_app=self.handle_http, on_startup=self.on_startup)
+        # Broadcasts of the update loop and the event bus go through this server
+        web.emit = self.emit
+
+    async def on_startup(self):
+        self.loop = asyncio.get_running_loop()
+        self.feed_event = asyncio.Event()
+        self.web.feed.listeners.append(lambda: self.loop.call_soon_threadsafe(self.wake_streams))
+
+    def wake_streams(self):
+        event, self.feed_event = self.feed_event, asyncio.Event()
+        event.set()
+
+    def emit(self, event: str, data=None):
+        """Broadcast from any thread; the fan-out runs on the event loop"""
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.sio.emit(event, data), self.loop)
+
+    async def on_connect(self, sid, environ):
+        self.logger.info('WebSocket client connected')
+        await self.sio.emit('connected', {'message': 'Connected to sensor data stream'}, to=sid)
+
+    async def on_resync(self, sid, data):
+        since = (data or {}).get('since')
+        snapshot = await self.loop.run_in_executor(self.pool, self.web.get_stream_snapshot, since)
+        await self.sio.emit('data_snapshot', snapshot, to=sid)
+
+    async def on_disconnect(self, sid, *args):
+        self.logger.info('WebSocket client disconnected')
+
+    async def handle_http(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        if scope['path'] == '/api/stream':
+            await self.handle_stream(scope, receive, send)
+            return
+        await asyncio.get_running_loop().run_in_executor(
+            self.pool, self.call_wsgi, scope, bytes(body), send, asyncio.get_running_loop())
+
+    async def handle_stream(self, scope, receive, send):
+        """Server-Sent Events without a pool thread per client"""
+        args = dict(parse_qsl(scope['query_string'].decode('latin-1')))
+        headers = dict(scope['headers'])
+        try:
+            stream_filter = StreamFilter.from_args(args)
+            last_id = parse_last_event_id(headers.get(b'last-event-id', b'').decode('latin-1')
+                                          or args.get('last_event_id'))
+        except ValueError as e:
+            await send({'type': 'http.response.start', 'status': 400,
+                        'headers': [(b'content-type', b'application/json')]})
+            await send({'type': 'http.response.body',
+                        'body': json.dumps({'status': 'error', 'message': str(e)}).encode('utf-8')})
+            return
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        feed = self.web.feed
+        head, cursor = open_stream(feed, last_id, 3000)
+        await send({'type': 'http.response.body', 'body': head, 'more_body': True})
+
+        # The server does not fail sends to a closed connection, so watch for it
+        disconnected = asyncio.ensure_future(receive())
+        heartbeat = self.web.config.WEB.STREAM_HEARTBEAT
+        written = self.loop.time()
+        try:
+            while not disconnected.done():
+                woken = asyncio.ensure_future(self.feed_event.wait())
+                readings = feed.after(cursor)
+                if readings:
+                    woken.cancel()
+                    cursor = readings[-1]['id']
+                    events = stream_filter.render(readings)
+                    if events:
+                        await send({'type': 'http.response.body', 'body': events, 'more_body': True})
+                        written = self.loop.time()
+                        continue
+                else:
+                    await asyncio.wait({woken, disconnected}, timeout=max(0.0, written + heartbeat - self.loop.time()),
+                                       return_when=asyncio.FIRST_COMPLETED)
+                    woken.cancel()
+                # Readings of other devices are not traffic for a filtered client
+                if self.loop.time() - written >= heartbeat:
+                    await send({'type': 'http.response.body', 'body': HEARTBEAT, 'more_body': True})
+                    written = self.loop.time()
+        finally:
+            disconnected.cancel()
+
+    def call_wsgi(self, scope, body: bytes, send, loop: asyncio.AbstractEventLoop):
+        """Run the Flask app in a pool thread and forward its output.
+
+        The whole response is produced in this thread because streamed
+        bodies hold SQLite cursors, which cannot move between threads.
+        Waiting for each send also keeps a slow client from buffering an
+        entire export in memory.
+        """
+        def forward(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response: Dict = {}
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+            response['start'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            }
+
+        chunks = self.web.app.wsgi_app(self.environ(scope, body), start_response)
+        try:
+            started = False
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                if not started:
+                    forward(response['start'])
+                    started = True
+                forward({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not started:
+                forward(response['start'])
+            forward({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    @staticmethod
+    def environ(scope, body: bytes) -> Dict:
+        """WSGI environ of an ASGI HTTP request"""
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+            'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope['headers']:
+            name, value = name.decode('latin-1'), value.decode('latin-1')
+            if name == 'content-type':
+                key = 'CONTENT_TYPE'
+            elif name == 'content-length':
+                key = 'CONTENT_LENGTH'
+            else:
+                key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def run(self, host: str, port: int):
+        import uvicorn  # optional, only needed for web.mode = "asgi"
+        uvicorn.run(self.app, host=host, port=port, log_level='warning')
\ No newline at end of file
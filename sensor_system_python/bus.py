@@ -0,0 +1,30 @@
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+
+class EventBus:
+    """In-process publish/subscribe used when components share one process.
+
+    Handlers run synchronously on the publisher's thread, so they must be
+    quick; a failing handler is logged and does not affect the others.
+    """
+
+    def __init__(self):
+        self.handlers: Dict[str, List[Callable]] = defaultdict(list)
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def subscribe(self, topic: str, handler: Callable):
+        with self.lock:
+            self.handlers[topic].append(handler)
+
+    def publish(self, topic: str, payload):
+        with self.lock:
+            handlers = list(self.handlers.get(topic, ()))
+        for handler in handlers:
+            try:
+                handler(payload)
+            except Exception as e:
+                self.logger.error(f"Handler for {topic} failed: {e}")
\ No newline at end of file
@@ -0,0 +1,93 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, List
+
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    etag: str
+    generation: int
+    expires_at: float
+
+
+class ResponseCache:
+    """TTL cache of rendered responses, invalidated by an ingest generation.
+
+    An entry is reused while it is younger than its TTL and was built for
+    the current generation. Concurrent misses on the same key wait for a
+    single computation instead of each querying the database.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[Hashable, CacheEntry]' = OrderedDict()
+        self.key_locks = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key: Hashable, generation: int):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry.generation == generation and entry.expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            return None
+
+    def get_or_compute(self, key: Hashable, ttl: float, generation: int,
+                       compute: Callable[[], bytes]) -> CacheEntry:
+        """Return a fresh cached entry or build it with `compute` exactly once"""
+        entry = self._lookup(key, generation)
+        if entry:
+            return entry
+
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another request may have filled the entry while we waited
+            entry = self._lookup(key, generation)
+            if entry:
+                return entry
+
+            body = compute()
+            entry = CacheEntry(
+                body=body,
+                etag=hashlib.blake2b(body, digest_size=8).hexdigest(),
+                generation=generation,
+                expires_at=time.monotonic() + ttl
+            )
+
+            with self.lock:
+                self.misses += 1
+                self.entries[key] = entry
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    evicted, _ = self.entries.popitem(last=False)
+                    self.key_locks.pop(evicted, None)
+            return entry
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class LatestReadings:
+    """Most recent reading per device, kept in memory"""
+
+    def __init__(self):
+        self.readings: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+    def update(self, reading: Dict):
+        with self.lock:
+            self.readings[reading['device_id']] = reading
+
+    def snapshot(self) -> List[Dict]:
+        with self.lock:
+            return sorted(self.readings.values(), key=lambda reading: reading['device_id'])
\ No newline at end of file
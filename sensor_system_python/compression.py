@@ -0,0 +1,181 @@
+import struct
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+METRICS = ('temperature', 'humidity', 'light_level', 'voltage')
+
+# Block: version and point count, then one bit stream holding the
+# timestamps followed by every metric column in METRICS order.
+VERSION = 1
+HEADER = struct.Struct('<BI')
+
+# Delta-of-delta buckets: (prefix, prefix bits, value bits)
+_DOD_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+
+_MASK64 = (1 << 64) - 1
+
+
+class BitWriter:
+    """Append-only bit stream, most significant bit first"""
+
+    def __init__(self):
+        self.out = bytearray()
+        self.acc = 0
+        self.bits = 0
+
+    def write(self, value: int, bits: int):
+        self.acc = (self.acc << bits) | (value & ((1 << bits) - 1))
+        self.bits += bits
+        while self.bits >= 8:
+            self.bits -= 8
+            self.out.append((self.acc >> self.bits) & 0xFF)
+        self.acc &= (1 << self.bits) - 1
+
+    def getvalue(self) -> bytes:
+        if self.bits:
+            return bytes(self.out) + bytes(((self.acc << (8 - self.bits)) & 0xFF,))
+        return bytes(self.out)
+
+
+class BitReader:
+    def __init__(self, data: bytes, offset: int = 0):
+        self.data = data
+        self.pos = offset
+        self.acc = 0
+        self.bits = 0
+
+    def read(self, bits: int) -> int:
+        while self.bits < bits:
+            if self.pos >= len(self.data):
+                raise ValueError("Truncated block")
+            self.acc = (self.acc << 8) | self.data[self.pos]
+            self.pos += 1
+            self.bits += 8
+        self.bits -= bits
+        value = self.acc >> self.bits
+        self.acc &= (1 << self.bits) - 1
+        return value
+
+
+def _signed(value: int, bits: int) -> int:
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+
+def _write_timestamps(writer: BitWriter, timestamps: Sequence[int]):
+    writer.write(timestamps[0], 64)
+    previous, delta = timestamps[0], 0
+    for ts in timestamps[1:]:
+        dod = (ts - previous) - delta
+        delta, previous = ts - previous, ts
+        if dod == 0:
+            writer.write(0, 1)
+            continue
+        for prefix, prefix_bits, bits in _DOD_BUCKETS:
+            if -(1 << (bits - 1)) <= dod < 1 << (bits - 1):
+                writer.write(prefix, prefix_bits)
+                writer.write(dod, bits)
+                break
+        else:
+            writer.write(0b1111, 4)
+            writer.write(dod, 64)
+
+
+def _read_timestamps(reader: BitReader, count: int) -> np.ndarray:
+    timestamps = np.empty(count, dtype=np.int64)
+    previous = _signed(reader.read(64), 64)
+    timestamps[0] = previous
+    delta = 0
+    for i in range(1, count):
+        if reader.read(1) == 0:
+            dod = 0
+        elif reader.read(1) == 0:
+            dod = _signed(reader.read(7), 7)
+        elif reader.read(1) == 0:
+            dod = _signed(reader.read(9), 9)
+        elif reader.read(1) == 0:
+            dod = _signed(reader.read(12), 12)
+        else:
+            dod = _signed(reader.read(64), 64)
+        # The encoder stores deltas modulo 2 ** 64, so wrap the same way
+        delta = _signed((delta + dod) & _MASK64, 64)
+        previous = _signed((previous + delta) & _MASK64, 64)
+        timestamps[i] = previous
+    return timestamps
+
+
+def _write_floats(writer: BitWriter, values: np.ndarray):
+    """XOR each value with the previous one and store only the changed bits"""
+    words = values.astype('<f8').view('<u8').tolist()
+    writer.write(words[0], 64)
+    previous, leading, trailing = words[0], 65, 0
+    for word in words[1:]:
+        xor = word ^ previous
+        previous = word
+        if xor == 0:
+            writer.write(0, 1)
+            continue
+
+        new_leading = min(64 - xor.bit_length(), 31)
+        new_trailing = (xor & -xor).bit_length() - 1
+        if new_leading >= leading and new_trailing >= trailing:
+            # Changed bits fit the window of the previous value
+            writer.write(0b10, 2)
+            writer.write(xor >> trailing, 64 - leading - trailing)
+        else:
+            leading, trailing = new_leading, new_trailing
+            significant = 64 - leading - trailing
+            writer.write(0b11, 2)
+            writer.write(leading, 5)
+            writer.write(significant & 63, 6)  # 64 is stored as 0
+            writer.write(xor >> trailing, significant)
+
+
+def _read_floats(reader: BitReader, count: int) -> np.ndarray:
+    words = np.empty(count, dtype='<u8')
+    previous = reader.read(64)
+    words[0] = previous
+    leading = trailing = 0
+    for i in range(1, count):
+        if reader.read(1):
+            if reader.read(1):
+                leading = reader.read(5)
+                trailing = 64 - leading - (reader.read(6) or 64)
+            previous ^= reader.read(64 - leading - trailing) << trailing
+        words[i] = previous
+    return words.view('<f8')
+
+
+def encode_block(timestamps: Sequence[int], columns: Dict[str, Sequence[Optional[float]]]) -> bytes:
+    """Compress one device's readings, sorted by timestamp.
+
+    Timestamps are stored as delta-of-delta, metric columns as XOR of
+    consecutive float64 values; missing values (None) become NaN.
+    """
+    if len(timestamps) == 0:
+        raise ValueError("Empty block")
+
+    writer = BitWriter()
+    _write_timestamps(writer, [int(ts) for ts in timestamps])
+    for metric in METRICS:
+        values = np.array(columns[metric], dtype=float)
+        if len(values) != len(timestamps):
+            raise ValueError(f"Column {metric} has {len(values)} values for {len(timestamps)} timestamps")
+        _write_floats(writer, values)
+    return HEADER.pack(VERSION, len(timestamps)) + writer.getvalue()
+
+
+def decode_block(data: bytes) -> Dict[str, np.ndarray]:
+    """Arrays of a block: 'ts' as int64 epoch milliseconds, metrics as float64"""
+    try:
+        version, count = HEADER.unpack_from(data)
+    except struct.error:
+        raise ValueError("Truncated block")
+    if version != VERSION:
+        raise ValueError(f"Unsupported block version {version}")
+
+    reader = BitReader(data, HEADER.size)
+    block = {'ts': _read_timestamps(reader, count)}
+    for metric in METRICS:
+        block[metric] = _read_floats(reader, count)
+    return block
\ No newline at end of file
@@ -1,23 +1,111 @@
 import os
+import json
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields, replace
 
 @dataclass
 class ServerConfig:
     HOST: str = 'localhost'
     PORT: int = 8080
     BUFFER_SIZE: int = 1024
-    MAX_CONNECTIONS: int = 5
+    MAX_CONNECTIONS: int = 5  # listen() backlog
+    WORKERS: int = 32         # threads handling client connections
+    DEDUPE_WINDOW: int = 1024 # recent sequence numbers remembered per device
+    UDP_PORT: int = 0         # datagram listener, 0 disables it
+    UDP_BATCH: int = 64       # datagrams drained per wakeup
+    UDP_RECV_BUFFER: int = 1048576  # SO_RCVBUF, absorbs bursts between drains
 
 @dataclass
 class DatabaseConfig:
     DB_PATH: str = 'data/sensor_data.db'
     BACKUP_DIR: str = 'data/backups'
+    WRITE_BATCH_SIZE: int = 256   # readings per group commit (embedded mode)
+    FLUSH_INTERVAL: float = 0.0   # seconds the writer waits to fill a batch
+    WRITE_TIMEOUT: float = 5.0
+    SHARDS: int = 1                   # reading files split by a hash of device_id
+    ARCHIVE_AFTER_HOURS: float = 0.0  # compress older readings, 0 keeps all rows
+    ARCHIVE_CHUNK_SECONDS: int = 3600  # readings per compressed block
+    ARCHIVE_INTERVAL: float = 300.0   # seconds between archiving passes
+    # Applied to every connection opened by DatabaseManager and the web tier
+    PRAGMAS: dict = field(default_factory=lambda: {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+    })
 
 @dataclass
 class EmulatorConfig:
     SEND_INTERVAL: int = 10  # seconds
     NUM_DEVICES: int = 3     # number of emulated devices
+    SEND_RETRIES: int = 2    # resends of the same reading after a failure
+    TRANSPORT: str = 'tcp'   # 'tcp', or 'udp' to send one datagram per cycle
+    SEED: int = 0            # signal generator seed; 0 picks one and logs it
+    DAY_LENGTH: float = 86400.0  # seconds of one simulated day (diurnal cycle period)
+    BATTERY_DAYS: float = 30.0   # simulated days from a full battery to cut-off
+    FAULT_RATE: float = 0.0  # chance per device and cycle that a sensor fault starts
+
+@dataclass
+class WebConfig:
+    HOST: str = 'localhost'
+    PORT: int = 5000
+    UPDATE_INTERVAL: float = 5.0  # seconds between realtime pushes
+    STATUS_INTERVAL: float = 2.0  # desktop manager status polling
+    STREAM_RESYNC_ROWS: int = 500  # rows sent to a client that lost the delta stream
+    STREAM_BUFFER: int = 1000     # readings kept for /api/stream Last-Event-ID resume
+    STREAM_HEARTBEAT: float = 15.0  # seconds between keep-alive comments on idle streams
+    DEFAULT_PAGE_SIZE: int = 50
+    MAX_PAGE_SIZE: int = 500
+    CACHE_MAX_ENTRIES: int = 256
+    CACHE_TTL_STATISTICS: float = 5.0  # seconds
+    CACHE_TTL_DEVICES: float = 5.0
+    CACHE_TTL_RECENT: float = 2.0
+    CACHE_TTL_CHART: float = 5.0
+    CHART_MAX_WIDTH: int = 2000   # points per series in /api/chart
+    USE_REPLICA: bool = False     # read from replication.replica_path
+    MODE: str = 'wsgi'            # 'asgi' serves through uvicorn with an event loop
+    DB_THREADS: int = 8           # threads running requests in asgi mode
+
+@dataclass
+class ReplicationConfig:
+    CHANGELOG_DIR: str = ''       # leader appends committed writes here, '' disables
+    SEGMENT_BYTES: int = 16777216 # change log file size before starting a new one
+    KEEP_SEGMENTS: int = 8        # older change log files are deleted
+    REPLICA_PATH: str = ''        # follower's copy of the database
+    POLL_INTERVAL: float = 1.0    # seconds between follower reads of the log
+
+@dataclass
+class AnalyticsConfig:
+    WINDOW_HOURS: int = 24        # default analysis window
+    ROLLING_WINDOW: int = 5       # samples in rolling mean
+    ZSCORE_THRESHOLD: float = 3.0
+    MAX_ANOMALIES: int = 100
+    # Rollup bucket sizes in seconds used for chart level of detail
+    ROLLUP_RESOLUTIONS: list = field(default_factory=lambda: [60, 3600])
+
+@dataclass
+class AlertConfig:
+    # Threshold rules evaluated on every incoming reading (see alerts.AlertRule)
+    RULES: list = field(default_factory=lambda: [
+        {'name': 'high_temperature', 'metric': 'temperature', 'op': '>',
+         'threshold': 28.0, 'hysteresis': 0.5},
+        {'name': 'low_voltage', 'metric': 'voltage', 'op': '<',
+         'threshold': 3.3, 'hysteresis': 0.05, 'severity': 'critical'},
+    ])
+
+@dataclass
+class WatchdogConfig:
+    GRACE_FACTOR: float = 3.0     # missed intervals before a device is stale
+    LOW_VOLTAGE: float = 3.3      # volts
+    WHEEL_SLOTS: int = 512
+    TICK_SECONDS: float = 1.0
+
+@dataclass
+class ProfilingConfig:
+    ENABLED: bool = False         # allow runtime profiling commands and /api/debug routes
+    SAMPLE_INTERVAL: float = 0.005  # seconds between stack samples
+    SLOW_QUERY_MS: float = 0.0    # log SQLite statements slower than this, 0 disables
+    SLOW_QUERY_KEEP: int = 200    # slow statements kept in memory
+    SLOW_QUERY_LOG: str = ''      # also append them to this JSON lines file
 
 @dataclass
 class LogConfig:
@@ -25,17 +113,202 @@ class LogConfig:
     LOG_FILE: str = 'sensor_system.log'
     LOG_LEVEL: str = 'INFO'
 
+class ConfigError(ValueError):
+    """Invalid configuration file or environment override"""
+
+# Sections as named in the TOML file and in SENSOR_<SECTION>_<KEY> variables
+SECTIONS = {
+    'server': 'SERVER',
+    'database': 'DATABASE',
+    'emulator': 'EMULATOR',
+    'web': 'WEB',
+    'replication': 'REPLICATION',
+    'analytics': 'ANALYTICS',
+    'alerts': 'ALERTS',
+    'watchdog': 'WATCHDOG',
+    'profiling': 'PROFILING',
+    'logging': 'LOGGING',
+}
+
+ENV_PREFIX = 'SENSOR_'
+DEFAULT_CONFIG_FILE = 'sensor_system.toml'
+
+def _coerce(value, kind, name):
+    """Convert a TOML or environment value to the type of a config field"""
+    try:
+        if kind is bool:
+            if isinstance(value, str):
+                if value.lower() in ('1', 'true', 'yes', 'on'):
+                    return True
+                if value.lower() in ('0', 'false', 'no', 'off'):
+                    return False
+                raise ValueError(value)
+            return bool(value)
+        if kind in (list, dict):
+            if isinstance(value, str):
+                value = json.loads(value)
+            if not isinstance(value, kind):
+                raise ValueError(value)
+            return value
+        if kind is int and isinstance(value, float):
+            raise ValueError(value)
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ConfigError(f"{name}: expected {kind.__name__}, got {value!r}")
+
+def _validate(sections):
+    """Reject values that would break or stall a deployment"""
+    for attr, section in sections.items():
+        for item in fields(section):
+            value = getattr(section, item.name)
+            name = f"{attr.lower()}.{item.name.lower()}"
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and value < 0:
+                raise ConfigError(f"{name} must not be negative")
+            if item.name == 'PORT' and not 0 < value < 65536:
+                raise ConfigError(f"{name} must be a TCP port")
+            if item.name == 'UDP_PORT' and not value < 65536:
+                raise ConfigError(f"{name} must be a UDP port")
+
+    if sections['SERVER'].WORKERS < 1:
+        raise ConfigError("server.workers must be at least 1")
+    if sections['SERVER'].DEDUPE_WINDOW < 1:
+        raise ConfigError("server.dedupe_window must be at least 1")
+    if sections['SERVER'].UDP_BATCH < 1:
+        raise ConfigError("server.udp_batch must be at least 1")
+    if sections['EMULATOR'].TRANSPORT not in ('tcp', 'udp'):
+        raise ConfigError(f"emulator.transport: expected 'tcp' or 'udp', got {sections['EMULATOR'].TRANSPORT!r}")
+    if sections['EMULATOR'].TRANSPORT == 'udp' and not sections['SERVER'].UDP_PORT:
+        raise ConfigError("emulator.transport 'udp' requires server.udp_port")
+    if sections['EMULATOR'].DAY_LENGTH <= 0:
+        raise ConfigError("emulator.day_length must be positive")
+    if sections['EMULATOR'].BATTERY_DAYS <= 0:
+        raise ConfigError("emulator.battery_days must be positive")
+    if sections['EMULATOR'].FAULT_RATE > 1:
+        raise ConfigError("emulator.fault_rate must be between 0 and 1")
+    if sections['DATABASE'].WRITE_BATCH_SIZE < 1:
+        raise ConfigError("database.write_batch_size must be at least 1")
+    if not 1 <= sections['DATABASE'].SHARDS <= 10:
+        raise ConfigError("database.shards must be between 1 and 10")
+    if sections['DATABASE'].ARCHIVE_CHUNK_SECONDS < 1:
+        raise ConfigError("database.archive_chunk_seconds must be at least 1")
+    if 0 < sections['DATABASE'].ARCHIVE_AFTER_HOURS < sections['ANALYTICS'].WINDOW_HOURS:
+        raise ConfigError("database.archive_after_hours is shorter than analytics.window_hours")
+    if sections['REPLICATION'].CHANGELOG_DIR and sections['DATABASE'].SHARDS > 1:
+        raise ConfigError("replication.changelog_dir requires database.shards = 1")
+    if sections['REPLICATION'].SEGMENT_BYTES < 1:
+        raise ConfigError("replication.segment_bytes must be at least 1")
+    if sections['REPLICATION'].KEEP_SEGMENTS < 1:
+        raise ConfigError("replication.keep_segments must be at least 1")
+    if sections['WEB'].USE_REPLICA and not sections['REPLICATION'].REPLICA_PATH:
+        raise ConfigError("web.use_replica requires replication.replica_path")
+    if sections['WEB'].MODE not in ('wsgi', 'asgi'):
+        raise ConfigError(f"web.mode: expected 'wsgi' or 'asgi', got {sections['WEB'].MODE!r}")
+    if sections['WEB'].STREAM_BUFFER < 1:
+        raise ConfigError("web.stream_buffer must be at least 1")
+    if sections['WEB'].STREAM_HEARTBEAT <= 0:
+        raise ConfigError("web.stream_heartbeat must be positive")
+    if sections['WEB'].DB_THREADS < 1:
+        raise ConfigError("web.db_threads must be at least 1")
+    if sections['WEB'].DEFAULT_PAGE_SIZE > sections['WEB'].MAX_PAGE_SIZE:
+        raise ConfigError("web.default_page_size exceeds web.max_page_size")
+    if sections['PROFILING'].SAMPLE_INTERVAL <= 0:
+        raise ConfigError("profiling.sample_interval must be positive")
+    if sections['PROFILING'].SLOW_QUERY_KEEP < 1:
+        raise ConfigError("profiling.slow_query_keep must be at least 1")
+    if not isinstance(logging.getLevelName(sections['LOGGING'].LOG_LEVEL), int):
+        raise ConfigError(f"logging.log_level: unknown level {sections['LOGGING'].LOG_LEVEL!r}")
+
 class Config:
     SERVER = ServerConfig()
     DATABASE = DatabaseConfig()
     EMULATOR = EmulatorConfig()
+    WEB = WebConfig()
+    REPLICATION = ReplicationConfig()
+    ANALYTICS = AnalyticsConfig()
+    ALERTS = AlertConfig()
+    WATCHDOG = WatchdogConfig()
+    PROFILING = ProfilingConfig()
     LOGGING = LogConfig()
     
+    @classmethod
+    def load(cls, path=None, environ=None):
+        """Apply a TOML file and SENSOR_<SECTION>_<KEY> environment overrides.
+
+        The file is `path`, else $SENSOR_CONFIG, else sensor_system.toml
+        when it exists. Environment variables win over the file; those
+        that name no section are left alone. Values are validated before anything is changed, and the result is
+        stored on the class so every Config() sees the same settings.
+        """
+        environ = os.environ if environ is None else environ
+        path = path or environ.get(f'{ENV_PREFIX}CONFIG')
+        if path is None and os.path.exists(DEFAULT_CONFIG_FILE):
+            path = DEFAULT_CONFIG_FILE
+
+        overrides = {}
+        if path:
+            overrides = cls._read_file(path)
+
+        for key, value in environ.items():
+            if not key.startswith(ENV_PREFIX) or key == f'{ENV_PREFIX}CONFIG':
+                continue
+            for section in SECTIONS:
+                prefix = f'{ENV_PREFIX}{section.upper()}_'
+                if key.startswith(prefix):
+                    overrides.setdefault(section, {})[key[len(prefix):].lower()] = value
+                    break
+            else:
+                # Other software uses the prefix too (SENSOR_HOME, ...)
+                logging.getLogger(__name__).warning(f"{key}: no configuration section, ignored")
+
+        sections = {}
+        for section, attr in SECTIONS.items():
+            current = getattr(cls, attr)
+            values = overrides.pop(section, {})
+            if not isinstance(values, dict):
+                raise ConfigError(f"[{section}] must be a table")
+
+            types = {item.name: item.type for item in fields(current)}
+            changes = {}
+            for key, value in values.items():
+                name = key.upper()
+                if name not in types:
+                    raise ConfigError(f"{section}.{key}: unknown setting")
+                kind = types[name] if isinstance(types[name], type) else type(getattr(current, name))
+                changes[name] = _coerce(value, kind, f"{section}.{key}")
+            sections[attr] = replace(current, **changes)
+
+        if overrides:
+            raise ConfigError(f"Unknown configuration sections: {', '.join(sorted(overrides))}")
+
+        _validate(sections)
+        for attr, section in sections.items():
+            setattr(cls, attr, section)
+        return cls()
+
+    @staticmethod
+    def _read_file(path):
+        """Parse a TOML configuration file"""
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+
+        try:
+            with open(path, 'rb') as config_file:
+                return tomllib.load(config_file)
+        except (OSError, tomllib.TOMLDecodeError) as e:
+            raise ConfigError(f"Cannot read configuration {path}: {e}")
+    
     @staticmethod
     def initialize_directories():
         """Create necessary directories"""
-        os.makedirs('data/backups', exist_ok=True)
-        os.makedirs('logs', exist_ok=True)
+        os.makedirs(os.path.dirname(Config.DATABASE.DB_PATH) or '.', exist_ok=True)
+        os.makedirs(Config.DATABASE.BACKUP_DIR, exist_ok=True)
+        if Config.REPLICATION.CHANGELOG_DIR:
+            os.makedirs(Config.REPLICATION.CHANGELOG_DIR, exist_ok=True)
+        if Config.REPLICATION.REPLICA_PATH:
+            os.makedirs(os.path.dirname(Config.REPLICATION.REPLICA_PATH) or '.', exist_ok=True)
+        os.makedirs(Config.LOGGING.LOG_DIR, exist_ok=True)
     
     @staticmethod
     def setup_logging():
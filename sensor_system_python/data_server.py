@@ -1,28 +1,81 @@
+import time
+IMPORT_STARTED = time.perf_counter()
+
+import os
 import socket
 import json
 import logging
+import argparse
+import selectors
 import threading
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
-from database import DatabaseManager
+from sharding import open_database
+from database import check_reading
+from alerts import AlertEngine
+from dedupe import SequenceTracker
+from datagram import decode_datagram
+from serialization import dumps, CachedClock
+from profiling import SamplingProfiler, slow_queries
+
+IMPORTS_DONE = time.perf_counter()
+
+# Requests answered by the server itself instead of being stored
+CONTROL_COMMANDS = ('stats', 'profile', 'slow_queries')
 
 class SensorDataServer:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, db_manager=None, bus=None):
         self.config = config
-        self.db_manager = DatabaseManager(config.DATABASE.DB_PATH)
-        self.setup_logging()
+        # In embedded mode a shared DatabaseWriter and EventBus are passed in
+        self.db_manager = db_manager or open_database(config)
+        self.bus = bus
+        # A writer thread publishes readings as it commits them, so the web
+        # tier sees them in id order; ingest threads would race each other
+        self.publish_on_commit = bool(bus) and hasattr(self.db_manager, 'listeners')
+        if self.publish_on_commit:
+            self.db_manager.listeners.append(self.publish_readings)
+        self.alert_engine = AlertEngine.from_config(config.ALERTS.RULES)
+        self.sequences = SequenceTracker(config.SERVER.DEDUPE_WINDOW)
         self.logger = logging.getLogger(__name__)
         self.is_running = False
         self.server_socket = None
-        
-    def setup_logging(self):
-        """Setup logging system"""
-        # Use basic console logging to avoid encoding issues
-        logging.basicConfig(
-            level=getattr(logging, self.config.LOGGING.LOG_LEVEL),
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[logging.StreamHandler()]
-        )
+        self.udp_socket = None
+        self.executor = None
+        # Ingest counters; 'lost' comes from gaps in per-device sequence numbers
+        self.counters = dict.fromkeys(
+            ('udp_datagrams', 'udp_readings', 'udp_malformed', 'duplicates', 'lost'), 0)
+        self.counters_lock = threading.Lock()
+        self.clock = CachedClock()
+        self.response_prefixes = {}
+        # Phase name -> seconds, filled when started with --profile-startup
+        self.startup_timings = None
+        # Opt-in runtime profiling, driven by control commands
+        profiling = config.PROFILING
+        slow_queries.configure(profiling.SLOW_QUERY_MS, profiling.SLOW_QUERY_KEEP, profiling.SLOW_QUERY_LOG)
+        self.profiler = SamplingProfiler(profiling.SAMPLE_INTERVAL)
+        # With a change log, rollups and archiving run here against the
+        # leader, so their writes reach replicas through the log
+        self.changelog = getattr(self.db_manager, 'changelog', None)
+        self.rollups = self.archive = None
+        if self.changelog:
+            # Imported only when needed: archiving pulls in NumPy
+            from rollups import SensorRollups
+            from archive import ReadingArchive
+            db = config.DATABASE
+            self.rollups = SensorRollups(db.DB_PATH, config.ANALYTICS.ROLLUP_RESOLUTIONS,
+                                         raw_horizon=db.ARCHIVE_AFTER_HOURS * 3600 or None,
+                                         changelog=self.changelog)
+            if db.ARCHIVE_AFTER_HOURS:
+                self.archive = ReadingArchive(db.DB_PATH, db.ARCHIVE_AFTER_HOURS,
+                                              chunk_seconds=db.ARCHIVE_CHUNK_SECONDS,
+                                              interval=db.ARCHIVE_INTERVAL, pragmas=db.PRAGMAS,
+                                              changelog=self.changelog)
+    
+    def report_startup(self):
+        """Log how long each startup phase took"""
+        phases = ', '.join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.startup_timings.items())
+        total = sum(self.startup_timings.values()) * 1000
+        self.logger.info(f"Startup: {phases} (total {total:.1f} ms)")
     
     def parse_request(self, request_data: str) -> dict:
         """Parse incoming request"""
@@ -32,9 +85,15 @@ class SensorDataServer:
             # Try to parse as JSON
             data = json.loads(request_data)
             
-            # Validate required fields
-            if 'device_id' not in data:
-                self.logger.warning("Missing device_id in request")
+            # Control request, e.g. {"command": "stats"}
+            if isinstance(data, dict) and data.get('command') in CONTROL_COMMANDS:
+                return data
+            
+            # Same checks as UDP ingest, before anything is stored
+            try:
+                check_reading(data)
+            except ValueError as e:
+                self.logger.warning(f"{e} in request")
                 return None
             
             return data
@@ -46,18 +105,125 @@ class SensorDataServer:
             self.logger.error(f"Request processing error: {e}")
             return None
     
-    def create_response(self, status: str, message: str, data: dict = None) -> str:
+    def create_response(self, status: str, message: str, data: dict = None) -> bytes:
         """Create JSON response"""
-        response = {
-            "status": status,
-            "message": message,
-            "timestamp": datetime.now().isoformat()
-        }
+        # The status/message part is encoded once per distinct pair
+        prefix = self.response_prefixes.get((status, message))
+        if prefix is None:
+            prefix = dumps({"status": status, "message": message})[:-1] + b',"timestamp":"'
+            self.response_prefixes[(status, message)] = prefix
         
+        response = prefix + self.clock.isoformat().encode('ascii') + b'"'
         if data:
-            response.update(data)
+            return response + b',' + dumps(data)[1:]
+        return response + b'}'
+    
+    def count(self, **deltas):
+        """Add to the ingest counters"""
+        with self.counters_lock:
+            for name, delta in deltas.items():
+                self.counters[name] += delta
+    
+    def get_counters(self) -> dict:
+        """Snapshot of the ingest counters"""
+        with self.counters_lock:
+            return dict(self.counters)
+    
+    def handle_command(self, request: dict) -> bytes:
+        """Answer a control request"""
+        command = request['command']
+        if command == 'stats':
+            return self.create_response("success", "Ingest counters", self.get_counters())
+        if not self.config.PROFILING.ENABLED:
+            return self.create_response("error", "Profiling is disabled")
+        
+        if command == 'slow_queries':
+            # {"command": "slow_queries", "threshold_ms": 50} also changes the threshold
+            threshold = request.get('threshold_ms')
+            if threshold is not None:
+                if not isinstance(threshold, (int, float)) or isinstance(threshold, bool) or threshold < 0:
+                    return self.create_response("error", "Invalid threshold_ms")
+                slow_queries.threshold_ms = threshold
+            return self.create_response("success", "Slow queries", {
+                "threshold_ms": slow_queries.threshold_ms,
+                "queries": slow_queries.snapshot()
+            })
         
-        return json.dumps(response)
+        # {"command": "profile", "action": "start" | "stop" | "status"}
+        action = request.get('action', 'status')
+        result = {}
+        if action == 'start':
+            self.profiler.start()
+        elif action == 'stop':
+            self.profiler.stop()
+            # Folded stacks, e.g. for flamegraph.pl or speedscope
+            result['file'] = self.profiler.dump(os.path.join(
+                self.config.LOGGING.LOG_DIR, time.strftime('profile-server-%Y%m%d-%H%M%S.folded')))
+        elif action != 'status':
+            return self.create_response("error", f"Unknown profile action: {action}")
+        return self.create_response("success", "Profiler", {
+            "profiling": self.profiler.running,
+            "samples": self.profiler.samples,
+            **result
+        })
+    
+    def process_reading(self, sensor_data: dict) -> bool:
+        """Save a parsed reading, evaluate alerts and publish both"""
+        return self.process_readings([sensor_data])
+    
+    def process_readings(self, readings: list) -> bool:
+        """Save parsed readings in one write, evaluate alerts and publish both"""
+        fresh = []
+        for sensor_data in readings:
+            seq = sensor_data.get('seq')
+            if seq is not None and self.sequences.is_duplicate(sensor_data['device_id'], seq):
+                # Retry of a reading that is already stored: acknowledge only
+                sensor_data['duplicate'] = True
+            else:
+                fresh.append(sensor_data)
+        
+        duplicates = len(readings) - len(fresh)
+        lost = 0
+        if fresh:
+            saved = (self.db_manager.save_sensor_data(fresh[0]) if len(fresh) == 1
+                     else self.db_manager.save_sensor_data_batch(fresh))
+            if not saved:
+                self.logger.error(f"Error saving data from {', '.join(sorted({d['device_id'] for d in fresh}))}")
+                return False
+            # Readings refused by the database were rolled back on their own
+            fresh = [sensor_data for sensor_data in fresh if not sensor_data.get('rejected')]
+            if not fresh:
+                return False
+        
+        alert_events = []
+        for sensor_data in fresh:
+            gap = 0
+            if sensor_data.get('seq') is not None:
+                gap = self.sequences.mark(sensor_data['device_id'], sensor_data['seq'])
+            if sensor_data.get('duplicate'):
+                duplicates += 1
+                continue
+            lost += gap
+            
+            self.logger.info(f"Data from {sensor_data['device_id']} saved")
+            if self.bus and not self.publish_on_commit:
+                self.bus.publish('reading', sensor_data)
+            
+            # Evaluate alert rules in memory, write only when something fires
+            alert_events.extend(self.alert_engine.evaluate(sensor_data))
+        
+        if duplicates or lost:
+            self.count(duplicates=duplicates, lost=lost)
+        if alert_events:
+            self.db_manager.save_alerts(alert_events)
+            if self.bus:
+                for event in alert_events:
+                    self.bus.publish('alert', event)
+        return True
+    
+    def publish_readings(self, readings: list):
+        for sensor_data in readings:
+            self.bus.publish('reading', sensor_data)
     
     def handle_client(self, client_socket: socket.socket, address: tuple):
         """Handle client connection"""
@@ -77,29 +243,32 @@ class SensorDataServer:
             
             if not sensor_data:
                 response = self.create_response("error", "Invalid data format")
-                client_socket.send(response.encode('utf-8'))
+                client_socket.sendall(response)
+                return
+            
+            if sensor_data.get('command') in CONTROL_COMMANDS:
+                client_socket.sendall(self.handle_command(sensor_data))
                 return
             
             # Save to database
-            if self.db_manager.save_sensor_data(sensor_data):
+            if self.process_reading(sensor_data):
                 response = self.create_response(
                     "success", 
-                    "Data received and saved successfully",
+                    "Duplicate reading ignored" if sensor_data.get('duplicate')
+                    else "Data received and saved successfully",
                     {"device_id": sensor_data['device_id']}
                 )
-                self.logger.info(f"Data from {sensor_data['device_id']} saved")
             else:
                 response = self.create_response("error", "Error saving to database")
-                self.logger.error(f"Error saving data from {sensor_data['device_id']}")
             
             # Send response
-            client_socket.send(response.encode('utf-8'))
+            client_socket.sendall(response)
             
         except Exception as e:
             self.logger.error(f"Error handling client {client_ip}:{client_port}: {e}")
             try:
                 error_response = self.create_response("error", "Internal server error")
-                client_socket.send(error_response.encode('utf-8'))
+                client_socket.sendall(error_response)
             except:
                 pass
         finally:
@@ -112,10 +281,22 @@ class SensorDataServer:
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         
         try:
+            started = time.perf_counter()
             self.server_socket.bind((self.config.SERVER.HOST, self.config.SERVER.PORT))
             self.server_socket.listen(self.config.SERVER.MAX_CONNECTIONS)
+            if self.startup_timings is not None:
+                self.startup_timings['listen'] = time.perf_counter() - started
+                self.report_startup()
             
+            # Bounded pool: a burst of clients queues instead of spawning threads
+            self.executor = ThreadPoolExecutor(max_workers=self.config.SERVER.WORKERS,
+                                               thread_name_prefix='client')
             self.is_running = True
+            if self.config.SERVER.UDP_PORT:
+                self.udp_socket = self.open_udp_socket()
+                threading.Thread(target=self.serve_udp, name='udp-ingest', daemon=True).start()
+            if self.rollups:
+                threading.Thread(target=self.maintain, name='maintenance', daemon=True).start()
             self.logger.info(f"Data server started on {self.config.SERVER.HOST}:{self.config.SERVER.PORT}")
             self.logger.info("Waiting for connections...")
             
@@ -123,13 +304,7 @@ class SensorDataServer:
                 try:
                     client_socket, address = self.server_socket.accept()
                     
-                    # Handle each client in separate thread
-                    client_thread = threading.Thread(
-                        target=self.handle_client,
-                        args=(client_socket, address),
-                        daemon=True
-                    )
-                    client_thread.start()
+                    self.executor.submit(self.handle_client, client_socket, address)
                     
                 except socket.timeout:
                     continue
@@ -143,23 +318,107 @@ class SensorDataServer:
         except Exception as e:
             self.logger.error(f"Server error: {e}")
         finally:
+            self.is_running = False
             if self.server_socket:
                 self.server_socket.close()
+            if self.udp_socket:
+                self.udp_socket.close()
+            if self.executor:
+                self.executor.shutdown(wait=False)
             self.logger.info("Server shutdown complete")
     
+    def open_udp_socket(self) -> socket.socket:
+        """Bind the non-blocking datagram socket"""
+        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.config.SERVER.UDP_RECV_BUFFER)
+        udp_socket.bind((self.config.SERVER.HOST, self.config.SERVER.UDP_PORT))
+        udp_socket.setblocking(False)
+        self.logger.info(f"UDP ingest on {self.config.SERVER.HOST}:{self.config.SERVER.UDP_PORT}")
+        return udp_socket
+    
+    def serve_udp(self):
+        """Drain queued datagrams on each wakeup and store them as one batch.
+        
+        Datagrams are never acknowledged: senders retransmit nothing, and
+        losses show up as gaps in the per-device sequence numbers.
+        """
+        udp_socket = self.udp_socket
+        selector = selectors.DefaultSelector()
+        selector.register(udp_socket, selectors.EVENT_READ)
+        try:
+            while self.is_running:
+                if not selector.select(timeout=1.0):
+                    continue
+                
+                readings, datagrams, malformed = [], 0, 0
+                while datagrams < self.config.SERVER.UDP_BATCH:
+                    try:
+                        payload, address = udp_socket.recvfrom(65535)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    datagrams += 1
+                    try:
+                        readings.extend(decode_datagram(payload))
+                    except ValueError as e:
+                        malformed += 1
+                        self.logger.warning(f"Dropped datagram from {address[0]}:{address[1]}: {e}")
+                
+                self.count(udp_datagrams=datagrams, udp_readings=len(readings), udp_malformed=malformed)
+                if readings:
+                    # A batch that fails must not stop UDP ingest for good
+                    try:
+                        self.process_readings(readings)
+                    except Exception as e:
+                        self.logger.exception(f"Error processing {len(readings)} UDP readings: {e}")
+                    
+        except OSError as e:
+            if self.is_running:
+                self.logger.error(f"UDP ingest error: {e}")
+        finally:
+            selector.close()
+            self.logger.info(f"UDP ingest stopped, counters: {self.get_counters()}")
+    
+    def maintain(self):
+        """Keep the leader's rollups current and archive old readings"""
+        while self.is_running:
+            try:
+                self.rollups.refresh()
+                # Only readings already folded into the rollups are archived
+                if self.archive:
+                    self.archive.run_if_due()
+            except Exception as e:
+                self.logger.error(f"Maintenance error: {e}")
+            # Same pace as the web tier's own refresh without a change log
+            time.sleep(self.config.WEB.UPDATE_INTERVAL)
+    
     def stop_server(self):
         """Stop server"""
         self.is_running = False
         if self.server_socket:
             self.server_socket.close()
+        if self.udp_socket:
+            self.udp_socket.close()
 
 def main():
     """Main server startup function"""
-    config = Config()
+    parser = argparse.ArgumentParser(description='Sensor data TCP server')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='log import and initialization timings')
+    args = parser.parse_args()
+    
+    started = time.perf_counter()
+    config = Config.load()
     config.initialize_directories()
     config.setup_logging()
+    configured = time.perf_counter()
     
     server = SensorDataServer(config)
+    if args.profile_startup:
+        server.startup_timings = {
+            'imports': IMPORTS_DONE - IMPORT_STARTED,
+            'config': configured - started,
+            'init': time.perf_counter() - configured
+        }
     
     try:
         server.start_server()
@@ -1,18 +1,140 @@
+import time
+import queue
 import sqlite3
 import logging
+import threading
+from concurrent.futures import Future
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Any, Callable, List, Dict, Optional
+
+from profiling import connect
+
+# Bump whenever init_database changes the schema
+SCHEMA_VERSION = 9
+
+METRICS = ('temperature', 'humidity', 'light_level', 'voltage')
+
+# Running totals of archived readings per device (see archive.py)
+ARCHIVE_TOTALS = ('count', 'first_ts', 'last_ts') + tuple(
+    f'{metric}_{part}' for metric in METRICS for part in ('sum', 'count'))
+
+# Upsert clause that adds a pass's totals to the stored ones
+ARCHIVE_TOTALS_UPSERT = f'''
+    ON CONFLICT (device_key) DO UPDATE SET
+        count = count + excluded.count,
+        first_ts = min(first_ts, excluded.first_ts),
+        last_ts = max(last_ts, excluded.last_ts),
+        {', '.join(f'{column} = {column} + excluded.{column}' for column in ARCHIVE_TOTALS[3:])}
+'''
+
+# Per-device count, time span and metric averages over stored and
+# archived readings, in device_key order
+DEVICE_TOTALS = f'''
+    SELECT device_key, SUM(count) AS record_count, MIN(first_ts) AS first_ts, MAX(last_ts) AS last_ts,
+           {', '.join(f'SUM({m}_sum) / SUM({m}_count) AS avg_{m}' for m in METRICS)}
+    FROM (
+        SELECT device_key, COUNT(*) AS count, MIN(ts) AS first_ts, MAX(ts) AS last_ts,
+               {', '.join(f'TOTAL({m}) AS {m}_sum, COUNT({m}) AS {m}_count' for m in METRICS)}
+        FROM sensor_readings
+        GROUP BY device_key
+        UNION ALL
+        SELECT device_key, {', '.join(ARCHIVE_TOTALS)} FROM archive_totals
+    )
+    GROUP BY device_key
+'''
+
+# Sequence numbers are stored in a signed 64-bit INTEGER column
+MAX_SEQ = 2 ** 63 - 1
+
+# Ids of one millisecond with several shards. Ids follow the clock as long
+# as a shard takes fewer than its share of them per millisecond, and stay
+# below 2 ** 53 (exact in JavaScript) until the year 2109
+ID_SLOTS = 2048
+
+# Original sensor_data row shape over sensor_readings
+SENSOR_DATA_VIEW = '''
+    SELECT r.id, k.device_id, r.temperature, r.humidity, r.light_level, r.voltage,
+           datetime(r.ts / 1000, 'unixepoch') AS timestamp,
+           strftime('%Y-%m-%dT%H:%M:%f', r.ts / 1000.0, 'unixepoch', 'localtime') AS received_at,
+           r.seq, r.device_key, r.ts
+    FROM sensor_readings r JOIN device_keys k ON k.device_key = r.device_key
+'''
+
+def to_epoch_ms(moment: datetime) -> int:
+    """Storage form of a point in time"""
+    return int(moment.timestamp() * 1000)
+
+def from_epoch_ms(ts: Optional[int]) -> Optional[str]:
+    """Local ISO time of a stored epoch-millisecond value"""
+    return datetime.fromtimestamp(ts / 1000).isoformat(timespec='milliseconds') if ts is not None else None
+
+# Errors caused by the values of one reading rather than by the database;
+# such a reading is rolled back alone instead of failing its whole batch
+READING_ERRORS = (OverflowError, sqlite3.IntegrityError, sqlite3.InterfaceError,
+                  sqlite3.ProgrammingError, sqlite3.DataError)
+
+
+def check_reading(data) -> None:
+    """Raise ValueError unless data is a reading every ingest path can store"""
+    if not isinstance(data, dict) or 'device_id' not in data:
+        raise ValueError("Reading without device_id")
+    if not isinstance(data['device_id'], str):
+        raise ValueError("Invalid device_id")
+    # Optional per-device sequence number used to drop retries
+    seq = data.get('seq')
+    if seq is not None and (not isinstance(seq, int) or isinstance(seq, bool) or not 0 <= seq <= MAX_SEQ):
+        raise ValueError("Invalid seq")
+    # Alert rules and storage expect numbers (or null) for every metric
+    for metric in METRICS:
+        value = data.get(metric)
+        if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool)):
+            raise ValueError(f"Invalid {metric}")
+
+
+def ids_per_ms(shards: int) -> int:
+    """Id space of one millisecond, a multiple of shards so ids keep their shard number"""
+    return ID_SLOTS // shards * shards
+
+
+def apply_pragmas(conn: sqlite3.Connection, pragmas: Optional[Dict[str, Any]]):
+    """Apply configured PRAGMA settings to a fresh connection"""
+    for name, value in (pragmas or {}).items():
+        if not name.isidentifier():
+            raise ValueError(f"Invalid pragma name: {name}")
+        conn.execute(f'PRAGMA {name} = {value}')
 
 class DatabaseManager:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, pragmas: Optional[Dict[str, Any]] = None,
+                 shard: int = 0, shards: int = 1, catalog: Optional['DatabaseManager'] = None,
+                 changelog=None):
         self.db_path = db_path
+        self.pragmas = pragmas
+        # replication.ChangeLog receiving every committed write, if enabled
+        self.changelog = changelog
+        # Shards other than the first take device keys from the catalog
+        # (first shard), so a key means the same device in every file
+        self.catalog = catalog
         self.logger = logging.getLogger(__name__)
         self.init_database()
+        # device_id -> integer surrogate key stored in sensor_readings
+        self.device_keys: Dict[str, int] = self.load_device_keys()
+        # Next id from the high-water mark in id_state, never from MAX(id):
+        # ids of archived or deleted readings must not come back
+        if shards == 1:
+            self.next_id = 'last_id + 1'
+        else:
+            # Ids follow the ingest time and end in the shard number, so they
+            # are unique across shards and comparable between them
+            self.next_id = (f'MAX((last_id / {shards} + 1) * {shards} + {shard}, '
+                            f':ts * {ids_per_ms(shards)} + {shard})')
+        if changelog:
+            changelog.catch_up(self.get_connection)
     
     def get_connection(self) -> sqlite3.Connection:
         """Create database connection"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         conn.row_factory = sqlite3.Row
+        apply_pragmas(conn, self.pragmas)
         return conn
     
     def init_database(self):
@@ -21,19 +143,52 @@ class DatabaseManager:
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            # Sensor data table
+            # An up-to-date database needs no DDL, which keeps restarts fast
+            cursor.execute('PRAGMA user_version')
+            if cursor.fetchone()[0] == SCHEMA_VERSION:
+                return
+            
+            # Device ids are stored once; readings refer to them by key
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sensor_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    device_id TEXT NOT NULL,
+                CREATE TABLE IF NOT EXISTS device_keys (
+                    device_key INTEGER PRIMARY KEY,
+                    device_id TEXT NOT NULL UNIQUE
+                )
+            ''')
+            
+            # Readings clustered by device and time (v4). ts is the ingest
+            # time in epoch milliseconds; id numbers readings in ingest
+            # order for rollup watermarks, streams and the desktop grid.
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sensor_readings (
+                    device_key INTEGER NOT NULL,
+                    ts INTEGER NOT NULL,
+                    id INTEGER NOT NULL,
                     temperature REAL,
                     humidity REAL,
                     light_level INTEGER,
                     voltage REAL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    received_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    seq INTEGER,
+                    PRIMARY KEY (device_key, ts, id)
+                ) WITHOUT ROWID
+            ''')
+            self.migrate_sensor_data(cursor)
+            
+            # Highest reading id ever assigned (v7), moved forward in the
+            # transaction that inserts the reading
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS id_state (
+                    name TEXT PRIMARY KEY,
+                    last_id INTEGER NOT NULL
                 )
             ''')
+            cursor.execute('''
+                INSERT OR IGNORE INTO id_state (name, last_id)
+                SELECT 'sensor_readings', COALESCE(MAX(id), 0) FROM sensor_readings
+            ''')
+            
+            # Readers keep the original row shape through this view
+            cursor.execute(f'CREATE VIEW IF NOT EXISTS sensor_data AS {SENSOR_DATA_VIEW}')
             
             # Device statistics table
             cursor.execute('''
@@ -47,16 +202,116 @@ class DatabaseManager:
                 )
             ''')
             
+            # Alert events table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS alerts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    rule TEXT NOT NULL,
+                    device_id TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    value REAL,
+                    threshold REAL,
+                    severity TEXT,
+                    state TEXT NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Pre-aggregated buckets for chart queries (see rollups.py).
+            # Rollups keyed by device_id text (before v4) are rebuilt.
+            columns = [row[1] for row in cursor.execute('PRAGMA table_info(sensor_rollups)')]
+            if 'device_id' in columns:
+                cursor.execute('DROP TABLE sensor_rollups')
+                cursor.execute("DELETE FROM rollup_state WHERE name = 'sensor_rollups'")
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS sensor_rollups (
+                    resolution INTEGER NOT NULL,
+                    device_key INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    {', '.join(f'{m}_sum REAL, {m}_count INTEGER, {m}_min REAL, {m}_max REAL'
+                               for m in METRICS)},
+                    PRIMARY KEY (resolution, device_key, bucket)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS rollup_state (
+                    name TEXT PRIMARY KEY,
+                    last_id INTEGER NOT NULL
+                )
+            ''')
+            
+            # Compressed blocks of archived readings (see archive.py, v5);
+            # a rowid table because the blobs span several pages
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sensor_chunks (
+                    device_key INTEGER NOT NULL,
+                    chunk_start INTEGER NOT NULL,
+                    chunk_end INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (device_key, chunk_start)
+                )
+            ''')
+
+            # Totals of archived readings per device (v9), so statistics
+            # include them without decoding blocks
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS archive_totals (
+                    device_key INTEGER PRIMARY KEY,
+                    {', '.join(f'{column} {"REAL" if column.endswith("_sum") else "INTEGER"} NOT NULL'
+                               for column in ARCHIVE_TOTALS)}
+                )
+            ''')
+            self.backfill_archive_totals(cursor)
+
+            # Readings before cutoff with id up to watermark are archived (v8);
+            # a replica applying an entry twice skips them
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS archive_state (
+                    name TEXT PRIMARY KEY,
+                    cutoff INTEGER NOT NULL,
+                    watermark INTEGER NOT NULL
+                )
+            ''')
+
+            # Position of a replica in the leader's change log (see replication.py, v6)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS replication_state (
+                    name TEXT PRIMARY KEY,
+                    lsn INTEGER NOT NULL,
+                    leader_time REAL,
+                    caught_up_at REAL
+                )
+            ''')
+
             # Indexes for optimization
+            # The primary key serves per-device time ranges; these serve
+            # id watermarks and time ranges across all devices
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_readings_id 
+                ON sensor_readings(id)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_readings_ts 
+                ON sensor_readings(ts, id)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_devices_last_seen 
+                ON devices(last_seen, device_id)
+            ''')
+            # A retried reading hits this index instead of being stored twice;
+            # readings without seq are NULL and never conflict
             cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_sensor_device_id 
-                ON sensor_data(device_id)
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_readings_device_seq 
+                ON sensor_readings(device_key, seq)
             ''')
             cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_sensor_timestamp 
-                ON sensor_data(timestamp)
+                CREATE INDEX IF NOT EXISTS idx_rollups_bucket 
+                ON sensor_rollups(resolution, bucket)
             ''')
             
+            cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
             conn.commit()
             self.logger.info("Database initialized successfully")
             
@@ -66,51 +321,219 @@ class DatabaseManager:
         finally:
             conn.close()
     
+    def backfill_archive_totals(self, cursor: sqlite3.Cursor):
+        """Totals of blocks archived before v9"""
+        cursor.execute('SELECT 1 FROM archive_totals LIMIT 1')
+        if cursor.fetchone():
+            return
+        cursor.execute('SELECT device_key, data FROM sensor_chunks')
+        chunks = cursor.fetchall()
+        if not chunks:
+            return
+        # Imported only when needed: decoding pulls in NumPy
+        import numpy as np
+        from compression import decode_block
+
+        for device_key, data in chunks:
+            block = decode_block(data)
+            totals = [len(block['ts']), int(block['ts'].min()), int(block['ts'].max())]
+            for metric in METRICS:
+                values = block[metric][~np.isnan(block[metric])]
+                totals += [float(values.sum()), len(values)]
+            cursor.execute(f'''
+                INSERT INTO archive_totals (device_key, {', '.join(ARCHIVE_TOTALS)})
+                VALUES ({', '.join('?' * (len(ARCHIVE_TOTALS) + 1))})
+                {ARCHIVE_TOTALS_UPSERT}
+            ''', [device_key] + totals)
+    
+    def migrate_sensor_data(self, cursor: sqlite3.Cursor):
+        """Move rows of the pre-v4 sensor_data table into sensor_readings"""
+        cursor.execute("SELECT type FROM sqlite_master WHERE name = 'sensor_data'")
+        row = cursor.fetchone()
+        if not row or row[0] != 'table':
+            return
+        
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(sensor_data)')]
+        seq = 's.seq' if 'seq' in columns else 'NULL'
+        cursor.execute('''
+            INSERT OR IGNORE INTO device_keys (device_id)
+            SELECT DISTINCT device_id FROM sensor_data ORDER BY device_id
+        ''')
+        cursor.execute(f'''
+            INSERT INTO sensor_readings
+            (device_key, ts, id, temperature, humidity, light_level, voltage, seq)
+            SELECT k.device_key, CAST(strftime('%s', s.timestamp) AS INTEGER) * 1000, s.id,
+                   s.temperature, s.humidity, s.light_level, s.voltage, {seq}
+            FROM sensor_data s JOIN device_keys k ON k.device_id = s.device_id
+            ORDER BY s.id
+        ''')
+        migrated = cursor.rowcount
+        cursor.execute('DROP TABLE sensor_data')
+        self.logger.info(f"Migrated {migrated} readings to sensor_readings")
+    
+    def load_device_keys(self) -> Dict[str, int]:
+        """Read the device_id -> device_key map"""
+        conn = self.get_connection()
+        try:
+            return {row[0]: row[1] for row in conn.execute('SELECT device_id, device_key FROM device_keys')}
+        finally:
+            conn.close()
+    
+    def device_key(self, cursor: sqlite3.Cursor, device_id: str) -> int:
+        """Integer key of a device, registered on first use"""
+        key = self.device_keys.get(device_id)
+        if key is None:
+            if self.catalog:
+                key = self.catalog.register_device(device_id)
+                cursor.execute('INSERT OR IGNORE INTO device_keys (device_key, device_id) VALUES (?, ?)',
+                               (key, device_id))
+            else:
+                cursor.execute('INSERT OR IGNORE INTO device_keys (device_id) VALUES (?)', (device_id,))
+                cursor.execute('SELECT device_key FROM device_keys WHERE device_id = ?', (device_id,))
+                key = cursor.fetchone()[0]
+            self.device_keys[device_id] = key
+        return key
+    
+    def register_device(self, device_id: str) -> int:
+        """Key of a device, committed on its own (used by other shards)"""
+        key = self.device_keys.get(device_id)
+        if key is None:
+            conn = self.get_connection()
+            try:
+                key = self.device_key(conn.cursor(), device_id)
+                conn.commit()
+            except sqlite3.Error:
+                self.device_keys.pop(device_id, None)
+                raise
+            finally:
+                conn.close()
+        return key
+    
+    def commit(self, conn: sqlite3.Connection):
+        """Commit a write transaction and append its rows to the change log"""
+        if self.changelog is None:
+            conn.commit()
+        else:
+            self.changelog.commit(conn)
+    
+    def insert_reading(self, cursor: sqlite3.Cursor, data: Dict) -> Optional[int]:
+        """Insert one reading and update its device row, without committing.
+
+        Returns None and marks the reading as a duplicate when a reading
+        with the same device_id and seq is already stored.
+        """
+        ts = to_epoch_ms(datetime.now())
+        now = datetime.fromtimestamp(ts / 1000)
+        
+        # The next id is taken under the write lock; a duplicate leaves a gap
+        cursor.execute(f"UPDATE id_state SET last_id = {self.next_id} WHERE name = 'sensor_readings'", {'ts': ts})
+        row_id = cursor.execute("SELECT last_id FROM id_state WHERE name = 'sensor_readings'").fetchone()[0]
+        
+        # Save sensor data
+        cursor.execute('''
+            INSERT INTO sensor_readings 
+            (device_key, ts, id, temperature, humidity, light_level, voltage, seq)
+            VALUES (:device_key, :ts, :id, :temperature, :humidity, :light_level, :voltage, :seq)
+            ON CONFLICT (device_key, seq) DO NOTHING
+        ''', {
+            'device_key': self.device_key(cursor, data['device_id']),
+            'ts': ts,
+            'id': row_id,
+            **{metric: data.get(metric) for metric in METRICS},
+            'seq': data.get('seq')
+        })
+        if cursor.rowcount == 0:
+            data['duplicate'] = True
+            return None
+        
+        # Update device information
+        cursor.execute('''
+            INSERT OR REPLACE INTO devices 
+            (device_id, device_type, location, last_seen, total_records)
+            VALUES (?, ?, ?, ?, COALESCE(
+                (SELECT total_records + 1 FROM devices WHERE device_id = ?), 1
+            ))
+        ''', (
+            data['device_id'],
+            data.get('device_type', 'sensor_module'),
+            data.get('location', 'unknown'),
+            now,
+            data['device_id']
+        ))
+        
+        data['id'] = row_id
+        data['received_at'] = from_epoch_ms(ts)
+        return row_id
+    
     def save_sensor_data(self, data: Dict) -> bool:
         """Save sensor data to database"""
         try:
             conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Save sensor data
-            cursor.execute('''
-                INSERT INTO sensor_data 
-                (device_id, temperature, humidity, light_level, voltage, received_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                data['device_id'],
-                data.get('temperature'),
-                data.get('humidity'),
-                data.get('light_level'),
-                data.get('voltage'),
-                datetime.now().isoformat()
-            ))
-            
-            # Update device information
-            cursor.execute('''
-                INSERT OR REPLACE INTO devices 
-                (device_id, device_type, location, last_seen, total_records)
-                VALUES (?, ?, ?, ?, COALESCE(
-                    (SELECT total_records + 1 FROM devices WHERE device_id = ?), 1
-                ))
-            ''', (
-                data['device_id'],
-                data.get('device_type', 'sensor_module'),
-                data.get('location', 'unknown'),
-                datetime.now(),
-                data['device_id']
-            ))
-            
-            conn.commit()
+            self.insert_reading(conn.cursor(), data)
+            self.commit(conn)
             self.logger.info(f"Data saved for device: {data['device_id']}")
             return True
             
-        except sqlite3.Error as e:
+        except (sqlite3.Error, OverflowError) as e:
             self.logger.error(f"Error saving data: {e}")
+            # Keys registered in the rolled back transaction do not exist
+            self.device_keys = self.load_device_keys()
             return False
         finally:
             conn.close()
     
+    def save_sensor_data_batch(self, readings: List[Dict]) -> bool:
+        """Save several readings in a single transaction.
+
+        A reading with values the database refuses is rolled back to its
+        savepoint and marked as rejected; the rest are still committed.
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('BEGIN')
+            for data in readings:
+                known = data['device_id'] in self.device_keys
+                cursor.execute('SAVEPOINT reading')
+                try:
+                    self.insert_reading(cursor, data)
+                except READING_ERRORS as e:
+                    cursor.execute('ROLLBACK TO reading')
+                    self.logger.error(f"Rejected reading from {data['device_id']}: {e}")
+                    data['rejected'] = True
+                    if not known:
+                        # Its device key was rolled back with it
+                        self.device_keys.pop(data['device_id'], None)
+                cursor.execute('RELEASE reading')
+            self.commit(conn)
+            return True
+            
+        except sqlite3.Error as e:
+            self.logger.error(f"Error saving batch of {len(readings)} readings: {e}")
+            # Keys registered in the rolled back transaction do not exist
+            self.device_keys = self.load_device_keys()
+            return False
+        finally:
+            conn.close()
+    
+    def save_alerts(self, events: List[Dict]) -> bool:
+        """Save alert events to database"""
+        try:
+            conn = self.get_connection()
+            conn.executemany('''
+                INSERT INTO alerts
+                (rule, device_id, metric, value, threshold, severity, state, created_at)
+                VALUES (:rule, :device_id, :metric, :value, :threshold, :severity, :state, :created_at)
+            ''', events)
+            self.commit(conn)
+            return True
+
+        except sqlite3.Error as e:
+            self.logger.error(f"Error saving alerts: {e}")
+            return False
+        finally:
+            conn.close()
+
     def get_recent_data(self, device_id: Optional[str] = None, limit: int = 10) -> List[Dict]:
         """Get recent records from database"""
         try:
@@ -121,13 +544,13 @@ class DatabaseManager:
                 cursor.execute('''
                     SELECT * FROM sensor_data 
                     WHERE device_id = ? 
-                    ORDER BY timestamp DESC 
+                    ORDER BY ts DESC, id DESC 
                     LIMIT ?
                 ''', (device_id, limit))
             else:
                 cursor.execute('''
                     SELECT * FROM sensor_data 
-                    ORDER BY timestamp DESC 
+                    ORDER BY ts DESC, id DESC 
                     LIMIT ?
                 ''', (limit,))
             
@@ -146,17 +569,19 @@ class DatabaseManager:
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            cursor.execute('''
+            # Aggregated in primary key order with the archived totals,
+            # names joined per device
+            cursor.execute(f'''
                 SELECT 
-                    device_id,
-                    COUNT(*) as record_count,
-                    MIN(timestamp) as first_record,
-                    MAX(timestamp) as last_record,
-                    AVG(temperature) as avg_temperature,
-                    AVG(humidity) as avg_humidity,
-                    AVG(light_level) as avg_light_level
-                FROM sensor_data 
-                GROUP BY device_id
+                    k.device_id,
+                    s.record_count,
+                    datetime(s.first_ts / 1000, 'unixepoch') as first_record,
+                    datetime(s.last_ts / 1000, 'unixepoch') as last_record,
+                    s.avg_temperature,
+                    s.avg_humidity,
+                    s.avg_light_level
+                FROM ({DEVICE_TOTALS}) s JOIN device_keys k ON k.device_key = s.device_key
+                ORDER BY k.device_id
             ''')
             
             return [dict(row) for row in cursor.fetchall()]
@@ -191,4 +616,103 @@ class DatabaseManager:
             
         except Exception as e:
             self.logger.error(f"Export error: {e}")
-            return False
\ No newline at end of file
+            return False
+
+class DatabaseWriter:
+    """Single writer thread that group-commits readings from many producers.
+
+    Callers block until their reading is durable, but every reading queued
+    while a transaction is in flight goes into the next one, so concurrent
+    clients share one commit instead of each opening a connection.
+    Exposes the same save methods as DatabaseManager.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, max_batch: int = 256,
+                 flush_interval: float = 0.0, timeout: float = 5.0):
+        self.db_manager = db_manager
+        self.max_batch = max_batch
+        # Extra time to wait for more readings before committing a batch
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.queue: 'queue.Queue' = queue.Queue()
+        # Called on the writer thread with the new readings of every
+        # committed batch; batches commit one at a time, so in id order
+        self.listeners: List[Callable[[List[Dict]], None]] = []
+        self.logger = logging.getLogger(__name__)
+        self.thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, kind: str, payload) -> Future:
+        """Queue a write without waiting for it"""
+        future = Future()
+        self.queue.put((kind, payload, future))
+        return future
+
+    def wait(self, future: Future) -> bool:
+        try:
+            return future.result(self.timeout)
+        except Exception as e:
+            self.logger.error(f"Write not completed: {e}")
+            return False
+
+    @property
+    def changelog(self):
+        return self.db_manager.changelog
+
+    def _submit(self, kind: str, payload) -> bool:
+        return self.wait(self.submit(kind, payload))
+
+    def save_sensor_data(self, data: Dict) -> bool:
+        return self._submit('reading', data)
+
+    def save_sensor_data_batch(self, readings: List[Dict]) -> bool:
+        return self._submit('readings', readings)
+
+    def save_alerts(self, events: List[Dict]) -> bool:
+        return self._submit('alerts', events)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.logger.error(f"Writer error: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_result(False)
+
+    def _write(self, batch: List):
+        """Commit all queued readings together, then any queued alerts"""
+        readings = [item for item in batch if item[0] in ('reading', 'readings')]
+        if readings:
+            rows = []
+            for kind, payload, _ in readings:
+                if kind == 'reading':
+                    rows.append(payload)
+                else:
+                    rows.extend(payload)
+            ok = self.db_manager.save_sensor_data_batch(rows)
+            if ok:
+                self._notify([row for row in rows if not row.get('duplicate') and not row.get('rejected')])
+            for kind, payload, future in readings:
+                # Callers of a batch find its rejected readings marked
+                future.set_result(ok and not (kind == 'reading' and payload.get('rejected')))
+
+        for kind, payload, future in batch:
+            if kind == 'alerts':
+                future.set_result(self.db_manager.save_alerts(payload))
+
+    def _notify(self, rows: List[Dict]):
+        for listener in self.listeners:
+            try:
+                listener(rows)
+            except Exception as e:
+                self.logger.error(f"Commit listener failed: {e}")
\ No newline at end of file
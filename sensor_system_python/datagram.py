@@ -0,0 +1,96 @@
+import json
+import math
+import struct
+from typing import Dict, List
+
+from database import MAX_SEQ, check_reading
+
+# Binary datagram: magic, version, record count, then per record a
+# length-prefixed device id followed by the fixed-size fields.
+MAGIC = b'SD'
+VERSION = 1
+HEADER = struct.Struct('<2sBB')
+RECORD = struct.Struct('<QfffH')  # seq, temperature, humidity, voltage, light_level
+
+NO_SEQ = 0
+NO_LIGHT = 0xFFFF
+
+# Largest payload that fits one Ethernet frame without IP fragmentation
+MAX_DATAGRAM = 1472
+
+
+def _float(value):
+    return None if math.isnan(value) else round(value, 4)
+
+
+def encode_readings(readings: List[Dict]) -> bytes:
+    """Pack up to 255 readings into one compact binary datagram"""
+    if len(readings) > 255:
+        raise ValueError("At most 255 readings per datagram")
+
+    parts = [HEADER.pack(MAGIC, VERSION, len(readings))]
+    for data in readings:
+        device_id = data['device_id'].encode('utf-8')
+        if len(device_id) > 255:
+            raise ValueError(f"device_id too long: {data['device_id']!r}")
+        light = data.get('light_level')
+        parts.append(bytes((len(device_id),)) + device_id)
+        parts.append(RECORD.pack(
+            data.get('seq') or NO_SEQ,
+            *(math.nan if data.get(m) is None else data[m] for m in ('temperature', 'humidity', 'voltage')),
+            NO_LIGHT if light is None else light
+        ))
+    return b''.join(parts)
+
+
+def decode_datagram(payload: bytes) -> List[Dict]:
+    """Readings carried by one datagram: binary records, a JSON object or a JSON array"""
+    if payload[:2] == MAGIC:
+        return _decode_binary(payload)
+
+    try:
+        data = json.loads(payload)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Malformed datagram: {e}")
+
+    readings = data if isinstance(data, list) else [data]
+    for reading in readings:
+        try:
+            check_reading(reading)
+        except ValueError as e:
+            raise ValueError(f"{e} in datagram")
+    return readings
+
+
+def _decode_binary(payload: bytes) -> List[Dict]:
+    try:
+        _, version, count = HEADER.unpack_from(payload)
+        if version != VERSION:
+            raise ValueError(f"Unsupported datagram version {version}")
+
+        readings = []
+        offset = HEADER.size
+        for _ in range(count):
+            size = payload[offset]
+            device_id = payload[offset + 1:offset + 1 + size].decode('utf-8')
+            offset += 1 + size
+            seq, temperature, humidity, voltage, light = RECORD.unpack_from(payload, offset)
+            offset += RECORD.size
+            if seq > MAX_SEQ:
+                raise ValueError("Invalid seq in datagram")
+            reading = {
+                'device_id': device_id,
+                'temperature': _float(temperature),
+                'humidity': _float(humidity),
+                'light_level': None if light == NO_LIGHT else light,
+                'voltage': _float(voltage)
+            }
+            if seq != NO_SEQ:
+                reading['seq'] = seq
+            readings.append(reading)
+    except (IndexError, UnicodeDecodeError, struct.error) as e:
+        raise ValueError(f"Truncated datagram: {e}")
+
+    if offset != len(payload):
+        raise ValueError("Trailing bytes in datagram")
+    return readings
\ No newline at end of file
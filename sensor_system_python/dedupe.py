@@ -0,0 +1,59 @@
+import threading
+from typing import Dict, Hashable, Tuple
+
+
+class SequenceTracker:
+    """Per-device high-water mark with a sliding window of seen sequence numbers.
+
+    Works like an anti-replay window: a sequence number above the
+    high-water mark is new, one inside the window is a duplicate if its
+    bit is set, and one older than the window cannot be decided here and
+    is left to the unique (device_id, seq) index in the database.
+    """
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self.mask = (1 << window) - 1
+        self.devices: Dict[Hashable, Tuple[int, int]] = {}
+        self.lock = threading.Lock()
+
+    def is_duplicate(self, device_id: Hashable, seq: int) -> bool:
+        """True only when the reading is known to have been stored already"""
+        with self.lock:
+            state = self.devices.get(device_id)
+        if state is None:
+            return False
+
+        high, seen = state
+        offset = high - seq
+        if offset < 0 or offset >= self.window:
+            return False
+        return bool(seen >> offset & 1)
+
+    def mark(self, device_id: Hashable, seq: int) -> int:
+        """Record a stored sequence number.
+
+        Returns the change in the number of missing readings: the size of
+        the gap skipped by a jump ahead within the window, or -1 when a
+        late reading fills a gap inside the window. A jump past the whole
+        window is taken as a restarted sender (the emulator seeds seq
+        from the boot time) and counts no loss.
+        """
+        with self.lock:
+            state = self.devices.get(device_id)
+            if state is None:
+                self.devices[device_id] = (seq, 1)
+                return 0
+
+            high, seen = state
+            if seq - high >= self.window:
+                # Counter reset: start over, nothing older is remembered
+                self.devices[device_id] = (seq, 1)
+                return 0
+            if seq > high:
+                self.devices[device_id] = (seq, ((seen << (seq - high)) | 1) & self.mask)
+                return seq - high - 1
+            if high - seq < self.window and not seen >> (high - seq) & 1:
+                self.devices[device_id] = (high, seen | (1 << (high - seq)))
+                return -1
+            return 0
\ No newline at end of file
@@ -0,0 +1,125 @@
+import time
+import logging
+import threading
+from typing import Dict, Hashable, List, Optional
+
+
+class TimerWheel:
+    """Hashed timer wheel.
+
+    Timers are hashed into `slots` buckets by their expiry tick. Scheduling
+    and cancelling are O(1) and each tick only visits the bucket of the
+    current tick, so the cost does not grow with the number of timers.
+    """
+
+    def __init__(self, slots: int = 512, tick_seconds: float = 1.0, now: Optional[float] = None):
+        self.tick_seconds = tick_seconds
+        self.slots: List[Dict[Hashable, int]] = [{} for _ in range(slots)]
+        self.locations: Dict[Hashable, int] = {}
+        self.current_tick = int((now if now is not None else time.time()) / tick_seconds)
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def schedule(self, key: Hashable, deadline: float):
+        """(Re)schedule `key` to expire at `deadline` (epoch seconds)"""
+        self.cancel(key)
+        tick = max(int(deadline / self.tick_seconds), self.current_tick + 1)
+        slot = tick % len(self.slots)
+        self.slots[slot][key] = tick
+        self.locations[key] = slot
+
+    def cancel(self, key: Hashable):
+        slot = self.locations.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+
+    def advance(self, now: Optional[float] = None) -> List[Hashable]:
+        """Move the wheel up to `now` and return the keys that expired"""
+        target = int((now if now is not None else time.time()) / self.tick_seconds)
+        expired = []
+
+        # After a long pause one full turn is enough to see every bucket
+        start = max(self.current_tick + 1, target - len(self.slots) + 1)
+        for tick in range(start, target + 1):
+            bucket = self.slots[tick % len(self.slots)]
+            # Entries of later rounds share the bucket and stay in place
+            due = [key for key, expiry in bucket.items() if expiry <= target]
+            for key in due:
+                del bucket[key]
+                del self.locations[key]
+            expired.extend(due)
+
+        self.current_tick = max(self.current_tick, target)
+        return expired
+
+
+class DeviceWatchdog:
+    """Tracks every device's reporting interval and battery voltage.
+
+    Each reading re-arms the device's timer for `grace_factor` expected
+    intervals; when the timer fires the device is marked stale.
+    """
+
+    def __init__(self, default_interval: float, grace_factor: float = 3.0,
+                 low_voltage: float = 3.3, slots: int = 512, tick_seconds: float = 1.0):
+        self.default_interval = default_interval
+        self.grace_factor = grace_factor
+        self.low_voltage = low_voltage
+        self.wheel = TimerWheel(slots, tick_seconds)
+        self.devices: Dict[str, Dict] = {}
+        self.stale = set()
+        self.low_battery = set()
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def observe(self, device_id: str, seen_at: float, voltage: Optional[float] = None):
+        """Register a reading from a device"""
+        with self.lock:
+            device = self.devices.get(device_id)
+            if device is None:
+                device = self.devices[device_id] = {'last_seen': seen_at, 'interval': self.default_interval}
+            elif seen_at > device['last_seen']:
+                # Exponential moving average of the gap between readings
+                gap = seen_at - device['last_seen']
+                device['interval'] = 0.8 * device['interval'] + 0.2 * gap
+                device['last_seen'] = seen_at
+            elif seen_at < device['last_seen']:
+                return
+
+            if voltage is not None:
+                device['voltage'] = voltage
+                if voltage < self.low_voltage:
+                    self.low_battery.add(device_id)
+                else:
+                    self.low_battery.discard(device_id)
+
+            self.stale.discard(device_id)
+            self.wheel.schedule(device_id, seen_at + device['interval'] * self.grace_factor)
+
+    def tick(self, now: Optional[float] = None) -> List[str]:
+        """Advance timers and return devices that just went silent"""
+        with self.lock:
+            expired = self.wheel.advance(now)
+            self.stale.update(expired)
+
+        for device_id in expired:
+            self.logger.warning(f"Device {device_id} stopped reporting")
+        return expired
+
+    def status(self, device_id: str) -> str:
+        if device_id in self.stale:
+            return 'stale'
+        if device_id in self.low_battery:
+            return 'low_voltage'
+        if device_id in self.devices:
+            return 'online'
+        return 'unknown'
+
+    def stale_devices(self) -> List[str]:
+        with self.lock:
+            return sorted(self.stale)
+
+    def low_voltage_devices(self) -> List[str]:
+        with self.lock:
+            return sorted(self.low_battery)
\ No newline at end of file
@@ -0,0 +1,48 @@
+# embedded.py - Сервер данных, веб-интерфейс и эмулятор в одном процессе
+import threading
+from config import Config
+from sharding import open_database
+from bus import EventBus
+from data_server import SensorDataServer
+from web_interface import WebInterface
+from sensor_emulator import SensorEmulator
+
+class EmbeddedSystem:
+    """Все компоненты в одном процессе для небольших шлюзов.
+
+    Компоненты используют один поток записи в БД, общую шину событий
+    и кэш последних показаний: веб-интерфейс узнает о новых данных
+    сразу, а не опросом SQLite. TCP-сервер остается доступным для
+    внешних устройств, встроенный эмулятор передает данные напрямую.
+    """
+
+    def __init__(self, config: Config, with_emulator: bool = True):
+        self.config = config
+        self.bus = EventBus()
+        self.writer = open_database(config, group_commit=True)
+        self.server = SensorDataServer(config, db_manager=self.writer, bus=self.bus)
+        self.web = WebInterface(config, bus=self.bus)
+        self.emulator = SensorEmulator(config, transport=self.server.process_reading) if with_emulator else None
+
+    def run(self, host=None, port=None):
+        """Запуск сервера и эмулятора в фоновых потоках, веб-интерфейса - в основном"""
+        threading.Thread(target=self.server.start_server, name='data-server', daemon=True).start()
+        if self.emulator:
+            threading.Thread(target=self.emulator.start_emulation, name='emulator', daemon=True).start()
+
+        try:
+            # Без перезагрузчика: он перезапустил бы весь процесс
+            self.web.run(host=host or self.config.WEB.HOST, port=port or self.config.WEB.PORT, debug=False)
+        finally:
+            self.server.stop_server()
+
+def main():
+    """Запуск системы во встроенном режиме"""
+    config = Config.load()
+    config.initialize_directories()
+    config.setup_logging()
+
+    EmbeddedSystem(config).run()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
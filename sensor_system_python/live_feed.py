@@ -0,0 +1,145 @@
+import json
+import time
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from database import METRICS
+
+# Fields sent with every event, followed by the selected metrics
+EVENT_FIELDS = ('id', 'device_id', 'received_at')
+
+
+class LiveFeed:
+    """Recent readings kept in memory for Server-Sent Events clients.
+
+    Readings are appended as the web tier learns about them and event
+    ids are reading ids, so a reconnecting client resumes with
+    Last-Event-ID from the buffer without touching the database.
+    Streams keep only the last id they sent, so readings must be appended
+    in id order: a lower id arriving late would never be streamed.
+    """
+
+    def __init__(self, size: int = 1000):
+        self.buffer: deque = deque(maxlen=size)
+        # Readings up to this id are not (or no longer) in the buffer
+        self.floor = 0
+        self.last_id = 0
+        self.condition = threading.Condition()
+        # Called after every append, e.g. to wake an event loop
+        self.listeners: List[Callable[[], None]] = []
+
+    def reset(self, last_id: int):
+        """Start the feed after the newest stored reading"""
+        with self.condition:
+            self.buffer.clear()
+            self.floor = self.last_id = last_id
+
+    def append(self, reading: Dict):
+        with self.condition:
+            if len(self.buffer) == self.buffer.maxlen:
+                self.floor = self.buffer[0]['id']
+            self.buffer.append(reading)
+            self.last_id = max(self.last_id, reading['id'])
+            self.condition.notify_all()
+        for listener in self.listeners:
+            listener()
+
+    def covers(self, last_id: int) -> bool:
+        """True when every reading after last_id is still buffered"""
+        return last_id >= self.floor
+
+    def after(self, last_id: int) -> List[Dict]:
+        with self.condition:
+            return self._after(last_id)
+
+    def _after(self, last_id: int) -> List[Dict]:
+        readings = []
+        for reading in reversed(self.buffer):
+            if reading['id'] <= last_id:
+                break
+            readings.append(reading)
+        readings.reverse()
+        return readings
+
+    def wait(self, last_id: int, timeout: float) -> List[Dict]:
+        """Readings after last_id, waiting up to timeout for the first one"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.buffer and self.buffer[-1]['id'] > last_id, timeout)
+            return self._after(last_id)
+
+
+class StreamFilter:
+    """Per-client device and metric selection of /api/stream"""
+
+    def __init__(self, devices: Optional[List[str]] = None, metrics: Optional[List[str]] = None):
+        unknown = set(metrics or ()) - set(METRICS)
+        if unknown:
+            raise ValueError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+        self.devices = set(devices) if devices else None
+        self.metrics = list(metrics) if metrics else list(METRICS)
+
+    @classmethod
+    def from_args(cls, args: Mapping[str, str]) -> 'StreamFilter':
+        return cls([d for d in args.get('device_id', '').split(',') if d],
+                   [m for m in args.get('metrics', '').split(',') if m])
+
+    def render(self, readings: List[Dict]) -> bytes:
+        """SSE events of the readings this client asked for"""
+        events = []
+        for reading in readings:
+            if self.devices is not None and reading['device_id'] not in self.devices:
+                continue
+            data = {field: reading.get(field) for field in EVENT_FIELDS + tuple(self.metrics)}
+            events.append(f"id: {reading['id']}\nevent: reading\ndata: "
+                          f"{json.dumps(data, separators=(',', ':'), default=str)}\n\n")
+        return ''.join(events).encode('utf-8')
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[int]:
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Invalid Last-Event-ID: {value!r}")
+
+
+def open_stream(feed: LiveFeed, last_id: Optional[int], retry_ms: int) -> Tuple[bytes, int]:
+    """First bytes of a stream and the id it continues after.
+
+    A client resuming from a reading that has left the buffer gets a
+    reset event and should reload recent data through the REST API.
+    """
+    head = f'retry: {retry_ms}\n\n'
+    if last_id is None:
+        return head.encode('utf-8'), feed.last_id
+    if not feed.covers(last_id):
+        head += f'event: reset\ndata: {{"last_event_id":{last_id}}}\n\n'
+        return head.encode('utf-8'), feed.last_id
+    return head.encode('utf-8'), last_id
+
+
+# Comment line that keeps proxies and clients from timing out idle streams
+HEARTBEAT = b': ping\n\n'
+
+
+def stream_events(feed: LiveFeed, stream_filter: StreamFilter, last_id: Optional[int],
+                  heartbeat: float, retry_ms: int = 3000) -> Iterator[bytes]:
+    """Blocking SSE body for the threaded server"""
+    head, cursor = open_stream(feed, last_id, retry_ms)
+    yield head
+    written = time.monotonic()
+    while True:
+        readings = feed.wait(cursor, max(0.0, written + heartbeat - time.monotonic()))
+        if readings:
+            cursor = readings[-1]['id']
+            events = stream_filter.render(readings)
+            if events:
+                yield events
+                written = time.monotonic()
+                continue
+        # Readings of other devices are not traffic for a filtered client
+        if time.monotonic() - written >= heartbeat:
+            yield HEARTBEAT
+            written = time.monotonic()
\ No newline at end of file
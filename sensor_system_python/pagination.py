@@ -0,0 +1,32 @@
+import json
+import base64
+from typing import Optional, Sequence
+
+
+def encode_cursor(*values) -> str:
+    """Pack the sort key of the last row into an opaque cursor"""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[Sequence]:
+    """Unpack a cursor produced by encode_cursor, validating its shape"""
+    if not cursor:
+        return None
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def clamp_page_size(value: Optional[str], default: int, maximum: int) -> int:
+    """Parse a requested page size and keep it within 1..maximum"""
+    if value is None:
+        return default
+    return max(1, min(int(value), maximum))
\ No newline at end of file
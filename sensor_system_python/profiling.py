@@ -0,0 +1,256 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import logging
+import threading
+import weakref
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler for all threads of the process.
+
+    While running, a background thread records the stack of every other
+    thread each `interval` seconds. collapsed() returns the samples in
+    the folded format read by flamegraph.pl and speedscope: one line per
+    distinct stack, root first, frames joined by ';', then the count.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        """Start sampling with empty counts; no-op if already running"""
+        if self.running:
+            return
+        with self.lock:
+            self.stacks.clear()
+            self.samples = 0
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.running:
+            self.stop_event.set()
+            self.thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            # Pool threads differ only by a number; fold them together
+            names = {thread.ident: re.sub(r'[-_]?\d+$', '', thread.name) for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, frame in frames.items():
+                    if ident == own:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                        frame = frame.f_back
+                    stack.append(names.get(ident, 'thread'))
+                    self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def collapsed(self) -> str:
+        """Samples so far as folded stacks, most frequent first"""
+        with self.lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def dump(self, path: str) -> str:
+        with open(path, 'w', encoding='utf-8') as output:
+            output.write(self.collapsed())
+        return path
+
+
+class SlowQueryLog:
+    """SQLite statements slower than a threshold, with their query plans.
+
+    Disabled while threshold_ms is 0. Connections opened through
+    connect() while it is enabled time every statement from execute to
+    the last fetched row; slow ones are logged, kept in memory and
+    optionally appended to a JSON lines file.
+    """
+
+    def __init__(self, threshold_ms: float = 0.0, keep: int = 200, path: str = ''):
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        self.configure(threshold_ms, keep, path)
+
+    def configure(self, threshold_ms: float, keep: int = 200, path: str = ''):
+        with self.lock:
+            self.threshold_ms = threshold_ms
+            self.entries = deque(getattr(self, 'entries', ()), maxlen=keep)
+            self.path = path
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def record(self, conn: sqlite3.Connection, sql: str, parameters, seconds: float, rows: int):
+        entry = {
+            'at': datetime.now().isoformat(timespec='milliseconds'),
+            'sql': ' '.join(sql.split()),
+            'ms': round(seconds * 1000, 3),
+            'rows': rows,
+            'plan': self.explain(conn, sql, parameters)
+        }
+        self.logger.warning(f"Slow query ({entry['ms']:.1f} ms, {rows} rows): {entry['sql'][:200]}")
+        with self.lock:
+            self.entries.append(entry)
+            if self.path:
+                try:
+                    with open(self.path, 'a', encoding='utf-8') as output:
+                        output.write(json.dumps(entry, default=str) + '\n')
+                except OSError as e:
+                    self.logger.error(f"Cannot write slow query log: {e}")
+
+    @staticmethod
+    def explain(conn: sqlite3.Connection, sql: str, parameters) -> Optional[List[str]]:
+        """EXPLAIN QUERY PLAN details, None for statements without a plan"""
+        if parameters is None or not sql.lstrip().upper().startswith(('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')):
+            return None
+        try:
+            # A plain cursor, so the EXPLAIN itself is not timed
+            cursor = sqlite3.Cursor(conn)
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parameters)
+            return [row[3] for row in cursor.fetchall()]
+        except sqlite3.Error:
+            return None
+
+    def snapshot(self) -> List[Dict]:
+        with self.lock:
+            return list(self.entries)
+
+
+# Process-wide log shared by every connection opened through connect()
+slow_queries = SlowQueryLog()
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that times each statement including its row fetches"""
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._sql = None
+        self._parameters = None
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def _finish(self):
+        """Report the current statement once it is done"""
+        if self._sql is None:
+            return
+        sql, self._sql = self._sql, None
+        if self._elapsed * 1000 >= slow_queries.threshold_ms > 0:
+            rows = self._rows if self.description is not None else max(self.rowcount, 0)
+            slow_queries.record(self.connection, sql, self._parameters, self._elapsed, rows)
+
+    def _begin(self, sql: str, parameters):
+        self._finish()
+        self._sql, self._parameters = sql, parameters
+        self._elapsed, self._rows = 0.0, 0
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        self._timed(super().execute, sql, parameters)
+        if self.description is None:
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql, None)
+        self._timed(super().executemany, sql, seq_of_parameters)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        self._rows += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors report slow statements to slow_queries"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursors = weakref.WeakSet()
+
+    def cursor(self, factory=ProfiledCursor):
+        cursor = super().cursor(factory)
+        if isinstance(cursor, ProfiledCursor):
+            self.cursors.add(cursor)
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        # Statements read only partly (e.g. a single fetchone) end here
+        for cursor in list(self.cursors):
+            cursor._finish()
+        super().close()
+
+
+def connect(database: str, **kwargs) -> sqlite3.Connection:
+    """sqlite3.connect that times statements while the slow-query log is on"""
+    if slow_queries.enabled:
+        kwargs.setdefault('factory', ProfiledConnection)
+    return sqlite3.connect(database, **kwargs)
\ No newline at end of file
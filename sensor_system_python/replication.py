@@ -0,0 +1,396 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import Config
+from database import DatabaseManager, METRICS
+
+# Change log: one JSON line per committed write transaction of the leader,
+# {"lsn", "time", "last_id", "last_alert_id", "readings", "devices", "alerts"},
+# with rows as arrays in the column order below, plus "ops" for maintenance
+# the replica replays on the same rows: ["rollup", upto, resolutions] and
+# ["archive", cutoff, watermark, chunk_ms]. Files are named after the lsn
+# of their first entry.
+READING_COLUMNS = ('id', 'device_key', 'device_id', 'ts') + METRICS + ('seq',)
+DEVICE_COLUMNS = ('device_id', 'device_type', 'location', 'first_seen', 'last_seen', 'total_records')
+ALERT_COLUMNS = ('id', 'rule', 'device_id', 'metric', 'value', 'threshold', 'severity', 'state', 'created_at')
+SEGMENT_SUFFIX = '.log'
+
+# Readings per entry when existing rows are written to the log on start
+CATCH_UP_ROWS = 5000
+
+
+class ReplicationError(RuntimeError):
+    """The replica cannot continue from the change log"""
+
+
+def list_segments(directory: str) -> List[Tuple[int, str]]:
+    """(first lsn, path) of every change log file, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted((int(name[:-len(SEGMENT_SUFFIX)]), os.path.join(directory, name))
+                  for name in os.listdir(directory)
+                  if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+
+
+def read_head(directory: str) -> Optional[Dict]:
+    """Newest complete entry of the change log"""
+    segments = list_segments(directory)
+    if not segments:
+        return None
+    with open(segments[-1][1], 'rb') as segment:
+        lines = segment.read().split(b'\n')
+    # The part after the last newline is empty or a torn write
+    return json.loads(lines[-2]) if len(lines) > 1 else None
+
+
+class ChangeLog:
+    """Append-only log of the leader's committed writes.
+
+    DatabaseManager.commit captures the rows of a write transaction while
+    it still holds the write lock and appends them once the commit
+    succeeded, so the log holds only committed data. Rows are found by id
+    above the last logged one; readings committed but not logged (a crash
+    or a failed append) are picked up by the next capture or on start.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 16777216, keep_segments: int = 8):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.keep_segments = keep_segments
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(directory, exist_ok=True)
+
+        self.file = None
+        self.lsn = self.last_id = self.last_alert_id = 0
+        # Operations committed but not yet appended (after a failed append)
+        self.pending_ops: List[List] = []
+        segments = list_segments(directory)
+        if segments:
+            path = segments[-1][1]
+            with open(path, 'rb') as segment:
+                data = segment.read()
+            # Drop a line torn by a crash; its rows are captured again
+            complete = data[:data.rfind(b'\n') + 1]
+            if len(complete) != len(data):
+                with open(path, 'r+b') as segment:
+                    segment.truncate(len(complete))
+            head = read_head(directory)
+            if head:
+                self.lsn, self.last_id, self.last_alert_id = head['lsn'], head['last_id'], head['last_alert_id']
+            self.file = open(path, 'ab')
+
+    def capture(self, cursor: sqlite3.Cursor, limit: Optional[int] = None) -> Optional[Dict]:
+        """Rows written since the last appended entry, or None"""
+        cursor.execute(f'''
+            SELECT r.id, r.device_key, k.device_id, r.ts, {', '.join('r.' + m for m in METRICS)}, r.seq
+            FROM sensor_readings r JOIN device_keys k ON k.device_key = r.device_key
+            WHERE r.id > ?
+            ORDER BY r.id
+            {'LIMIT ?' if limit else ''}
+        ''', (self.last_id, limit) if limit else (self.last_id,))
+        readings = [list(row) for row in cursor.fetchall()]
+        cursor.execute(f'''
+            SELECT {', '.join(ALERT_COLUMNS)} FROM alerts WHERE id > ? ORDER BY id
+        ''', (self.last_alert_id,))
+        alerts = [list(row) for row in cursor.fetchall()]
+        if not readings and not alerts:
+            return None
+
+        devices = sorted({row[2] for row in readings})
+        cursor.execute(f'''
+            SELECT {', '.join(DEVICE_COLUMNS)} FROM devices
+            WHERE device_id IN ({', '.join('?' * len(devices))})
+        ''', devices)
+        return {
+            'time': time.time(),
+            'last_id': readings[-1][0] if readings else self.last_id,
+            'last_alert_id': alerts[-1][0] if alerts else self.last_alert_id,
+            'readings': readings,
+            'devices': [list(row) for row in cursor.fetchall()],
+            'alerts': alerts
+        }
+
+    def commit(self, conn: sqlite3.Connection, operation: Optional[List] = None):
+        """Commit a write transaction and append its rows and operation"""
+        # The lock keeps log order equal to commit order
+        with self.lock:
+            entry = self.capture(conn.cursor())
+            ops = self.pending_ops + ([operation] if operation else [])
+            if ops:
+                entry = entry or {'time': time.time(), 'last_id': self.last_id, 'last_alert_id': self.last_alert_id,
+                                  'readings': [], 'devices': [], 'alerts': []}
+                entry['ops'] = ops
+            conn.commit()
+            if entry:
+                lsn = self.lsn
+                self.append(entry)
+                # Unlike rows, operations cannot be captured again; keep them for the next entry
+                self.pending_ops = ops if self.lsn == lsn else []
+
+    def append(self, entry: Dict):
+        """Write a captured entry; called with the lock held, after the commit"""
+        entry = {'lsn': self.lsn + 1, **entry}
+        try:
+            if self.file is None or self.file.tell() >= self.segment_bytes:
+                self._start_segment(entry['lsn'])
+            self.file.write(json.dumps(entry, separators=(',', ':')).encode('utf-8') + b'\n')
+            self.file.flush()
+        except OSError as e:
+            # The rows stay above last_id and go into the next entry
+            self.logger.error(f"Change log append failed: {e}")
+            return
+        self.lsn, self.last_id, self.last_alert_id = entry['lsn'], entry['last_id'], entry['last_alert_id']
+
+    def _start_segment(self, lsn: int):
+        if self.file:
+            self.file.close()
+        self.file = open(os.path.join(self.directory, f'{lsn:020d}{SEGMENT_SUFFIX}'), 'ab')
+        for _, path in list_segments(self.directory)[:-self.keep_segments]:
+            os.remove(path)
+
+    def catch_up(self, connect: Callable[[], sqlite3.Connection]):
+        """Log rows the database has but the log does not, e.g. on first start"""
+        conn = connect()
+        try:
+            with self.lock:
+                while True:
+                    entry = self.capture(conn.cursor(), CATCH_UP_ROWS)
+                    if entry is None:
+                        break
+                    lsn = self.lsn
+                    self.append(entry)
+                    if self.lsn == lsn:
+                        break
+                    self.logger.info(f"Logged {len(entry['readings'])} existing readings")
+        finally:
+            conn.close()
+
+
+class ReplicaFollower:
+    """Applies the leader's change log to a replica database.
+
+    Each poll applies the new entries and records the replica's position
+    in one transaction, so a restarted follower resumes where it stopped.
+    Readings keep their leader ids, so cursors and watermarks match.
+    """
+
+    def __init__(self, directory: str, replica_path: str, pragmas=None,
+                 poll_interval: float = 1.0, max_entries: int = 256):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.max_entries = max_entries
+        self.db = DatabaseManager(replica_path, pragmas)
+        self.logger = logging.getLogger(__name__)
+        # Segment file and byte offset of the next entry to read
+        self.position: Optional[Tuple[str, int]] = None
+
+        conn = self.db.get_connection()
+        try:
+            row = conn.execute("SELECT lsn FROM replication_state WHERE name = 'changelog'").fetchone()
+        finally:
+            conn.close()
+        self.lsn = row[0] if row else 0
+
+    def find_segment(self, lsn: int) -> Optional[str]:
+        segments = list_segments(self.directory)
+        if not segments:
+            return None
+        if segments[0][0] > lsn:
+            raise ReplicationError(f"Change log entry {lsn} was deleted; reseed the replica")
+        return [path for first, path in segments if first <= lsn][-1]
+
+    def read_entries(self) -> Tuple[List[Dict], Optional[Tuple[str, int]], bool]:
+        """New entries, the position after them and whether the log end was reached"""
+        position = self.position
+        if position is None:
+            path = self.find_segment(self.lsn + 1)
+            if path is None:
+                return [], None, True
+            position = (path, 0)
+
+        entries = []
+        lsn = self.lsn
+        path, offset = position
+        while True:
+            try:
+                with open(path, 'rb') as segment:
+                    segment.seek(offset)
+                    for line in segment:
+                        if not line.endswith(b'\n'):
+                            break  # still being written
+                        offset += len(line)
+                        entry = json.loads(line)
+                        if entry['lsn'] <= lsn:
+                            continue
+                        if entry['lsn'] != lsn + 1:
+                            raise ReplicationError(f"Change log gap after entry {lsn}")
+                        entries.append(entry)
+                        lsn = entry['lsn']
+                        if len(entries) >= self.max_entries:
+                            return entries, (path, offset), False
+            except FileNotFoundError:
+                # Deleted by the leader's retention while we were behind
+                self.position = None
+                raise ReplicationError(f"Change log file {path} was deleted; reseed the replica")
+
+            later = [p for first, p in list_segments(self.directory) if p > path]
+            if not later:
+                return entries, (path, offset), True
+            path, offset = later[0], 0
+
+    def apply(self, cursor: sqlite3.Cursor, entry: Dict):
+        readings = entry['readings']
+        # An entry applied twice (after a seed) may carry readings archived since
+        archived = cursor.execute("SELECT cutoff, watermark FROM archive_state WHERE name = 'sensor_readings'").fetchone()
+        if archived:
+            readings = [row for row in readings if not (row[3] < archived[0] and row[0] <= archived[1])]
+        cursor.executemany('INSERT OR IGNORE INTO device_keys (device_key, device_id) VALUES (?, ?)',
+                           {(row[1], row[2]) for row in readings})
+        columns = ('id', 'device_key', 'ts') + METRICS + ('seq',)
+        cursor.executemany(f'''
+            INSERT OR IGNORE INTO sensor_readings ({', '.join(columns)})
+            VALUES ({', '.join('?' * len(columns))})
+        ''', (row[:2] + row[3:] for row in readings))
+        # Device rows carry the leader's values, so applying twice is harmless
+        cursor.executemany(f'''
+            INSERT OR REPLACE INTO devices ({', '.join(DEVICE_COLUMNS)})
+            VALUES ({', '.join('?' * len(DEVICE_COLUMNS))})
+        ''', entry['devices'])
+        cursor.executemany(f'''
+            INSERT OR IGNORE INTO alerts ({', '.join(ALERT_COLUMNS)})
+            VALUES ({', '.join('?' * len(ALERT_COLUMNS))})
+        ''', entry['alerts'])
+        for operation in entry.get('ops', ()):
+            self.replay(cursor.connection, operation)
+
+    @staticmethod
+    def replay(conn: sqlite3.Connection, operation: List):
+        """Run a leader maintenance operation; both kinds are idempotent"""
+        # Imported here: both modules import sharding, which imports this one
+        from rollups import fold_readings
+        from archive import archive_rows
+        kind = operation[0]
+        if kind == 'rollup':
+            fold_readings(conn, operation[2], operation[1])
+        elif kind == 'archive':
+            archive_rows(conn, {'cutoff': operation[1], 'watermark': operation[2]}, operation[3])
+        else:
+            raise ReplicationError(f"Unknown change log operation {kind!r}")
+
+    def poll(self) -> Tuple[int, bool]:
+        """Apply the entries appended since the last poll (up to max_entries)"""
+        entries, position, at_end = self.read_entries()
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            for entry in entries:
+                self.apply(cursor, entry)
+            if entries:
+                cursor.execute('''
+                    INSERT INTO replication_state (name, lsn, leader_time) VALUES ('changelog', ?, ?)
+                    ON CONFLICT (name) DO UPDATE SET lsn = excluded.lsn, leader_time = excluded.leader_time
+                ''', (entries[-1]['lsn'], entries[-1]['time']))
+            if at_end:
+                # Everything the leader logged before now is in the replica
+                cursor.execute('''
+                    INSERT INTO replication_state (name, lsn, caught_up_at) VALUES ('changelog', ?, ?)
+                    ON CONFLICT (name) DO UPDATE SET caught_up_at = excluded.caught_up_at
+                ''', (self.lsn, time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.position = position
+        if entries:
+            self.lsn = entries[-1]['lsn']
+        return len(entries), at_end
+
+    def run(self):
+        self.logger.info(f"Replicating {self.directory} into {self.db.db_path} from entry {self.lsn + 1}")
+        while True:
+            try:
+                applied, at_end = self.poll()
+                if applied:
+                    self.logger.debug(f"Applied {applied} change log entries, now at {self.lsn}")
+                if at_end:
+                    time.sleep(self.poll_interval)
+            except (ReplicationError, sqlite3.Error, OSError, ValueError) as e:
+                self.logger.error(f"Replication error: {e}")
+                time.sleep(self.poll_interval)
+
+
+def replication_status(conn: sqlite3.Connection) -> Optional[Dict]:
+    """Position and lag of a replica, None if nothing was replicated yet.
+
+    lag_seconds is the time since the follower last reached the end of the
+    change log; it keeps growing while the follower is behind or stopped.
+    """
+    row = conn.execute('''
+        SELECT lsn, leader_time, caught_up_at FROM replication_state WHERE name = 'changelog'
+    ''').fetchone()
+    if row is None:
+        return None
+    lsn, leader_time, caught_up_at = row
+    now = time.time()
+    return {
+        'lsn': lsn,
+        'lag_seconds': round(now - caught_up_at, 3) if caught_up_at else None,
+        'last_commit_age': round(now - leader_time, 3) if leader_time else None
+    }
+
+
+def seed_replica(leader_path: str, replica_path: str, directory: str):
+    """Start a replica from a copy of the leader database.
+
+    The log position is read before the copy, so every entry after it
+    was committed after the copy started; entries committed during the
+    copy may be applied again, which the follower tolerates.
+    """
+    head = read_head(directory)
+    source = sqlite3.connect(leader_path)
+    target = sqlite3.connect(replica_path)
+    try:
+        source.backup(target)
+        target.execute('DELETE FROM replication_state')
+        target.execute('''
+            INSERT INTO replication_state (name, lsn, leader_time) VALUES ('changelog', ?, ?)
+        ''', (head['lsn'] if head else 0, head['time'] if head else None))
+        target.commit()
+    finally:
+        source.close()
+        target.close()
+
+
+def main():
+    """Follower process: keep replication.replica_path up to date"""
+    parser = argparse.ArgumentParser(description='Apply the data server change log to a replica database')
+    parser.add_argument('--seed', action='store_true',
+                        help='start the replica from a copy of database.db_path')
+    args = parser.parse_args()
+
+    config = Config.load()
+    config.initialize_directories()
+    config.setup_logging()
+    settings = config.REPLICATION
+    if not settings.CHANGELOG_DIR or not settings.REPLICA_PATH:
+        logging.error("replication.changelog_dir and replication.replica_path must be set")
+        return
+
+    if args.seed:
+        # The leader schema must be current for the copy to be usable
+        DatabaseManager(config.DATABASE.DB_PATH, config.DATABASE.PRAGMAS)
+        seed_replica(config.DATABASE.DB_PATH, settings.REPLICA_PATH, settings.CHANGELOG_DIR)
+
+    ReplicaFollower(settings.CHANGELOG_DIR, settings.REPLICA_PATH, config.DATABASE.PRAGMAS,
+                    poll_interval=settings.POLL_INTERVAL).run()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,200 @@
+import math
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from profiling import connect
+from sharding import attach_shards, settled_id
+
+METRICS = ('temperature', 'humidity', 'light_level', 'voltage')
+
+_BUCKET = "(ts / 1000 / :resolution) * :resolution"
+
+# Raw rows after the watermark are folded into every resolution with one
+# statement each; conflicting buckets are merged in place.
+_REFRESH_SQL = f'''
+    INSERT INTO sensor_rollups (resolution, device_key, bucket, count, {', '.join(
+        f'{m}_sum, {m}_count, {m}_min, {m}_max' for m in METRICS)})
+    SELECT :resolution, device_key, {_BUCKET}, COUNT(*), {', '.join(
+        f'TOTAL({m}), COUNT({m}), MIN({m}), MAX({m})' for m in METRICS)}
+    FROM sensor_readings
+    WHERE id > :after AND id <= :upto
+    GROUP BY device_key, 3
+    ON CONFLICT (resolution, device_key, bucket) DO UPDATE SET
+        count = count + excluded.count, {', '.join(
+        f"{m}_sum = {m}_sum + excluded.{m}_sum, "
+        f"{m}_count = {m}_count + excluded.{m}_count, "
+        f"{m}_min = COALESCE(min({m}_min, excluded.{m}_min), {m}_min, excluded.{m}_min), "
+        f"{m}_max = COALESCE(max({m}_max, excluded.{m}_max), {m}_max, excluded.{m}_max)"
+        for m in METRICS)}
+'''
+
+
+def fold_readings(conn: sqlite3.Connection, resolutions: Sequence[int], upto: int) -> int:
+    """Fold readings after the stored watermark up to id `upto` into the rollups.
+
+    Runs in the caller's write transaction. Replicas replay it with the
+    leader's upto; a second run over the same ids folds nothing.
+    """
+    row = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'sensor_rollups'").fetchone()
+    after = row[0] if row else 0
+    if upto <= after:
+        return 0
+    for resolution in resolutions:
+        conn.execute(_REFRESH_SQL, {'resolution': resolution, 'after': after, 'upto': upto})
+    conn.execute('''
+        INSERT OR REPLACE INTO rollup_state (name, last_id)
+        VALUES ('sensor_rollups', ?)
+    ''', (upto,))
+    return upto - after
+
+
+class SensorRollups:
+    """Pre-aggregated buckets of readings and level-of-detail chart series.
+
+    Readings are folded into per-device buckets (one minute and one hour
+    by default) incrementally, tracked by the last sensor_readings id
+    processed. A chart request picks the bucket width that gives about
+    one point per pixel and reads it from the coarsest rollup that is
+    fine enough, or from raw rows for short windows, so the response
+    size depends on the width and not on the time range.
+    """
+
+    def __init__(self, db_path: str, resolutions: Sequence[int] = (60, 3600),
+                 raw_horizon: Optional[float] = None, shards: int = 1,
+                 changelog=None, writable: bool = True):
+        self.db_path = db_path
+        self.shards = shards
+        self.resolutions = sorted(resolutions)
+        # Seconds of history kept as raw rows; older readings are archived
+        self.raw_horizon = raw_horizon
+        # Refreshes are logged for replicas when the leader has a change log
+        self.changelog = changelog
+        # False when another process (the data server) refreshes the rollups
+        self.writable = writable
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Create database connection"""
+        conn = connect(self.db_path)
+        attach_shards(conn, self.db_path, self.shards)
+        return conn
+
+    def refresh(self) -> int:
+        """Fold readings added since the last refresh into the rollups"""
+        if not self.writable:
+            return 0
+        with self.lock:
+            conn = self.get_connection()
+            try:
+                # Watermark read and update happen in one write transaction
+                conn.execute('BEGIN IMMEDIATE')
+                upto = conn.execute('SELECT COALESCE(MAX(id), 0) FROM sensor_readings').fetchone()[0]
+                settled = settled_id(self.shards)
+                if settled is not None:
+                    upto = min(upto, settled)
+                folded = fold_readings(conn, self.resolutions, upto)
+                if not folded:
+                    conn.rollback()
+                    return 0
+                if self.changelog:
+                    self.changelog.commit(conn, ['rollup', upto, self.resolutions])
+                else:
+                    conn.commit()
+                return folded
+
+            except sqlite3.Error as e:
+                conn.rollback()
+                self.logger.error(f"Rollup refresh failed: {e}")
+                return 0
+            finally:
+                conn.close()
+
+    def plan(self, start: float, end: float, width: int) -> Dict:
+        """Bucket width for about one point per pixel and the table to read it from"""
+        bucket = max(1, math.ceil((end - start) / max(1, width)))
+        resolution = max((r for r in self.resolutions if r <= bucket), default=None)
+        if resolution is None and self.raw_horizon and start < time.time() - self.raw_horizon:
+            # Raw rows of this range may already be archived
+            resolution = self.resolutions[0]
+        if resolution:
+            # Whole rollup buckets only, so every point merges complete buckets
+            bucket = math.ceil(bucket / resolution) * resolution
+        return {'bucket': bucket, 'resolution': resolution}
+
+    def series(self, start: float, end: float, width: int,
+               device_ids: Optional[Iterable[str]] = None,
+               metrics: Sequence[str] = METRICS) -> Dict:
+        """Per-device avg/min/max series between two epoch timestamps"""
+        unknown = set(metrics) - set(METRICS)
+        if unknown:
+            raise ValueError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+
+        plan = self.plan(start, end, width)
+        device_ids = list(device_ids or [])
+        if plan['resolution']:
+            self.refresh()
+            rows = self._query_rollups(plan, start, end, device_ids, metrics)
+            source = f"rollup_{plan['resolution']}"
+        else:
+            rows = self._query_raw(plan, start, end, device_ids, metrics)
+            source = 'raw'
+
+        devices: Dict[str, Dict] = {}
+        for row in rows:
+            device = devices.get(row[0])
+            if device is None:
+                device = devices[row[0]] = {'t': [], **{m: {'avg': [], 'min': [], 'max': []} for m in metrics}}
+            device['t'].append(row[1])
+            for i, metric in enumerate(metrics):
+                avg, low, high = row[2 + 3 * i:5 + 3 * i]
+                device[metric]['avg'].append(None if avg is None else round(avg, 3))
+                device[metric]['min'].append(low)
+                device[metric]['max'].append(high)
+
+        return {
+            'start': int(start),
+            'end': int(end),
+            'bucket_seconds': plan['bucket'],
+            'source': source,
+            'devices': devices
+        }
+
+    def _query_raw(self, plan: Dict, start: float, end: float,
+                   device_ids: List[str], metrics: Sequence[str]) -> List[tuple]:
+        aggregates = ', '.join(f'AVG({m}), MIN({m}), MAX({m})' for m in metrics)
+        query = f'''
+            SELECT k.device_id, {_BUCKET.replace(':resolution', ':bucket')} AS t, {aggregates}
+            FROM sensor_readings r JOIN device_keys k ON k.device_key = r.device_key
+            WHERE ts >= :start * 1000 AND ts < :end * 1000
+        '''
+        return self._run(query, plan, start, end, device_ids)
+
+    def _query_rollups(self, plan: Dict, start: float, end: float,
+                       device_ids: List[str], metrics: Sequence[str]) -> List[tuple]:
+        aggregates = ', '.join(
+            f'SUM({m}_sum) / NULLIF(SUM({m}_count), 0), MIN({m}_min), MAX({m}_max)' for m in metrics)
+        query = f'''
+            SELECT k.device_id, (bucket / :bucket) * :bucket AS t, {aggregates}
+            FROM sensor_rollups r JOIN device_keys k ON k.device_key = r.device_key
+            WHERE resolution = :resolution
+              AND bucket >= (CAST(:start AS INTEGER) / :resolution) * :resolution AND bucket < :end
+        '''
+        return self._run(query, plan, start, end, device_ids)
+
+    def _run(self, query: str, plan: Dict, start: float, end: float, device_ids: List[str]) -> List[tuple]:
+        params = {'bucket': plan['bucket'], 'resolution': plan['resolution'], 'start': int(start), 'end': int(end)}
+        if device_ids:
+            names = [f'd{i}' for i in range(len(device_ids))]
+            query += f" AND k.device_id IN ({', '.join(':' + name for name in names)})"
+            params.update(zip(names, device_ids))
+        query += ' GROUP BY k.device_id, t ORDER BY k.device_id, t'
+
+        conn = self.get_connection()
+        try:
+            return conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
\ No newline at end of file
@@ -1,62 +1,80 @@
 # run_system.py - Основной файл для запуска всей системы
-import threading
-import time
-import subprocess
-import sys
 import os
+import sys
+import logging
+import argparse
 from config import Config
+from supervisor import Supervisor, ManagedProcess, port_probe, http_probe
 
-def run_server():
-    """Запуск сервера данных"""
-    print("Starting data server... - run_system.py:11")
-    os.system('python data_server.py')
-
-def run_emulator():
-    """Запуск эмулятора"""
-    print("Starting sensor emulator... - run_system.py:16")
-    os.system('python sensor_emulator.py')
-
-def run_web_interface():
-    """Запуск веб-интерфейса"""
-    print("Starting web interface... - run_system.py:21")
-    os.system('python web_interface.py')
+def build_supervisor(config: Config) -> Supervisor:
+    """Процессы системы в порядке запуска, каждый со своей проверкой готовности"""
+    supervisor = Supervisor()
+    supervisor.add(ManagedProcess(
+        'server', 'data_server.py',
+        readiness=port_probe('localhost', config.SERVER.PORT)
+    ))
+    supervisor.add(ManagedProcess(
+        'web', 'web_interface.py',
+        readiness=http_probe(f"http://localhost:{config.WEB.PORT}/api/health")
+    ))
+    # Эмулятор стартует только когда сервер уже принимает подключения
+    supervisor.add(ManagedProcess('emulator', 'sensor_emulator.py'))
+    # Реплика догоняет журнал изменений сервера данных
+    if config.REPLICATION.CHANGELOG_DIR and config.REPLICATION.REPLICA_PATH:
+        supervisor.add(ManagedProcess('replica', 'replication.py'))
+    return supervisor
 
 def main():
     """Основная функция запуска системы"""
-    config = Config()
+    parser = argparse.ArgumentParser(description='Sensor Data Monitoring System')
+    parser.add_argument('--embedded', action='store_true',
+                        help='run server, web interface and emulator in one process')
+    parser.add_argument('--config', help='TOML configuration file')
+    args = parser.parse_args()
+
+    if args.config:
+        # Дочерние процессы читают тот же файл через переменную окружения
+        os.environ['SENSOR_CONFIG'] = os.path.abspath(args.config)
+    config = Config.load()
     config.initialize_directories()
-    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(message)s')
+
+    if args.embedded:
+        # Один процесс: общий поток записи в БД и шина событий
+        from embedded import EmbeddedSystem
+        EmbeddedSystem(config).run()
+        return 0
+
     print("= - run_system.py:29" * 60)
     print("🚀 Sensor Data Monitoring System - run_system.py:30")
     print("= - run_system.py:31" * 60)
     print("This system includes: - run_system.py:32")
-    print("1. Data Server (localhost:8080)  receives sensor data - run_system.py:33")
-    print("2. Sensor Emulator  generates test data - run_system.py:34") 
-    print("3. Web Interface (localhost:5000)  monitoring dashboard - run_system.py:35")
+    print(f"1. Data Server ({config.SERVER.HOST}:{config.SERVER.PORT})  receives sensor data - run_system.py:33")
+    print("2. Sensor Emulator  generates test data - run_system.py:34")
+    print(f"3. Web Interface ({config.WEB.HOST}:{config.WEB.PORT})  monitoring dashboard - run_system.py:35")
     print("= - run_system.py:36" * 60)
-    
-    # Запускаем сервер в отдельном потоке
-    server_thread = threading.Thread(target=run_server, daemon=True)
-    server_thread.start()
-    
-    # Даем серверу время на запуск
-    time.sleep(2)
-    
-    # Запускаем эмулятор в отдельном потоке
-    emulator_thread = threading.Thread(target=run_emulator, daemon=True)
-    emulator_thread.start()
-    
-    # Запускаем веб-интерфейс (блокирующий вызов)
-    print("\n🌐 Web interface will be available at: http://localhost:5000 - run_system.py:50")
-    print("📡 Data server is listening on: localhost:8080 - run_system.py:51")
-    print("⚡ Sensor emulator is generating data... - run_system.py:52")
-    print("\nPress Ctrl+C to stop all services\n - run_system.py:53")
-    
-    run_web_interface()
+
+    supervisor = build_supervisor(config)
+    try:
+        # Ждем готовности каждого сервиса вместо фиксированной паузы
+        if not supervisor.start_all():
+            print("❌ Error starting system: service did not become ready - run_system.py:63")
+            return 1
+
+        print(f"\n🌐 Web interface will be available at: http://{config.WEB.HOST}:{config.WEB.PORT} - run_system.py:50")
+        print(f"📡 Data server is listening on: {config.SERVER.HOST}:{config.SERVER.PORT} - run_system.py:51")
+        print("⚡ Sensor emulator is generating data... - run_system.py:52")
+        print("\nPress Ctrl+C to stop all services\n - run_system.py:53")
+
+        # Перезапускаем упавшие процессы до остановки пользователем
+        supervisor.watch()
+        return 0
+    finally:
+        supervisor.stop()
 
 if __name__ == "__main__":
     try:
-        main()
+        sys.exit(main())
     except KeyboardInterrupt:
         print("\n🛑 System stopped by user - run_system.py:61")
     except Exception as e:
@@ -1,14 +1,176 @@
 import socket
 import json
+import math
 import time
-import random
 from datetime import datetime
+import numpy as np
 from config import Config
+from datagram import encode_readings, HEADER, MAX_DATAGRAM
+
+# Generated signals, in the order of the rows of SignalGenerator.step
+SIGNALS = ('temperature', 'humidity', 'light_level', 'voltage')
+DECIMALS = (2, 2, 0, 2)
+RANGES = ('temperature_range', 'humidity_range', 'light_range', 'voltage_range')
+
+# Open-circuit voltage of a Li-ion cell by remaining charge: a quick drop
+# from full, a long plateau and a knee before cut-off
+DISCHARGE_CHARGE = np.array([0.0, 0.05, 0.15, 0.5, 0.85, 0.95, 1.0])
+DISCHARGE_VOLTAGE = np.array([3.2, 3.45, 3.6, 3.72, 3.9, 4.05, 4.2])
+
+FAULTS = ('stuck', 'spike', 'drift', 'dropout')
+# Length of each fault kind in cycles (low, high)
+FAULT_CYCLES = {'stuck': (5, 30), 'spike': (1, 1), 'drift': (20, 200), 'dropout': (3, 20)}
+
+DAY = 86400.0
+
+
+class SignalGenerator:
+    """Time-correlated readings for all devices, one vectorized step per cycle.
+
+    Temperature follows a daily cycle plus a mean-reverting random walk,
+    humidity moves against temperature with a walk of its own, light
+    follows daylight under drifting cloud cover and battery voltage
+    follows a Li-ion discharge curve until the battery is replaced.
+    Sensor faults start at random with fault_rate or through inject().
+    The same seed and start time give the same readings.
+    """
+
+    def __init__(self, devices, rng: np.random.Generator, interval: float, day_length: float = DAY,
+                 battery_days: float = 30.0, fault_rate: float = 0.0, start: float = None):
+        n = len(devices)
+        self.rng = rng
+        self.fault_rate = fault_rate
+        # Simulated seconds per cycle and since local midnight
+        self.step_seconds = interval * DAY / day_length
+        local = datetime.fromtimestamp(time.time() if start is None else start)
+        self.clock = local.hour * 3600 + local.minute * 60 + local.second
+        
+        # Per-device ranges, one row per signal
+        bounds = np.array([[device[key] for device in devices] for key in RANGES], dtype=float)
+        self.low, self.high = low, high = bounds[..., 0], bounds[..., 1]
+        span = high - low
+        self.temperature_mean = low[0] + span[0] * rng.uniform(0.3, 0.7, n)
+        self.temperature_swing = span[0] * rng.uniform(0.1, 0.25, n)
+        self.warmest = rng.normal(15 * 3600, 3600, n)
+        self.humidity_mean = low[1] + span[1] * rng.uniform(0.3, 0.7, n)
+        # Battery capacity in simulated seconds and the charge left
+        self.capacity = battery_days * DAY * rng.uniform(0.85, 1.15, n)
+        self.charge = rng.uniform(0.3, 1.0, n)
+        # Ornstein-Uhlenbeck walks: (value, stationary deviation, time constant in seconds)
+        self.walks = {
+            'temperature': [np.zeros(n), 0.08 * span[0], 2 * 3600],
+            'humidity': [np.zeros(n), 0.06 * span[1], 3 * 3600],
+            'cloud': [np.zeros(n), 0.2, 3600],
+        }
+        
+        # Active fault per device: kind index (-1 none), signal row, cycles left and age, parameter
+        self.fault_kind = np.full(n, -1)
+        self.fault_signal = np.zeros(n, dtype=int)
+        self.fault_left = np.zeros(n, dtype=int)
+        self.fault_age = np.zeros(n, dtype=int)
+        self.fault_value = np.zeros(n)
+    
+    def walk(self, name: str) -> np.ndarray:
+        """Advance a random walk by one cycle; exact for any cycle length"""
+        state = self.walks[name]
+        decay = np.exp(-self.step_seconds / state[2])
+        state[0] = state[0] * decay + state[1] * np.sqrt(1 - decay ** 2) * self.rng.standard_normal(len(state[0]))
+        return state[0]
+    
+    def inject(self, device: int, kind: str, signal: str, cycles: int = None):
+        """Start a fault of one signal of a device with the next step"""
+        self.start_faults(np.array([device]), np.array([FAULTS.index(kind)]), np.array([SIGNALS.index(signal)]),
+                          None if cycles is None else np.array([cycles]))
+    
+    def start_faults(self, devices: np.ndarray, kinds: np.ndarray, signals: np.ndarray, cycles: np.ndarray = None):
+        if cycles is None:
+            bounds = np.array([FAULT_CYCLES[kind] for kind in FAULTS])[kinds]
+            cycles = self.rng.integers(bounds[:, 0], bounds[:, 1] + 1)
+        span = (self.high - self.low)[signals, devices]
+        self.fault_kind[devices] = kinds
+        self.fault_signal[devices] = signals
+        self.fault_left[devices] = cycles
+        self.fault_age[devices] = 0
+        # Spikes jump by 1.5-3 ranges; drifts creep away by up to one range over the fault
+        sign = self.rng.choice((-1.0, 1.0), len(devices))
+        self.fault_value[devices] = np.where(kinds == FAULTS.index('spike'),
+                                             sign * span * self.rng.uniform(1.5, 3, len(devices)),
+                                             sign * span * self.rng.uniform(0.2, 1, len(devices)) / cycles)
+    
+    def step(self) -> np.ndarray:
+        """Readings of the next cycle, one row per signal and one column per device"""
+        n = len(self.charge)
+        self.clock = (self.clock + self.step_seconds) % DAY
+        noise = self.rng.standard_normal((len(SIGNALS), n))
+        
+        daily = np.cos(2 * np.pi * (self.clock - self.warmest) / DAY)
+        temperature = self.temperature_mean + self.temperature_swing * daily + self.walk('temperature')
+        # Relative humidity falls as the air warms up
+        humidity = self.humidity_mean - 2.5 * (temperature - self.temperature_mean) + self.walk('humidity')
+        daylight = np.clip(np.sin(2 * np.pi * (self.clock - 6 * 3600) / DAY), 0, None)
+        cover = np.clip(0.8 + self.walk('cloud'), 0.2, 1.0)
+        light = self.low[2] + (self.high[2] - self.low[2]) * daylight * cover
+        
+        self.charge -= self.step_seconds / self.capacity
+        # Flat batteries are swapped for full ones
+        self.charge[self.charge <= 0] = 1.0
+        voltage = np.interp(self.charge, DISCHARGE_CHARGE, DISCHARGE_VOLTAGE)
+        
+        readings = np.stack([temperature, humidity, light, voltage])
+        readings += noise * np.array([[0.05], [0.3], [10.0], [0.005]])
+        
+        if self.fault_rate:
+            idle = np.flatnonzero((self.fault_left == 0) & (self.rng.random(n) < self.fault_rate))
+            if len(idle):
+                self.start_faults(idle, self.rng.integers(0, len(FAULTS), len(idle)),
+                                  self.rng.integers(0, len(SIGNALS), len(idle)))
+        self.apply_faults(readings)
+        
+        readings[1] = np.clip(readings[1], 0, 100)
+        readings[2] = np.clip(readings[2], 0, None)
+        return readings
+    
+    def apply_faults(self, readings: np.ndarray):
+        active = np.flatnonzero(self.fault_left > 0)
+        kinds, rows = self.fault_kind[active], self.fault_signal[active]
+        # Stuck sensors keep repeating the value read when the fault started
+        fresh = (kinds == FAULTS.index('stuck')) & (self.fault_age[active] == 0)
+        self.fault_value[active[fresh]] = readings[rows[fresh], active[fresh]]
+        values, ages = self.fault_value[active], self.fault_age[active]
+        for kind, change in (('stuck', lambda current, value, age: value),
+                             ('spike', lambda current, value, age: current + value),
+                             ('drift', lambda current, value, age: current + value * (age + 1)),
+                             ('dropout', lambda current, value, age: np.nan)):
+            mask = kinds == FAULTS.index(kind)
+            readings[rows[mask], active[mask]] = change(readings[rows[mask], active[mask]], values[mask], ages[mask])
+        self.fault_age[active] += 1
+        self.fault_left[active] -= 1
+        self.fault_kind[self.fault_left == 0] = -1
+    
+    def readings(self) -> list:
+        """Next cycle as one {signal: value} dict per device; None for missing values"""
+        rows = [np.round(row, decimals).tolist() for row, decimals in zip(self.step(), DECIMALS)]
+        return [{name: None if math.isnan(value) else (int(value) if decimals == 0 else value)
+                 for name, value, decimals in zip(SIGNALS, values, DECIMALS)}
+                for values in zip(*rows)]
+
 
 class SensorEmulator:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, transport=None):
         self.config = config
+        # Callable taking a reading and returning success; replaces the
+        # TCP round trip when the emulator runs inside the server process
+        self.transport = transport
+        self.udp_socket = None
+        
+        emulator = config.EMULATOR
+        # The seed fixes devices and signals, so a run can be replayed
+        self.seed = emulator.SEED or int(np.random.SeedSequence().entropy % 2 ** 32)
+        self.rng = np.random.default_rng(self.seed)
         self.devices = self.generate_devices()
+        self.signals = SignalGenerator(self.devices, self.rng, emulator.SEND_INTERVAL, emulator.DAY_LENGTH,
+                                       emulator.BATTERY_DAYS, emulator.FAULT_RATE)
+        print(f"Signal seed: {self.seed} - sensor_emulator.py:33")
         
     def generate_devices(self):
         """Generate list of emulated devices"""
@@ -19,11 +181,14 @@ class SensorEmulator:
             devices.append({
                 "device_id": f"SENSOR_{i+1:03d}",
                 "device_type": "temperature_humidity_sensor",
-                "location": random.choice(locations),
+                "location": str(self.rng.choice(locations)),
                 "temperature_range": (18.0, 28.0),
                 "humidity_range": (40.0, 80.0),
                 "light_range": (100, 1000),
-                "voltage_range": (3.2, 4.2)
+                "voltage_range": (3.2, 4.2),
+                # Sequence numbers start from the boot time in milliseconds,
+                # so they keep growing across emulator restarts
+                "seq": int(time.time() * 1000)
             })
         
         print(f"Created {len(devices)} virtual devices - sensor_emulator.py:29")
@@ -32,35 +197,40 @@ class SensorEmulator:
         
         return devices
     
-    def generate_sensor_data(self, device):
-        """Generate realistic sensor data"""
-        # Temperature with small random fluctuations
-        temp_base = random.uniform(*device['temperature_range'])
-        temperature = round(temp_base + random.uniform(-0.5, 0.5), 2)
-        
-        # Humidity with temperature correlation
-        humidity_base = random.uniform(*device['humidity_range'])
-        humidity = round(humidity_base + random.uniform(-2, 2), 2)
-        
-        # Light level (can be None for some sensors)
-        light_level = random.randint(*device['light_range'])
-        
-        # Battery voltage with gradual decrease
-        voltage = round(random.uniform(*device['voltage_range']), 2)
-        
-        return {
-            "device_id": device["device_id"],
-            "device_type": device["device_type"],
-            "location": device["location"],
-            "temperature": temperature,
-            "humidity": humidity,
-            "light_level": light_level,
-            "voltage": voltage,
-            "timestamp": datetime.now().isoformat()
-        }
+    def generate_readings(self):
+        """Generate one reading per device for the current cycle"""
+        timestamp = datetime.now().isoformat()
+        readings = []
+        for device, signals in zip(self.devices, self.signals.readings()):
+            device['seq'] += 1
+            readings.append({
+                "device_id": device["device_id"],
+                "device_type": device["device_type"],
+                "location": device["location"],
+                **signals,
+                "timestamp": timestamp,
+                "seq": device['seq']
+            })
+        return readings
     
     def send_data_to_server(self, data):
-        """Send data to server"""
+        """Send data to server, resending the same reading on failure"""
+        # The server drops repeated (device_id, seq) pairs, so a resend after
+        # a lost response does not store the reading twice
+        for attempt in range(1 + self.config.EMULATOR.SEND_RETRIES):
+            if self.send_once(data):
+                return True
+        return False
+    
+    def send_once(self, data):
+        """Single delivery attempt"""
+        if self.transport:
+            try:
+                return self.transport(data)
+            except Exception as e:
+                print(f"Error sending data: {e} - sensor_emulator.py:82")
+                return False
+        
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.settimeout(5)
@@ -82,21 +252,53 @@ class SensorEmulator:
             print(f"Error sending data: {e} - sensor_emulator.py:82")
             return False
     
+    def send_datagrams(self, readings):
+        """Send readings as binary datagrams, as many per datagram as fit.
+
+        Fire-and-forget: there is no reply and no retry, the server counts
+        what went missing from the sequence numbers.
+        """
+        if self.udp_socket is None:
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        address = (self.config.SERVER.HOST, self.config.SERVER.UDP_PORT)
+        
+        try:
+            chunk, size = [], HEADER.size
+            for data in readings:
+                record_size = len(encode_readings([data])) - HEADER.size
+                if chunk and (size + record_size > MAX_DATAGRAM or len(chunk) == 255):
+                    self.udp_socket.sendto(encode_readings(chunk), address)
+                    chunk, size = [], HEADER.size
+                chunk.append(data)
+                size += record_size
+            if chunk:
+                self.udp_socket.sendto(encode_readings(chunk), address)
+            return True
+            
+        except OSError as e:
+            print(f"Error sending datagram: {e} - sensor_emulator.py:82")
+            return False
+    
     def start_emulation(self):
         """Start microcontroller emulation"""
         print("Starting microcontroller emulation... - sensor_emulator.py:87")
-        print(f"Sending data to server {self.config.SERVER.HOST}:{self.config.SERVER.PORT} - sensor_emulator.py:88")
+        use_udp = self.transport is None and self.config.EMULATOR.TRANSPORT == 'udp'
+        port = self.config.SERVER.UDP_PORT if use_udp else self.config.SERVER.PORT
+        print(f"Sending data to server {self.config.SERVER.HOST}:{port} ({'udp' if use_udp else 'tcp'}) - sensor_emulator.py:88")
         print(f"Send interval: {self.config.EMULATOR.SEND_INTERVAL} seconds - sensor_emulator.py:89")
         print("Press Ctrl+C to stop\n - sensor_emulator.py:90")
         
         try:
             while True:
-                for device in self.devices:
-                    # Generate data
-                    sensor_data = self.generate_sensor_data(device)
-                    
+                # All devices are sampled in one step
+                readings = self.generate_readings()
+                if use_udp:
+                    # One burst of datagrams for the whole cycle
+                    sent = self.send_datagrams(readings)
+                
+                for device, sensor_data in zip(self.devices, readings):
                     # Send to server
-                    success = self.send_data_to_server(sensor_data)
+                    success = sent if use_udp else self.send_data_to_server(sensor_data)
                     
                     if success:
                         print(f"[{datetime.now().strftime('%H:%M:%S')}] {device['device_id']}: - sensor_emulator.py:102"
@@ -115,7 +317,7 @@ class SensorEmulator:
 
 def main():
     """Main emulator startup function"""
-    config = Config()
+    config = Config.load()
     config.setup_logging()
     emulator = SensorEmulator(config)
     emulator.start_emulation()
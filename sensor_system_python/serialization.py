@@ -0,0 +1,93 @@
+import json
+import time
+import sqlite3
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=str)
+
+# Static fragments of the success envelope, built once
+SUCCESS_HEAD = b'{"status":"success",'
+ARRAY_END = b']'
+OBJECT_END = b'}'
+
+
+_backend = None
+
+
+def _load_backend() -> Callable:
+    """Pick the encoder on first use; importing orjson is not free"""
+    global _backend
+    try:
+        import orjson
+        _backend = lambda obj: orjson.dumps(obj, default=str)
+    except ImportError:  # optional speed-up, stdlib json is used otherwise
+        _backend = lambda obj: _encoder.encode(obj).encode('utf-8')
+    return _backend
+
+
+def dumps(obj) -> bytes:
+    """Serialize to compact UTF-8 JSON, using orjson when it is installed"""
+    return (_backend or _load_backend())(obj)
+
+
+def rows_to_dicts(cursor: sqlite3.Cursor) -> List[Dict]:
+    """Materialize cursor rows as dicts keyed by column name"""
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def stream_rows(cursor: sqlite3.Cursor, key: str, limit: Optional[int] = None,
+                columnar: bool = False, extra: Optional[Callable[[int, Optional[Dict], bool], Dict]] = None,
+                batch_size: int = 256) -> Iterator[bytes]:
+    """Stream a success envelope with cursor rows straight into JSON.
+
+    Rows are encoded in batches as they are fetched. In columnar mode
+    the column names are sent once and every row is an array. `extra`
+    receives (row count, last row as dict, whether more rows exist) and
+    returns fields appended after the array, e.g. a pagination cursor.
+    """
+    columns = [column[0] for column in cursor.description]
+
+    yield SUCCESS_HEAD
+    if columnar:
+        yield b'"columns":' + dumps(columns) + b','
+    yield b'"' + key.encode('utf-8') + b'":['
+
+    count = 0
+    last = None
+    while limit is None or count < limit:
+        size = batch_size if limit is None else min(batch_size, limit - count)
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+
+        if columnar:
+            chunk = b','.join(dumps(list(row)) for row in rows)
+        else:
+            chunk = b','.join(dumps(dict(zip(columns, row))) for row in rows)
+        yield (b',' + chunk) if count else chunk
+
+        count += len(rows)
+        last = rows[-1]
+
+    has_more = limit is not None and count >= limit and cursor.fetchone() is not None
+    fields = extra(count, dict(zip(columns, last)) if last else None, has_more) if extra else {}
+    yield ARRAY_END
+    yield (b',' + dumps(fields)[1:]) if fields else OBJECT_END
+
+
+class CachedClock:
+    """ISO timestamps with one-second resolution, formatted once per second"""
+
+    def __init__(self):
+        self._cached = (None, None)
+
+    def isoformat(self) -> str:
+        second = int(time.time())
+        cached_second, value = self._cached
+        if second != cached_second:
+            value = datetime.fromtimestamp(second).isoformat()
+            # Single tuple assignment keeps readers from other threads consistent
+            self._cached = (second, value)
+        return value
\ No newline at end of file
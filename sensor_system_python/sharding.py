@@ -0,0 +1,158 @@
+import os
+import time
+import heapq
+import zlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+from database import DatabaseManager, DatabaseWriter, SENSOR_DATA_VIEW, ids_per_ms
+from replication import ChangeLog
+from profiling import connect
+
+# Tables split by device; everything else lives in the first shard only
+SHARDED_TABLES = ('sensor_readings', 'devices', 'sensor_chunks', 'archive_totals')
+
+# Seconds a reader stays behind the newest id when there are several
+# shards, so a reading committed late by one shard is not skipped
+SETTLE_SECONDS = 2.0
+
+
+def shard_paths(db_path: str, shards: int) -> List[str]:
+    """Database files of all shards; the first one is db_path itself"""
+    root, ext = os.path.splitext(db_path)
+    return [db_path] + [f'{root}.shard{k}{ext}' for k in range(1, shards)]
+
+
+def shard_for(device_id: str, shards: int) -> int:
+    return zlib.crc32(device_id.encode('utf-8')) % shards
+
+
+def attach_shards(conn: sqlite3.Connection, db_path: str, shards: int):
+    """Make the sharded tables of a first-shard connection span all shards.
+
+    TEMP views shadow the main tables for unqualified names, so existing
+    queries read every shard; SQLite merges ordered branches itself.
+    """
+    if shards == 1:
+        return
+    for k, path in enumerate(shard_paths(db_path, shards)[1:], 1):
+        conn.execute('ATTACH DATABASE ? AS ?', (path, f'shard{k}'))
+    for table in SHARDED_TABLES:
+        branches = ' UNION ALL '.join(
+            [f'SELECT * FROM main.{table}'] + [f'SELECT * FROM shard{k}.{table}' for k in range(1, shards)])
+        conn.execute(f'CREATE TEMP VIEW {table} AS {branches}')
+    conn.execute(f'CREATE TEMP VIEW sensor_data AS {SENSOR_DATA_VIEW}')
+
+
+def connect_all(db_path: str, shards: int) -> sqlite3.Connection:
+    """Read connection that sees the sharded tables of every shard"""
+    conn = connect(db_path)
+    attach_shards(conn, db_path, shards)
+    return conn
+
+
+def settled_id(shards: int) -> Optional[int]:
+    """Highest id a watermark reader may consume now, None with one shard.
+
+    A shard that outruns its share of ids per millisecond takes ids ahead
+    of the clock; its readings are then consumed late, never skipped.
+    """
+    if shards == 1:
+        return None
+    return int((time.time() - SETTLE_SECONDS) * 1000) * ids_per_ms(shards)
+
+
+class ShardedDatabase:
+    """Readings spread over several SQLite files by a hash of device_id.
+
+    Every shard has its own DatabaseWriter thread, so ingest for devices
+    on different shards commits in parallel. The first shard also holds
+    the device key catalog, alerts and rollups. Queries run on all
+    shards at once and their results are merged.
+    Exposes the same save and query methods as DatabaseManager.
+    """
+
+    def __init__(self, db_path: str, shards: int, pragmas: Optional[Dict[str, Any]] = None,
+                 max_batch: int = 256, flush_interval: float = 0.0, timeout: float = 5.0):
+        self.paths = shard_paths(db_path, shards)
+        catalog = DatabaseManager(self.paths[0], pragmas, shards=shards)
+        self.managers = [catalog] + [
+            DatabaseManager(path, pragmas, shard=k, shards=shards, catalog=catalog)
+            for k, path in enumerate(self.paths[1:], 1)
+        ]
+        self.writers = [DatabaseWriter(manager, max_batch, flush_interval, timeout) for manager in self.managers]
+        self.executor = ThreadPoolExecutor(max_workers=shards, thread_name_prefix='shard-query')
+        self.logger = self.managers[0].logger
+
+    def writer_for(self, device_id: str) -> DatabaseWriter:
+        return self.writers[shard_for(device_id, len(self.writers))]
+
+    def save_sensor_data(self, data: Dict) -> bool:
+        return self.writer_for(data['device_id']).save_sensor_data(data)
+
+    def save_sensor_data_batch(self, readings: List[Dict]) -> bool:
+        """Split a batch by shard and wait for all shards to commit"""
+        parts: Dict[int, List[Dict]] = {}
+        for data in readings:
+            parts.setdefault(shard_for(data['device_id'], len(self.writers)), []).append(data)
+        futures = [(self.writers[k], self.writers[k].submit('readings', part)) for k, part in parts.items()]
+        return all([writer.wait(future) for writer, future in futures])
+
+    def save_alerts(self, events: List[Dict]) -> bool:
+        return self.writers[0].save_alerts(events)
+
+    def scatter(self, method: str, *args) -> List:
+        """Call a DatabaseManager query on every shard in parallel"""
+        return list(self.executor.map(lambda manager: getattr(manager, method)(*args), self.managers))
+
+    def get_recent_data(self, device_id: Optional[str] = None, limit: int = 10) -> List[Dict]:
+        # Each shard returns its newest rows; a k-way merge keeps the newest overall
+        merged = heapq.merge(*self.scatter('get_recent_data', device_id, limit),
+                             key=lambda row: (row['ts'], row['id']), reverse=True)
+        return list(islice(merged, limit))
+
+    def get_device_statistics(self) -> List[Dict]:
+        # A device that moved shards has rows in both; combine them
+        devices: Dict[str, Dict] = {}
+        for row in (row for rows in self.scatter('get_device_statistics') for row in rows):
+            current = devices.get(row['device_id'])
+            if current is None:
+                devices[row['device_id']] = dict(row)
+                continue
+            total = current['record_count'] + row['record_count']
+            for name in ('avg_temperature', 'avg_humidity', 'avg_light_level'):
+                if current[name] is None or row[name] is None:
+                    current[name] = current[name] if row[name] is None else row[name]
+                else:
+                    current[name] = (current[name] * current['record_count'] + row[name] * row['record_count']) / total
+            current['first_record'] = min(current['first_record'], row['first_record'])
+            current['last_record'] = max(current['last_record'], row['last_record'])
+            current['record_count'] = total
+        return [devices[device_id] for device_id in sorted(devices)]
+
+    # Same CSV export, over the merged rows
+    export_to_csv = DatabaseManager.export_to_csv
+
+
+def open_database(config, group_commit: bool = False):
+    """Storage for the data server: one file or hash-sharded files.
+
+    With one shard this is a DatabaseManager, wrapped in a DatabaseWriter
+    when group_commit is set; several shards always use writer threads.
+    A single file can also log its commits for replicas.
+    """
+    db = config.DATABASE
+    if db.SHARDS > 1:
+        return ShardedDatabase(db.DB_PATH, db.SHARDS, db.PRAGMAS,
+                               max_batch=db.WRITE_BATCH_SIZE, flush_interval=db.FLUSH_INTERVAL,
+                               timeout=db.WRITE_TIMEOUT)
+    replication = config.REPLICATION
+    changelog = ChangeLog(replication.CHANGELOG_DIR, replication.SEGMENT_BYTES,
+                          replication.KEEP_SEGMENTS) if replication.CHANGELOG_DIR else None
+    manager = DatabaseManager(db.DB_PATH, db.PRAGMAS, changelog=changelog)
+    if group_commit:
+        return DatabaseWriter(manager, max_batch=db.WRITE_BATCH_SIZE,
+                              flush_interval=db.FLUSH_INTERVAL, timeout=db.WRITE_TIMEOUT)
+    return manager
\ No newline at end of file
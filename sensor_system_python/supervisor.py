@@ -0,0 +1,181 @@
+import os
+import sys
+import time
+import socket
+import logging
+import threading
+import subprocess
+import urllib.request
+from typing import Callable, List, Optional
+
+# Keeps child consoles hidden on Windows; the flag does not exist elsewhere
+CREATION_FLAGS = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+
+
+def port_probe(host: str, port: int, timeout: float = 0.5) -> Callable[[], bool]:
+    """Readiness probe: the TCP port accepts connections"""
+    def probe() -> bool:
+        try:
+            with socket.create_connection((host, port), timeout=timeout):
+                return True
+        except OSError:
+            return False
+    return probe
+
+
+def http_probe(url: str, timeout: float = 1.0) -> Callable[[], bool]:
+    """Readiness probe: the URL answers with HTTP 200"""
+    def probe() -> bool:
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                return response.status == 200
+        except (OSError, ValueError):
+            return False
+    return probe
+
+
+class ManagedProcess:
+    """A child Python script with drained output and a readiness probe"""
+
+    def __init__(self, name: str, script: str, readiness: Optional[Callable[[], bool]] = None,
+                 on_output: Optional[Callable[[str], None]] = None, cwd: Optional[str] = None):
+        self.name = name
+        self.script = script
+        self.readiness = readiness
+        self.on_output = on_output
+        self.cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.logger = logging.getLogger(f"{__name__}.{name}")
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Spawn the process and start draining its output"""
+        env = dict(os.environ, PYTHONUNBUFFERED='1')
+        self.process = subprocess.Popen(
+            [sys.executable, self.script],
+            cwd=self.cwd,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=1,
+            creationflags=CREATION_FLAGS
+        )
+        self.started_at = time.monotonic()
+        threading.Thread(target=self._drain, args=(self.process,), daemon=True).start()
+        self.logger.info(f"Started {self.script} (pid {self.process.pid})")
+
+    def _drain(self, process: subprocess.Popen):
+        """Read child output continuously so it never blocks on a full pipe"""
+        for line in process.stdout:
+            line = line.rstrip()
+            if self.on_output:
+                self.on_output(f"[{self.name}] {line}")
+            else:
+                self.logger.info(line)
+        process.stdout.close()
+
+    def wait_ready(self, timeout: float = 15.0, interval: float = 0.1) -> bool:
+        """Block until the readiness probe passes, the process dies or time runs out"""
+        if self.readiness is None:
+            return self.running
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.running:
+                return False
+            if self.readiness():
+                self.logger.info(f"Ready after {time.monotonic() - self.started_at:.2f}s")
+                return True
+            time.sleep(interval)
+
+        self.logger.error(f"Not ready after {timeout}s")
+        return False
+
+    def stop(self, timeout: float = 5.0):
+        """Terminate gracefully, kill if the process does not exit in time"""
+        if not self.running:
+            self.process = None
+            return
+
+        self.process.terminate()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.logger.warning("Did not stop in time, killing")
+            self.process.kill()
+            self.process.wait()
+        self.logger.info("Stopped")
+        self.process = None
+
+
+class Supervisor:
+    """Starts managed processes in order and restarts them when they crash.
+
+    Each process is started only after the previous one passed its
+    readiness probe. A crashed process is restarted with exponential
+    backoff; the backoff resets once it has stayed up for `stable_after`.
+    """
+
+    def __init__(self, check_interval: float = 1.0, max_backoff: float = 30.0,
+                 stable_after: float = 60.0, ready_timeout: float = 15.0):
+        self.processes: List[ManagedProcess] = []
+        self.check_interval = check_interval
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.ready_timeout = ready_timeout
+        self.stop_event = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    def add(self, process: ManagedProcess) -> ManagedProcess:
+        self.processes.append(process)
+        return process
+
+    def start_all(self) -> bool:
+        """Start every process in order, waiting for each one to be ready"""
+        for process in self.processes:
+            process.start()
+            if not process.wait_ready(self.ready_timeout):
+                self.logger.error(f"{process.name} failed to become ready")
+                return False
+        return True
+
+    def check(self):
+        """Restart processes that exited, honouring their backoff"""
+        now = time.monotonic()
+        for process in self.processes:
+            if self.stop_event.is_set():
+                return
+            if process.running:
+                if process.restarts and now - process.started_at > self.stable_after:
+                    process.restarts = 0
+                continue
+
+            backoff = min(self.max_backoff, 2 ** process.restarts)
+            if now - process.started_at < backoff:
+                continue
+
+            code = process.process.returncode if process.process else None
+            self.logger.warning(f"{process.name} exited with code {code}, restarting")
+            process.restarts += 1
+            process.start()
+            process.wait_ready(self.ready_timeout)
+
+    def watch(self):
+        """Supervise until stop() is called"""
+        while not self.stop_event.wait(self.check_interval):
+            self.check()
+
+    def stop(self):
+        """Stop supervising and shut processes down in reverse start order"""
+        self.stop_event.set()
+        for process in reversed(self.processes):
+            process.stop()
\ No newline at end of file
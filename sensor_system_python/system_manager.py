@@ -4,10 +4,213 @@ from tkinter import ttk, messagebox, scrolledtext
 import threading
 import time
 import sqlite3
-import subprocess
 import sys
 import os
+import queue
+import json
+import logging
+import socket
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from config import Config
+from supervisor import ManagedProcess, port_probe, http_probe
+from database import DEVICE_TOTALS
+from sharding import SHARDED_TABLES, connect_all, shard_paths
+
+class VirtualDataGrid:
+    """Таблица записей с подгрузкой страниц при прокрутке.
+    
+    Новые записи добавляются сверху по идентификатору последней показанной,
+    старые подгружаются страницами, когда прокрутка доходит до конца.
+    Запросы выполняются через run_async вне главного потока Tk.
+    """
+    
+    COLUMNS = ("ID", "Устройство", "Температура", "Влажность", "Свет", "Время")
+    SELECT = 'SELECT id, device_id, temperature, humidity, light_level, timestamp FROM sensor_data'
+    
+    def __init__(self, parent, db_path, run_async, page_size=100, max_rows=1000, height=10, shards=1):
+        self.db_path = db_path
+        self.shards = shards
+        self.run_async = run_async
+        self.page_size = page_size
+        self.max_rows = max_rows
+        
+        self.newest_id = None
+        self.oldest_id = None
+        self.has_more = True
+        self.loading = False
+        # Поколение отбрасывает результаты запросов, начатых до reset()
+        self.generation = 0
+        
+        self.tree = ttk.Treeview(parent, columns=self.COLUMNS, show="headings", height=height)
+        for col in self.COLUMNS:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=100)
+        
+        self.scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.tree.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(fill=tk.BOTH, expand=True)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+    
+    def fetch(self, condition='', params=(), order='DESC'):
+        """Выборка страницы записей (выполняется в фоновом потоке)"""
+        conn = connect_all(self.db_path, self.shards)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'{self.SELECT} {condition} ORDER BY id {order} LIMIT ?',
+                           (*params, self.page_size))
+            return cursor.fetchall()
+        finally:
+            conn.close()
+    
+    def refresh_new(self):
+        """Подгрузка записей новее последней показанной"""
+        if self.loading:
+            return
+        self.loading = True
+        
+        if self.newest_id is None:
+            self.run_async(self.fetch, self.guarded(self.on_first_page))
+        else:
+            newest_id = self.newest_id
+            self.run_async(lambda: self.fetch('WHERE id > ?', (newest_id,), 'ASC'),
+                           self.guarded(self.on_new_rows))
+    
+    def load_older(self):
+        """Подгрузка следующей страницы более старых записей"""
+        if self.loading or not self.has_more or self.oldest_id is None:
+            return
+        self.loading = True
+        oldest_id = self.oldest_id
+        self.run_async(lambda: self.fetch('WHERE id < ?', (oldest_id,)), self.guarded(self.on_older_rows))
+    
+    def guarded(self, callback):
+        """Обертка, игнорирующая результат, если таблица была сброшена или закрыта"""
+        generation = self.generation
+        def apply(rows):
+            # Окно с таблицей могли закрыть, пока шел запрос
+            if generation == self.generation and self.tree.winfo_exists():
+                callback(rows)
+        return apply
+    
+    def on_scroll(self, first, last):
+        """Обработчик прокрутки: у конца списка подгружаем старые записи"""
+        self.scrollbar.set(first, last)
+        if float(last) > 0.9:
+            self.load_older()
+    
+    def on_first_page(self, rows):
+        self.loading = False
+        if rows is None:
+            return
+        for row in rows:
+            self.tree.insert("", tk.END, iid=row[0], values=row)
+        if rows:
+            self.newest_id = rows[0][0]
+            self.oldest_id = rows[-1][0]
+        self.has_more = len(rows) == self.page_size
+    
+    def on_new_rows(self, rows):
+        self.loading = False
+        if not rows:
+            return
+        # Строки пришли по возрастанию id, каждая вставляется наверх
+        for row in rows:
+            self.tree.insert("", 0, iid=row[0], values=row)
+        self.newest_id = rows[-1][0]
+        if self.oldest_id is None:
+            self.oldest_id = rows[0][0]
+        self.trim()
+    
+    def on_older_rows(self, rows):
+        self.loading = False
+        if rows is None:
+            return
+        for row in rows:
+            self.tree.insert("", tk.END, iid=row[0], values=row)
+        if rows:
+            self.oldest_id = rows[-1][0]
+        self.has_more = len(rows) == self.page_size
+    
+    def trim(self):
+        """Ограничение числа строк в таблице: лишние снизу удаляются"""
+        if not self.max_rows:
+            return
+        children = self.tree.get_children()
+        if len(children) > self.max_rows:
+            self.tree.delete(*children[self.max_rows:])
+            self.oldest_id = int(children[self.max_rows - 1])
+            self.has_more = True
+    
+    def reset(self):
+        """Очистка таблицы и повторная загрузка"""
+        self.generation += 1
+        self.tree.delete(*self.tree.get_children())
+        self.newest_id = None
+        self.oldest_id = None
+        self.has_more = True
+        self.loading = False
+        self.refresh_new()
+
+class StatusMonitor:
+    """Фоновый опрос состояния компонентов.
+    
+    Раз в цикл параллельно проверяет порты и запрашивает /api/health
+    веб-интерфейса. Результат передается в on_update; сам монитор
+    виджетов Tk не касается.
+    """
+    
+    def __init__(self, ports, health_url, on_update, interval=2.0, timeout=0.5):
+        self.ports = ports
+        self.health_url = health_url
+        self.on_update = on_update
+        self.interval = interval
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=len(ports) + 1, thread_name_prefix="probe")
+        self.stop_event = threading.Event()
+        # Последний результат опроса
+        self.snapshot = {'ports': {port: False for port in ports}, 'health': None}
+    
+    def probe_port(self, port):
+        """Проверка доступности порта"""
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                return sock.connect_ex(('localhost', port)) == 0
+        except OSError:
+            return False
+    
+    def fetch_health(self):
+        """Получение метрик веб-интерфейса (None, если он недоступен)"""
+        try:
+            with urllib.request.urlopen(self.health_url, timeout=self.timeout * 2) as response:
+                return json.loads(response.read()).get('health')
+        except (OSError, ValueError):
+            return None
+    
+    def poll_once(self):
+        """Один цикл опроса: все проверки выполняются одновременно"""
+        port_futures = {port: self.executor.submit(self.probe_port, port) for port in self.ports}
+        health_future = self.executor.submit(self.fetch_health)
+        
+        self.snapshot = {
+            'ports': {port: future.result() for port, future in port_futures.items()},
+            'health': health_future.result(),
+            'checked_at': datetime.now()
+        }
+        return self.snapshot
+    
+    def run(self):
+        while not self.stop_event.is_set():
+            self.on_update(self.poll_once())
+            self.stop_event.wait(self.interval)
+    
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+    
+    def stop(self):
+        self.stop_event.set()
 
 class SensorSystemManager:
     def __init__(self, root):
@@ -15,17 +218,42 @@ class SensorSystemManager:
         self.root.title("Sensor Data System Manager")
         self.root.geometry("800x600")
         
-        # Переменные для хранения процессов
-        self.server_process = None
-        self.emulator_process = None
-        self.web_process = None
+        # Порты, путь к БД и интервалы берутся из общей конфигурации
+        self.config = Config.load()
+        self.server_port = self.config.SERVER.PORT
+        self.web_port = self.config.WEB.PORT
+        self.db_path = self.config.DATABASE.DB_PATH
+        self.shards = self.config.DATABASE.SHARDS
+        self.web_url = f"http://localhost:{self.web_port}"
+        
+        # Процессы компонентов; их вывод читается постоянно и попадает в лог
+        self.server_process = ManagedProcess(
+            'server', 'data_server.py',
+            readiness=port_probe('localhost', self.server_port),
+            on_output=self.post_log
+        )
+        self.emulator_process = ManagedProcess(
+            'emulator', 'sensor_emulator.py',
+            on_output=self.post_log
+        )
+        self.web_process = ManagedProcess(
+            'web', 'web_interface.py',
+            readiness=http_probe(f"{self.web_url}/api/health"),
+            on_output=self.post_log
+        )
         
         # Статусы компонентов
         self.server_running = False
         self.emulator_running = False
         self.web_running = False
         
+        # Работа с БД выполняется в отдельном потоке, результаты
+        # передаются в главный поток Tk через очередь
+        self.db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+        self.ui_queue = queue.Queue()
+        
         self.setup_ui()
+        self.process_ui_queue()
         self.start_status_monitor()
         
     def setup_ui(self):
@@ -81,7 +309,7 @@ class SensorSystemManager:
         # Сервер данных
         server_frame = ttk.Frame(button_frame)
         server_frame.pack(fill=tk.X, pady=2)
-        ttk.Label(server_frame, text="Сервер данных (порт 8080):").pack(side=tk.LEFT)
+        ttk.Label(server_frame, text=f"Сервер данных (порт {self.server_port}):").pack(side=tk.LEFT)
         ttk.Button(server_frame, text="Запуск", command=self.start_server).pack(side=tk.LEFT, padx=5)
         ttk.Button(server_frame, text="Остановка", command=self.stop_server).pack(side=tk.LEFT, padx=5)
         
@@ -95,7 +323,7 @@ class SensorSystemManager:
         # Веб-интерфейс
         web_frame = ttk.Frame(button_frame)
         web_frame.pack(fill=tk.X, pady=2)
-        ttk.Label(web_frame, text="Веб-интерфейс (порт 5000):").pack(side=tk.LEFT)
+        ttk.Label(web_frame, text=f"Веб-интерфейс (порт {self.web_port}):").pack(side=tk.LEFT)
         ttk.Button(web_frame, text="Запуск", command=self.start_web).pack(side=tk.LEFT, padx=5)
         ttk.Button(web_frame, text="Остановка", command=self.stop_web).pack(side=tk.LEFT, padx=5)
         
@@ -156,20 +384,41 @@ class SensorSystemManager:
         data_frame = ttk.LabelFrame(parent, text="Просмотр данных", padding=10)
         data_frame.pack(fill=tk.BOTH, expand=True, pady=5)
         
-        # Таблица данных
-        columns = ("ID", "Устройство", "Температура", "Влажность", "Свет", "Время")
-        self.data_tree = ttk.Treeview(data_frame, columns=columns, show="headings", height=10)
-        
-        for col in columns:
-            self.data_tree.heading(col, text=col)
-            self.data_tree.column(col, width=100)
-        
-        self.data_tree.pack(fill=tk.BOTH, expand=True)
+        # Таблица данных с подгрузкой при прокрутке
+        self.data_grid = VirtualDataGrid(data_frame, self.db_path, self.run_async,
+                                         page_size=50, max_rows=500, shards=self.shards)
+        self.data_tree = self.data_grid.tree
+    
+    def run_async(self, func, callback):
+        """Выполнение func в потоке БД; callback(result) вызывается в главном потоке Tk"""
+        def done(future):
+            try:
+                result = future.result()
+            except Exception:
+                # Если база данных еще не создана, передаем пустой результат
+                result = None
+            self.ui_queue.put((callback, result))
         
-        # Прокрутка для таблицы
-        scrollbar = ttk.Scrollbar(data_frame, orient=tk.VERTICAL, command=self.data_tree.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.data_tree.configure(yscrollcommand=scrollbar.set)
+        self.db_executor.submit(func).add_done_callback(done)
+    
+    def process_ui_queue(self):
+        """Выполнение в главном потоке обратных вызовов из фоновых потоков"""
+        try:
+            while True:
+                callback, result = self.ui_queue.get_nowait()
+                # Ошибка одного обратного вызова не должна останавливать очередь
+                try:
+                    callback(result)
+                except Exception:
+                    logging.exception("UI callback failed")
+        except queue.Empty:
+            pass
+        finally:
+            self.root.after(50, self.process_ui_queue)
+    
+    def post_log(self, message):
+        """Добавление сообщения в лог из фонового потока"""
+        self.ui_queue.put((self.log_message, message))
     
     def log_message(self, message):
         """Добавление сообщения в лог"""
@@ -181,16 +430,19 @@ class SensorSystemManager:
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
     
-    def update_status(self):
-        """Обновление статусов компонентов"""
+    def update_status(self, snapshot):
+        """Обновление статусов компонентов по результату опроса"""
+        server_up = snapshot['ports'].get(self.server_port)
+        web_up = snapshot['ports'].get(self.web_port)
+        
         # Сервер данных
-        server_color = "green" if self.check_port(8080) else "red"
-        server_text = "✅ Сервер данных: Запущен" if self.check_port(8080) else "❌ Сервер данных: Остановлен"
+        server_color = "green" if server_up else "red"
+        server_text = "✅ Сервер данных: Запущен" if server_up else "❌ Сервер данных: Остановлен"
         self.server_status.config(text=server_text, fg=server_color)
         
         # Веб-интерфейс
-        web_color = "green" if self.check_port(5000) else "red"
-        web_text = "✅ Веб-интерфейс: Запущен" if self.check_port(5000) else "❌ Веб-интерфейс: Остановлен"
+        web_color = "green" if web_up else "red"
+        web_text = "✅ Веб-интерфейс: Запущен" if web_up else "❌ Веб-интерфейс: Остановлен"
         self.web_status.config(text=web_text, fg=web_color)
         
         # Эмулятор (проверяем по наличию процесса)
@@ -200,7 +452,6 @@ class SensorSystemManager:
     
     def check_port(self, port):
         """Проверка доступности порта"""
-        import socket
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
                 sock.settimeout(1)
@@ -211,40 +462,39 @@ class SensorSystemManager:
     
     def start_status_monitor(self):
         """Запуск мониторинга статуса"""
-        def monitor():
-            while True:
-                self.update_status()
-                self.update_statistics()
-                self.update_data_view()
-                time.sleep(2)
-        
-        monitor_thread = threading.Thread(target=monitor, daemon=True)
-        monitor_thread.start()
+        # Результаты опроса применяются к виджетам только в главном потоке
+        self.monitor = StatusMonitor(
+            [self.server_port, self.web_port],
+            f"{self.web_url}/api/health",
+            lambda snapshot: self.ui_queue.put((self.apply_status, snapshot)),
+            interval=self.config.WEB.STATUS_INTERVAL
+        )
+        self.monitor.start()
+    
+    def apply_status(self, snapshot):
+        """Обновление интерфейса по результату цикла мониторинга"""
+        self.update_status(snapshot)
+        self.update_statistics(snapshot)
+        self.update_data_view()
     
-    def update_statistics(self):
-        """Обновление статистики"""
+    def update_statistics(self, snapshot):
+        """Обновление статистики по метрикам веб-интерфейса"""
         try:
-            conn = sqlite3.connect('data/sensor_data.db')
-            cursor = conn.cursor()
-            
-            # Общая статистика
-            cursor.execute("SELECT COUNT(*) FROM sensor_data")
-            total_records = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(DISTINCT device_id) FROM sensor_data")
-            device_count = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT MAX(timestamp) FROM sensor_data")
-            last_record = cursor.fetchone()[0]
-            
-            conn.close()
+            health = snapshot['health']
+            server_up = snapshot['ports'].get(self.server_port)
+            web_up = snapshot['ports'].get(self.web_port)
+            
+            if health:
+                stats_text = f"""Общая статистика:
+• Всего записей: {health['total_records']}
+• Устройств: {health['device_count']} (молчат: {health['stale_devices']})
+• Последняя запись: {health['last_record'] or 'Нет данных'}"""
+            else:
+                stats_text = "Статистика недоступна: веб-интерфейс не отвечает"
             
-            stats_text = f"""Общая статистика:
-• Всего записей: {total_records}
-• Устройств: {device_count}
-• Последняя запись: {last_record or 'Нет данных'}
-• Сервер данных: {'✅ Запущен' if self.check_port(8080) else '❌ Остановлен'}
-• Веб-интерфейс: {'✅ Запущен' if self.check_port(5000) else '❌ Остановлен'}"""
+            stats_text += f"""
+• Сервер данных: {'✅ Запущен' if server_up else '❌ Остановлен'}
+• Веб-интерфейс: {'✅ Запущен' if web_up else '❌ Остановлен'}"""
             
             self.stats_text.config(state=tk.NORMAL)
             self.stats_text.delete(1.0, tk.END)
@@ -258,44 +508,16 @@ class SensorSystemManager:
             self.stats_text.config(state=tk.DISABLED)
     
     def update_data_view(self):
-        """Обновление таблицы данных"""
-        try:
-            conn = sqlite3.connect('data/sensor_data.db')
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT id, device_id, temperature, humidity, light_level, timestamp 
-                FROM sensor_data 
-                ORDER BY timestamp DESC 
-                LIMIT 50
-            ''')
-            
-            # Очищаем таблицу
-            for item in self.data_tree.get_children():
-                self.data_tree.delete(item)
-            
-            # Добавляем данные
-            for row in cursor.fetchall():
-                self.data_tree.insert("", tk.END, values=row)
-            
-            conn.close()
-            
-        except Exception as e:
-            # Если база данных еще не создана, пропускаем ошибку
-            pass
+        """Обновление таблицы данных: добавляются только новые записи"""
+        self.data_grid.refresh_new()
     
     # === МЕТОДЫ УПРАВЛЕНИЯ ===
     
     def start_server(self):
         """Запуск сервера данных"""
         try:
-            if not self.check_port(8080):
-                self.server_process = subprocess.Popen(
-                    [sys.executable, "data_server.py"],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    creationflags=subprocess.CREATE_NO_WINDOW
-                )
+            if not self.check_port(self.server_port):
+                self.server_process.start()
                 self.log_message("Сервер данных запускается...")
                 self.server_running = True
             else:
@@ -306,9 +528,7 @@ class SensorSystemManager:
     def stop_server(self):
         """Остановка сервера данных"""
         try:
-            if self.server_process:
-                self.server_process.terminate()
-                self.server_process = None
+            self.server_process.stop()
             self.log_message("Сервер данных остановлен")
             self.server_running = False
         except Exception as e:
@@ -317,12 +537,7 @@ class SensorSystemManager:
     def start_emulator(self):
         """Запуск эмулятора"""
         try:
-            self.emulator_process = subprocess.Popen(
-                [sys.executable, "sensor_emulator.py"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                creationflags=subprocess.CREATE_NO_WINDOW
-            )
+            self.emulator_process.start()
             self.log_message("Эмулятор запущен")
             self.emulator_running = True
         except Exception as e:
@@ -331,9 +546,7 @@ class SensorSystemManager:
     def stop_emulator(self):
         """Остановка эмулятора"""
         try:
-            if self.emulator_process:
-                self.emulator_process.terminate()
-                self.emulator_process = None
+            self.emulator_process.stop()
             self.log_message("Эмулятор остановлен")
             self.emulator_running = False
         except Exception as e:
@@ -342,13 +555,8 @@ class SensorSystemManager:
     def start_web(self):
         """Запуск веб-интерфейса"""
         try:
-            if not self.check_port(5000):
-                self.web_process = subprocess.Popen(
-                    [sys.executable, "web_interface.py"],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    creationflags=subprocess.CREATE_NO_WINDOW
-                )
+            if not self.check_port(self.web_port):
+                self.web_process.start()
                 self.log_message("Веб-интерфейс запускается...")
                 self.web_running = True
             else:
@@ -359,9 +567,7 @@ class SensorSystemManager:
     def stop_web(self):
         """Остановка веб-интерфейса"""
         try:
-            if self.web_process:
-                self.web_process.terminate()
-                self.web_process = None
+            self.web_process.stop()
             self.log_message("Веб-интерфейс остановлен")
             self.web_running = False
         except Exception as e:
@@ -370,11 +576,25 @@ class SensorSystemManager:
     def start_all(self):
         """Запуск всех компонентов"""
         self.log_message("Запуск всех компонентов системы...")
-        self.start_server()
-        time.sleep(2)
-        self.start_emulator()
-        time.sleep(1)
-        self.start_web()
+        # Следующий компонент запускается по готовности предыдущего,
+        # ожидание идет в фоне, чтобы не блокировать интерфейс
+        threading.Thread(target=self.start_all_ordered, daemon=True).start()
+    
+    def start_all_ordered(self):
+        """Последовательный запуск с проверками готовности (фоновый поток)"""
+        steps = [
+            (self.server_process, self.start_server, "Сервер данных"),
+            (self.web_process, self.start_web, "Веб-интерфейс"),
+            (self.emulator_process, self.start_emulator, "Эмулятор"),
+        ]
+        for process, start, title in steps:
+            done = threading.Event()
+            self.ui_queue.put((lambda _, start=start: (start(), done.set()), None))
+            done.wait()
+            if process.running and not process.wait_ready():
+                self.post_log(f"{title} не готов, запуск остановлен")
+                return
+            self.post_log(f"{title} готов")
     
     def stop_all(self):
         """Остановка всех компонентов"""
@@ -386,29 +606,30 @@ class SensorSystemManager:
     def open_web_interface(self):
         """Открытие веб-интерфейса в браузере"""
         import webbrowser
-        webbrowser.open("http://localhost:5000")
+        webbrowser.open(self.web_url)
         self.log_message("Открытие веб-интерфейса в браузере")
     
     def show_statistics(self):
         """Показать подробную статистику"""
         try:
-            conn = sqlite3.connect('data/sensor_data.db')
+            conn = connect_all(self.db_path, self.shards)
             cursor = conn.cursor()
             
-            cursor.execute("SELECT COUNT(*) FROM sensor_data")
-            total = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(DISTINCT device_id) FROM devices")
+            # DISTINCT по индексу первичного ключа, без временного B-дерева
+            cursor.execute("SELECT COUNT(*) FROM (SELECT DISTINCT device_id FROM devices)")
             devices = cursor.fetchone()[0]
             
-            cursor.execute('''
-                SELECT device_id, COUNT(*) as count 
-                FROM sensor_data 
-                GROUP BY device_id
+            # Число записей вместе с архивированными
+            cursor.execute(f'''
+                SELECT k.device_id, s.record_count
+                FROM ({DEVICE_TOTALS}) s JOIN device_keys k ON k.device_key = s.device_key
+                ORDER BY k.device_id
             ''')
             
+            total = 0
             device_stats = ""
             for device_id, count in cursor.fetchall():
+                total += count
                 device_stats += f"  {device_id}: {count} записей\n"
             
             conn.close()
@@ -427,30 +648,17 @@ class SensorSystemManager:
     def show_all_records(self):
         """Показать все записи"""
         try:
-            conn = sqlite3.connect('data/sensor_data.db')
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT id, device_id, temperature, humidity, light_level, timestamp 
-                FROM sensor_data 
-                ORDER BY timestamp DESC
-            ''')
-            
-            records = cursor.fetchall()
-            conn.close()
-            
-            # Создаем окно с записями
+            # Создаем окно с записями; страницы подгружаются при прокрутке
             records_window = tk.Toplevel(self.root)
             records_window.title("Все записи базы данных")
             records_window.geometry("900x500")
             
-            text_widget = scrolledtext.ScrolledText(records_window, width=100, height=25)
-            text_widget.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-            
-            for record in records:
-                text_widget.insert(tk.END, f"{record}\n")
+            frame = ttk.Frame(records_window, padding=10)
+            frame.pack(fill=tk.BOTH, expand=True)
             
-            text_widget.config(state=tk.DISABLED)
+            records_grid = VirtualDataGrid(frame, self.db_path, self.run_async,
+                                           page_size=200, max_rows=None, height=25, shards=self.shards)
+            records_grid.refresh_new()
             
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось загрузить записи: {e}")
@@ -460,7 +668,7 @@ class SensorSystemManager:
         try:
             import csv
             
-            conn = sqlite3.connect('data/sensor_data.db')
+            conn = connect_all(self.db_path, self.shards)
             cursor = conn.cursor()
             
             cursor.execute('SELECT * FROM sensor_data')
@@ -470,14 +678,17 @@ class SensorSystemManager:
             cursor.execute('PRAGMA table_info(sensor_data)')
             columns = [column[1] for column in cursor.fetchall()]
             
-            conn.close()
-            
-            # Сохраняем в файл
+            # Сохраняем в файл; архивированные записи (без id и seq) идут первыми
+            from archive import archived_rows
             filename = f"sensor_data_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            with open(filename, 'w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow(columns)
-                writer.writerows(data)
+            try:
+                with open(filename, 'w', newline='', encoding='utf-8') as file:
+                    writer = csv.writer(file)
+                    writer.writerow(columns)
+                    writer.writerows(archived_rows(conn))
+                    writer.writerows(data)
+            finally:
+                conn.close()
             
             self.log_message(f"Данные экспортированы в {filename}")
             messagebox.showinfo("Экспорт", f"Данные успешно экспортированы в {filename}")
@@ -487,18 +698,29 @@ class SensorSystemManager:
     
     def clear_database(self):
         """Очистка базы данных"""
+        if self.config.REPLICATION.CHANGELOG_DIR:
+            # Удаление мимо журнала изменений разошлось бы с репликами
+            messagebox.showerror("Ошибка", "Очистка недоступна, пока включен журнал изменений "
+                                           "(replication.changelog_dir)")
+            return
         if messagebox.askyesno("Подтверждение", "Вы уверены, что хотите очистить всю базу данных?"):
             try:
-                conn = sqlite3.connect('data/sensor_data.db')
-                cursor = conn.cursor()
-                
-                cursor.execute('DELETE FROM sensor_data')
-                cursor.execute('DELETE FROM devices')
+                for path in shard_paths(self.db_path, self.shards):
+                    conn = sqlite3.connect(path)
+                    for table in SHARDED_TABLES:
+                        conn.execute(f'DELETE FROM {table}')
+                    conn.commit()
+                    conn.close()
                 
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM sensor_rollups')
+                cursor.execute('DELETE FROM rollup_state')
                 conn.commit()
                 conn.close()
                 
                 self.log_message("База данных очищена")
+                self.data_grid.reset()
                 messagebox.showinfo("Успех", "База данных успешно очищена")
                 
             except Exception as e:
@@ -0,0 +1,202 @@
+# test_compression.py - Round trips of compressed reading blocks
+#
+# Encodes blocks with unusual floats and timestamps, decodes them again
+# and compares the float64 bit patterns, so NaN, -0.0 and subnormals
+# must come back exactly. Also covers late readings merged into an
+# archived chunk. Run with: python -m pytest -q test_compression.py
+import sqlite3
+
+import numpy as np
+import pytest
+
+from archive import archive_rows
+from compression import HEADER, METRICS, VERSION, decode_block, encode_block
+from database import DatabaseManager
+
+SPECIAL = [
+    0.0, -0.0, float('nan'), float('inf'), float('-inf'),
+    5e-324, -5e-324, 2.2250738585072014e-308 / 3, 2.2250738585072014e-308,
+    1.7976931308623157e+308, -1.7976931308623157e+308, 1.0, -1.0, 21.5,
+]
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+
+def bits(values):
+    return np.asarray(values, dtype='<f8').view('<u8')
+
+
+def round_trip(timestamps, columns):
+    block = decode_block(encode_block(timestamps, columns))
+    assert block['ts'].dtype == np.int64
+    assert block['ts'].tolist() == list(timestamps)
+    for metric in METRICS:
+        expected = [np.nan if value is None else value for value in columns[metric]]
+        np.testing.assert_array_equal(bits(block[metric]), bits(expected), err_msg=metric)
+    return block
+
+
+def same(values):
+    return {metric: values for metric in METRICS}
+
+
+def test_special_floats():
+    round_trip(list(range(len(SPECIAL))), same(SPECIAL))
+
+
+def test_special_floats_in_every_order():
+    rng = np.random.default_rng(7)
+    for _ in range(50):
+        values = rng.permutation(np.array(SPECIAL * 3)).tolist()
+        round_trip(list(range(0, 1000 * len(values), 1000)), same(values))
+
+
+def test_signed_zero_is_kept():
+    block = round_trip([1, 2, 3, 4], same([0.0, -0.0, -0.0, 0.0]))
+    assert np.signbit(block['temperature']).tolist() == [False, True, True, False]
+
+
+def test_nan_payloads_are_kept():
+    quiet, other = np.array([0x7FF8000000000000, 0x7FF8000000000001], dtype='<u8').view('<f8')
+    round_trip([0, 1, 2], same([quiet, other, quiet]))
+
+
+def test_missing_values_become_nan():
+    block = round_trip([0, 1, 2], same([None, 1.5, None]))
+    assert np.isnan(block['voltage']).tolist() == [True, False, True]
+
+
+@pytest.mark.parametrize('timestamps', [
+    [1_767_225_600_000],
+    [0, 1, 2, 3],
+    [-86_400_000, -1, 0, 1],
+    [-2 ** 62, -2 ** 62 + 1000, -2 ** 62 + 2000],
+    [2 ** 62, 2 ** 62 + 1000, 2 ** 62 + 3000, 2 ** 62 + 3000],
+    [INT64_MIN, 0, INT64_MAX],
+    [INT64_MAX, INT64_MIN, INT64_MAX],
+    [INT64_MIN, INT64_MIN + 1, INT64_MAX - 1, INT64_MAX],
+], ids=['single', 'epoch', 'negative', 'large-negative', 'large', 'int64-range',
+        'int64-swing', 'int64-edges'])
+def test_timestamps(timestamps):
+    round_trip(timestamps, same([20.0] * len(timestamps)))
+
+
+def test_every_delta_of_delta_bucket():
+    # Delta changes around the edges of the 7, 9, 12 and 64 bit buckets
+    changes = [0, 63, -64, 64, -65, 255, -256, 256, -257, 2047, -2048, 2048, -2049, 2 ** 40, -2 ** 40]
+    timestamps = [1_767_225_600_000]
+    delta = 1000
+    for change in changes:
+        delta += change
+        timestamps.append(timestamps[-1] + delta)
+    round_trip(timestamps, same(np.linspace(-40.0, 85.0, len(timestamps)).tolist()))
+
+
+def test_single_point_block():
+    block = round_trip([1_767_225_600_123], {
+        'temperature': [float('nan')], 'humidity': [-0.0], 'light_level': [5e-324], 'voltage': [None]})
+    assert len(block['ts']) == 1
+
+
+def test_random_walk():
+    rng = np.random.default_rng(42)
+    count = 5000
+    timestamps = (1_767_225_600_000 + np.cumsum(rng.integers(900, 1100, count))).tolist()
+    columns = {
+        'temperature': np.round(20 + np.cumsum(rng.normal(0, 0.1, count)), 2).tolist(),
+        'humidity': np.round(50 + np.cumsum(rng.normal(0, 0.2, count)), 2).tolist(),
+        'light_level': rng.integers(0, 1000, count).astype(float).tolist(),
+        'voltage': np.where(rng.random(count) < 0.05, np.nan, 3.3 - np.arange(count) * 1e-5).tolist(),
+    }
+    round_trip(timestamps, columns)
+
+
+def test_invalid_blocks():
+    with pytest.raises(ValueError):
+        encode_block([], same([]))
+    with pytest.raises(ValueError):
+        encode_block([1, 2], same([1.0]))
+
+    data = encode_block([1, 2, 3], same([1.0, 2.0, 3.0]))
+    with pytest.raises(ValueError):
+        decode_block(data[:HEADER.size - 1])
+    with pytest.raises(ValueError):
+        decode_block(data[:-4])
+    with pytest.raises(ValueError):
+        decode_block(bytes([VERSION + 1]) + data[1:])
+
+
+CHUNK_MS = 3_600_000
+CHUNK_START = 1_767_225_600_000 // CHUNK_MS * CHUNK_MS
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = str(tmp_path / 'sensor_data.db')
+    manager = DatabaseManager(path)
+    manager.register_device('sensor_01')
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def insert(conn, readings, first_id):
+    conn.executemany(f'''
+        INSERT INTO sensor_readings (device_key, ts, id, {', '.join(METRICS)})
+        VALUES (1, ?, ?, ?, ?, ?, ?)
+    ''', [(ts, first_id + i, *values) for i, (ts, values) in enumerate(readings)])
+
+
+def archive(conn, watermark):
+    archived = archive_rows(conn, {'cutoff': CHUNK_START + CHUNK_MS, 'watermark': watermark}, CHUNK_MS)
+    conn.commit()
+    return archived
+
+
+def stored_chunk(conn):
+    rows = conn.execute('SELECT chunk_start, chunk_end, count, data FROM sensor_chunks').fetchall()
+    assert len(rows) == 1
+    chunk_start, chunk_end, count, data = rows[0]
+    block = decode_block(data)
+    assert chunk_start == CHUNK_START
+    assert chunk_end == block['ts'][-1]
+    assert count == len(block['ts'])
+    return block
+
+
+def test_late_readings_are_merged_into_the_chunk(conn):
+    # SQLite stores -0.0 as 0, so signed zeros are only checked in blocks
+    early = [(CHUNK_START + k * 10_000, (20.0 + k, 1e-310, k, 3.3)) for k in range(0, 10, 2)]
+    insert(conn, early, 1)
+    assert archive(conn, 5) == 5
+
+    # Late readings fall between, before and after the archived ones
+    late = [(CHUNK_START + k * 10_000, (float('nan'), 5e-324, None, float('inf'))) for k in (9, 1, 3)]
+    late.append((CHUNK_START + 4 * 10_000, (-1.0, 0.0, 7, -3.3)))
+    insert(conn, late, 6)
+    assert archive(conn, 9) == 4
+    assert conn.execute('SELECT COUNT(*) FROM sensor_readings').fetchone()[0] == 0
+
+    block = stored_chunk(conn)
+    merged = sorted(early + late, key=lambda reading: reading[0])
+    # The archived reading comes first when timestamps are equal
+    merged.remove(late[3])
+    merged.insert(merged.index(early[2]) + 1, late[3])
+    assert block['ts'].tolist() == [ts for ts, values in merged]
+    for i, metric in enumerate(METRICS):
+        expected = [np.nan if values[i] is None else values[i] for ts, values in merged]
+        np.testing.assert_array_equal(bits(block[metric]), bits(expected), err_msg=metric)
+
+
+def test_single_late_reading_into_single_point_chunk(conn):
+    insert(conn, [(CHUNK_START + CHUNK_MS - 1, (1.0, 2.0, 3, 4.0))], 1)
+    archive(conn, 1)
+    insert(conn, [(CHUNK_START, (float('-inf'), float('nan'), 0, 5e-324))], 2)
+    archive(conn, 2)
+
+    block = stored_chunk(conn)
+    assert block['ts'].tolist() == [CHUNK_START, CHUNK_START + CHUNK_MS - 1]
+    np.testing.assert_array_equal(bits(block['temperature']), bits([float('-inf'), 1.0]))
+    np.testing.assert_array_equal(bits(block['humidity']), bits([np.nan, 2.0]))
+    np.testing.assert_array_equal(bits(block['voltage']), bits([5e-324, 4.0]))
\ No newline at end of file
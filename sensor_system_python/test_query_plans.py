@@ -0,0 +1,270 @@
+# test_query_plans.py - Query plan regression tests
+#
+# Collects every statement passed to execute()/executemany() in the
+# modules below, runs EXPLAIN QUERY PLAN for it against a populated
+# database and fails when a query scans a whole table or sorts through a
+# temporary B-tree. Run with: python -m pytest -q test_query_plans.py
+import ast
+import re
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+import database
+import system_manager
+import web_interface
+from database import DatabaseManager
+from web_interface import WebInterface
+
+MODULES = (database, web_interface, system_manager)
+
+STATEMENTS = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+# Functions whose statements are not on a hot path and are not checked
+COLD = {
+    ('database.py', 'apply_pragmas'): 'PRAGMA statements have no query plan',
+    ('database.py', 'migrate_sensor_data'): 'one-off copy of the pre-v4 sensor_data table',
+    ('database.py', 'load_device_keys'): 'reads the whole key catalog once per writer',
+    ('database.py', 'backfill_archive_totals'): 'one-off totals of blocks archived before v9',
+    ('system_manager.py', 'clear_database'): 'empties whole tables on request',
+}
+
+# Plan steps a function may use despite the rule, and why that is fine
+DEVICE_TOTALS_PLAN = (
+    {'SCAN sensor_readings', 'SCAN archive_totals', 'USE TEMP B-TREE FOR GROUP BY', 'USE TEMP B-TREE FOR ORDER BY'},
+    'averages every reading in primary key order, adds the archived totals '
+    '(one row per device), then merges and sorts one row per device')
+
+ALLOWED = {
+    ('database.py', 'get_device_statistics'): DEVICE_TOTALS_PLAN,
+    ('web_interface.py', 'get_system_statistics'): DEVICE_TOTALS_PLAN,
+    ('system_manager.py', 'show_statistics'): DEVICE_TOTALS_PLAN,
+    ('web_interface.py', 'seed_watchdog'): (
+        {'SCAN archive_totals'},
+        'sums the archived totals, one row per device, once at startup'),
+    ('web_interface.py', 'get_recent_alerts'): (
+        {'SCAN alerts'},
+        'walks the rowid backwards and stops after LIMIT rows'),
+}
+
+DEVICES = 20
+READINGS = 4000
+
+
+class SqlCollector(ast.NodeVisitor):
+    """execute()/executemany() calls with their enclosing class and function"""
+
+    def __init__(self):
+        self.classes = []
+        self.functions = []
+        self.calls = []
+
+    def visit_ClassDef(self, node):
+        self.classes.append(node.name)
+        self.generic_visit(node)
+        self.classes.pop()
+
+    def visit_FunctionDef(self, node):
+        self.functions.append(node.name)
+        self.generic_visit(node)
+        self.functions.pop()
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Attribute) and node.func.attr in ('execute', 'executemany') and node.args:
+            self.calls.append((self.classes[-1] if self.classes else None,
+                               self.functions[-1] if self.functions else '', node))
+        self.generic_visit(node)
+
+
+def sql_calls(module):
+    collector = SqlCollector()
+    with open(module.__file__, encoding='utf-8') as source:
+        collector.visit(ast.parse(source.read()))
+    return collector.calls
+
+
+def evaluate(module, class_name, node, **values):
+    """SQL text of a call, from module constants, class attributes (self.SELECT) and values"""
+    namespace = dict(vars(module), **values)
+    if class_name:
+        namespace['self'] = getattr(module, class_name)
+    return eval(compile(ast.Expression(node.args[0]), module.__file__, 'eval'), namespace)
+
+
+def collect(module):
+    """(file, function, line, sql) of every call; sql is None when it is built at runtime"""
+    statements = []
+    for class_name, function, node in sql_calls(module):
+        try:
+            sql = evaluate(module, class_name, node)
+        except (NameError, AttributeError):
+            sql = None
+        statements.append((module.__name__ + '.py', function, node.lineno, sql))
+    return statements
+
+
+STATIC = [statement for module in MODULES for statement in collect(module)]
+
+
+def parameters(sql):
+    """NULL bindings for every placeholder; the plan does not depend on values"""
+    code = re.sub(r"'[^']*'", '', sql)
+    if re.search(r':\w', code):
+        return {name: None for name in re.findall(r':(\w+)', code)}
+    return (None,) * code.count('?')
+
+
+def plan_problems(conn, sql, allowed=()):
+    """Full table scans and temp B-tree sorts in the plan of sql"""
+    plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', parameters(sql))]
+    # Subquery results are scanned as a whole by design
+    subqueries = {match.group(1) for match in (re.match(r'(?:MATERIALIZE|CO-ROUTINE) (\S+)', step)
+                                               for step in plan) if match}
+    problems = []
+    for step in plan:
+        scan = re.fullmatch(r'SCAN (\S+)', step)
+        if (scan and scan.group(1) not in subqueries) or 'USE TEMP B-TREE' in step:
+            if step not in allowed:
+                problems.append(step)
+    return plan, problems
+
+
+@pytest.fixture(scope='module')
+def db_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('plans') / 'sensor_data.db')
+    manager = DatabaseManager(path)
+    manager.save_sensor_data_batch([{
+        'device_id': f'sensor_{k % DEVICES:02d}',
+        'temperature': 20.0 + k % 7,
+        'humidity': 40.0 + k % 11,
+        'light_level': k % 1000,
+        'voltage': 3.3,
+        'seq': k // DEVICES
+    } for k in range(READINGS)])
+    manager.save_alerts([{
+        'rule': 'temperature_high', 'device_id': f'sensor_{k:02d}', 'metric': 'temperature',
+        'value': 31.0, 'threshold': 30.0, 'severity': 'warning', 'state': 'firing',
+        'created_at': '2026-01-01T00:00:00'
+    } for k in range(DEVICES)])
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
+
+
+def check(conn, filename, function, sql):
+    if (filename, function) in COLD or not sql.lstrip().upper().startswith(STATEMENTS):
+        return
+    allowed = ALLOWED.get((filename, function), ((), ''))[0]
+    plan, problems = plan_problems(conn, sql, allowed)
+    assert not problems, (f"{filename}:{function} scans or sorts without an index: {problems}\n"
+                          f"SQL: {' '.join(sql.split())}\nPlan: {plan}")
+
+
+CONSTANT = [statement for statement in STATIC if statement[3] is not None]
+
+
+@pytest.mark.parametrize('filename, function, line, sql', CONSTANT,
+                         ids=[f'{filename}:{line}' for filename, function, line, sql in CONSTANT])
+def test_static_statement_plan(conn, filename, function, line, sql):
+    check(conn, filename, function, sql)
+
+
+def traced(db_path, statements):
+    """Connection that records every statement it runs, values inlined"""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.set_trace_callback(statements.append)
+    return conn
+
+
+def run_insert_reading(db_path, monkeypatch):
+    statements = []
+    manager = DatabaseManager(db_path)
+    monkeypatch.setattr(database, 'connect', lambda path, **kwargs: traced(path, statements))
+    manager.save_sensor_data({
+        'device_id': 'sensor_00', 'temperature': 21.0, 'humidity': 45.0,
+        'light_level': 300, 'voltage': 3.3, 'seq': READINGS
+    })
+    return statements
+
+
+def run_devices_from_db(db_path, monkeypatch):
+    statements = []
+    web = SimpleNamespace(get_db_connection=lambda: traced(db_path, statements),
+                          watchdog=SimpleNamespace(status=lambda device_id: 'online'))
+    newest = WebInterface.get_devices_from_db(web, limit=5)
+    WebInterface.get_devices_from_db(web)
+    WebInterface.get_devices_from_db(web, limit=5, after=(newest[-1]['last_seen'], newest[-1]['device_id']))
+    return statements
+
+
+def run_devices_by_id(db_path, monkeypatch):
+    statements = []
+    web = SimpleNamespace(get_db_connection=lambda: traced(db_path, statements),
+                          watchdog=SimpleNamespace(status=lambda device_id: 'online'))
+    WebInterface.get_devices_by_id(web, ['sensor_01', 'sensor_02'])
+    return statements
+
+
+def run_recent_sensor_data(db_path, monkeypatch):
+    statements = []
+    conn = traced(db_path, statements)
+    for device_id in (None, 'sensor_03'):
+        for after in (None, (2 ** 62, 2 ** 62)):
+            WebInterface.query_recent_sensor_data(None, conn, device_id, 50, after).fetchall()
+    conn.close()
+    return statements
+
+
+# Functions that build their SQL at runtime are called for real
+EXERCISED = {
+    ('database.py', 'insert_reading'): run_insert_reading,
+    ('web_interface.py', 'get_devices_from_db'): run_devices_from_db,
+    ('web_interface.py', 'get_devices_by_id'): run_devices_by_id,
+    ('web_interface.py', 'query_recent_sensor_data'): run_recent_sensor_data,
+}
+
+# Variants of SQL built from arguments with a fixed set of values
+VARIANTS = {
+    ('system_manager.py', 'fetch'): [
+        {'condition': '', 'order': 'DESC'},
+        {'condition': 'WHERE id > ?', 'order': 'ASC'},
+        {'condition': 'WHERE id < ?', 'order': 'DESC'},
+    ],
+}
+
+
+def test_dynamic_statements_are_covered():
+    dynamic = {(filename, function) for filename, function, line, sql in STATIC if sql is None}
+    uncovered = dynamic - set(COLD) - set(EXERCISED) - set(VARIANTS)
+    assert not uncovered, f"SQL built at runtime with no plan check: {sorted(uncovered)}"
+
+
+def test_exceptions_name_existing_functions():
+    functions = {(filename, function) for filename, function, line, sql in STATIC}
+    stale = (set(COLD) | set(ALLOWED) | set(EXERCISED) | set(VARIANTS)) - functions
+    assert not stale, f"Exceptions for functions that no longer run SQL: {sorted(stale)}"
+
+
+@pytest.mark.parametrize('site', sorted(EXERCISED), ids=lambda site: ':'.join(site))
+def test_runtime_statement_plan(db_path, conn, monkeypatch, site):
+    statements = [sql for sql in EXERCISED[site](db_path, monkeypatch) if sql.lstrip().upper().startswith(STATEMENTS)]
+    assert statements, f"{':'.join(site)} ran no statements"
+    for sql in statements:
+        check(conn, *site, sql)
+
+
+@pytest.mark.parametrize('site', sorted(VARIANTS), ids=lambda site: ':'.join(site))
+def test_variant_statement_plan(conn, site):
+    module = next(module for module in MODULES if module.__name__ + '.py' == site[0])
+    calls = [(class_name, node) for class_name, function, node in sql_calls(module) if function == site[1]]
+    assert calls
+    for class_name, node in calls:
+        for values in VARIANTS[site]:
+            check(conn, *site, evaluate(module, class_name, node, **values))
\ No newline at end of file
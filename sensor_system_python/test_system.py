@@ -1,11 +1,14 @@
 # test_system.py - Simple system test
 import sqlite3
 import socket
+from config import Config
+
+config = Config.load()
 
 def test_database():
     """Test database functionality"""
     try:
-        conn = sqlite3.connect('data/sensor_data.db')
+        conn = sqlite3.connect(config.DATABASE.DB_PATH)
         cursor = conn.cursor()
         
         # Check tables
@@ -30,11 +33,11 @@ def test_server_connection():
     try:
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(2)
-        result = sock.connect_ex(('localhost', 8080))
+        result = sock.connect_ex((config.SERVER.HOST, config.SERVER.PORT))
         sock.close()
         
         if result == 0:
-            print("Server is running on localhost:8080 - test_system.py:37")
+            print(f"Server is running on {config.SERVER.HOST}:{config.SERVER.PORT} - test_system.py:37")
             return True
         else:
             print("Server is not available - test_system.py:40")
@@ -1,20 +1,102 @@
 # web_interface.py - Веб-интерфейс для мониторинга данных
 from flask import Flask, render_template, jsonify, request
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, emit
 import sqlite3
 import json
 from datetime import datetime, timedelta
 import threading
 import time
-from config import Config
+import importlib.util
+from config import Config, ConfigError
+from database import DEVICE_TOTALS, DatabaseManager, apply_pragmas, from_epoch_ms
+from analytics import SensorAnalytics
+from rollups import SensorRollups, METRICS
+from archive import ReadingArchive
+from sharding import attach_shards, settled_id, shard_paths
+from replication import replication_status
+from device_watchdog import DeviceWatchdog
+from pagination import encode_cursor, decode_cursor, clamp_page_size
+from serialization import dumps, rows_to_dicts, stream_rows
+from cache import ResponseCache, LatestReadings
+from live_feed import LiveFeed, StreamFilter, parse_last_event_id, stream_events
+from profiling import SamplingProfiler, connect, slow_queries
 import logging
 
+# Поля записи в потоке дельт; строки передаются массивами в этом порядке
+STREAM_COLUMNS = ['id', 'device_id', 'temperature', 'humidity', 'light_level', 'voltage', 'received_at']
+
 class WebInterface:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, bus=None):
         self.config = config
+        # Шина событий встроенного режима: новые записи приходят без опроса БД
+        self.bus = bus
         self.app = Flask(__name__)
         self.app.config['SECRET_KEY'] = 'sensor_system_secret_key'
         self.socketio = SocketIO(self.app, cors_allowed_origins="*")
+        # Рассылка клиентам; в режиме ASGI ее заменяет AsyncWebServer.emit
+        self.emit = self.socketio.emit
+        # Чтение с реплики разгружает файл, в который пишет сервер данных
+        self.use_replica = config.WEB.USE_REPLICA
+        if self.use_replica:
+            self.db_path, self.shards = config.REPLICATION.REPLICA_PATH, 1
+        else:
+            self.db_path, self.shards = config.DATABASE.DB_PATH, config.DATABASE.SHARDS
+        shards = self.shards
+        # Создание или миграция схемы, если веб-интерфейс запущен раньше сервера данных
+        for path in shard_paths(self.db_path, shards):
+            DatabaseManager(path, config.DATABASE.PRAGMAS)
+        self.analytics = SensorAnalytics(
+            self.db_path,
+            rolling_window=config.ANALYTICS.ROLLING_WINDOW,
+            zscore_threshold=config.ANALYTICS.ZSCORE_THRESHOLD,
+            max_anomalies=config.ANALYTICS.MAX_ANOMALIES,
+            shards=shards
+        )
+        archive_after = config.DATABASE.ARCHIVE_AFTER_HOURS
+        # С журналом изменений агрегаты и архив ведет сервер данных на ведущей БД,
+        # чтобы их изменения попадали в журнал для реплик
+        maintained_here = not config.REPLICATION.CHANGELOG_DIR
+        self.rollups = SensorRollups(self.db_path, config.ANALYTICS.ROLLUP_RESOLUTIONS,
+                                     raw_horizon=archive_after * 3600 or None, shards=shards,
+                                     writable=maintained_here)
+        # Сжатие старых записей включается настройкой archive_after_hours
+        self.archive = ReadingArchive(
+            self.db_path,
+            archive_after,
+            chunk_seconds=config.DATABASE.ARCHIVE_CHUNK_SECONDS,
+            interval=config.DATABASE.ARCHIVE_INTERVAL,
+            pragmas=config.DATABASE.PRAGMAS,
+            shards=shards
+        ) if archive_after and maintained_here else None
+        self.watchdog = DeviceWatchdog(
+            config.EMULATOR.SEND_INTERVAL,
+            grace_factor=config.WATCHDOG.GRACE_FACTOR,
+            low_voltage=config.WATCHDOG.LOW_VOLTAGE,
+            slots=config.WATCHDOG.WHEEL_SLOTS,
+            tick_seconds=config.WATCHDOG.TICK_SECONDS
+        )
+        self.response_cache = ResponseCache(config.WEB.CACHE_MAX_ENTRIES)
+        self.last_alert_id = None
+        self.started_at = time.time()
+        # Счетчики для /api/health, ведутся по новым записям без запросов к БД
+        self.total_records = 0
+        self.last_record = None
+        # Идентификатор последней увиденной записи - поколение данных для кэша
+        self.last_data_id = None
+        self.latest = LatestReadings()
+        # Последние записи для клиентов /api/stream (SSE)
+        self.feed = LiveFeed(config.WEB.STREAM_BUFFER)
+        self.counters_lock = threading.Lock()
+        # Записи, еще не разосланные клиентам, и номер последней рассылки
+        self.pending_readings = []
+        self.broadcast_seq = 0
+        self.stats_generation = None
+        # Положение и отставание реплики, обновляется циклом рассылки
+        self.replication = None
+        # Профилирование по запросу: /api/debug/*, если profiling.enabled
+        profiling = config.PROFILING
+        slow_queries.configure(profiling.SLOW_QUERY_MS, profiling.SLOW_QUERY_KEEP, profiling.SLOW_QUERY_LOG)
+        self.profiler = SamplingProfiler(profiling.SAMPLE_INTERVAL)
         self.setup_routes()
         self.setup_logging()
         
@@ -34,12 +116,45 @@ class WebInterface:
         def get_devices():
             """API для получения списка устройств"""
             try:
-                devices = self.get_devices_from_db()
+                status = request.args.get('status')
+                if status in ('stale', 'low_voltage'):
+                    # Список берется из памяти сторожа, кэш не нужен
+                    if status == 'stale':
+                        devices = self.get_devices_by_id(self.watchdog.stale_devices())
+                    else:
+                        devices = self.get_devices_by_id(self.watchdog.low_voltage_devices())
+                    return self.json_response({
+                        'status': 'success',
+                        'devices': devices,
+                        'next': None,
+                        'timestamp': datetime.now().isoformat()
+                    })
+
+                limit = clamp_page_size(request.args.get('limit'),
+                                        self.config.WEB.DEFAULT_PAGE_SIZE,
+                                        self.config.WEB.MAX_PAGE_SIZE)
+                after = decode_cursor(request.args.get('cursor'), 2)
+
+                def render():
+                    devices = self.get_devices_from_db(limit + 1, after)
+                    next_cursor = None
+                    if len(devices) > limit:
+                        devices = devices[:limit]
+                        next_cursor = encode_cursor(devices[-1]['last_seen'], devices[-1]['device_id'])
+
+                    return dumps({
+                        'status': 'success',
+                        'devices': devices,
+                        'next': next_cursor,
+                        'timestamp': datetime.now().isoformat()
+                    })
+
+                return self.cached_response(self.config.WEB.CACHE_TTL_DEVICES, render)
+            except ValueError as e:
                 return jsonify({
-                    'status': 'success',
-                    'devices': devices,
-                    'timestamp': datetime.now().isoformat()
-                })
+                    'status': 'error',
+                    'message': str(e)
+                }), 400
             except Exception as e:
                 return jsonify({
                     'status': 'error',
@@ -51,15 +166,31 @@ class WebInterface:
             """API для получения последних данных"""
             try:
                 device_id = request.args.get('device_id')
-                limit = int(request.args.get('limit', 50))
+                limit = clamp_page_size(request.args.get('limit'),
+                                        self.config.WEB.DEFAULT_PAGE_SIZE,
+                                        self.config.WEB.MAX_PAGE_SIZE)
+                after = decode_cursor(request.args.get('cursor'), 2)
+                columnar = request.args.get('format') == 'columnar'
                 
-                data = self.get_recent_sensor_data(device_id, limit)
+                def page_info(count, last, has_more):
+                    # Лишняя строка в выборке показывает, есть ли следующая страница
+                    next_cursor = encode_cursor(last['ts'], last['id']) if has_more else None
+                    return {'count': count, 'next': next_cursor}
                 
+                def render():
+                    conn = self.get_db_connection()
+                    try:
+                        cursor = self.query_recent_sensor_data(conn, device_id, limit + 1, after)
+                        return b''.join(stream_rows(cursor, 'data', limit, columnar, page_info))
+                    finally:
+                        conn.close()
+                
+                return self.cached_response(self.config.WEB.CACHE_TTL_RECENT, render)
+            except ValueError as e:
                 return jsonify({
-                    'status': 'success',
-                    'data': data,
-                    'count': len(data)
-                })
+                    'status': 'error',
+                    'message': str(e)
+                }), 400
             except Exception as e:
                 return jsonify({
                     'status': 'error',
@@ -70,44 +201,213 @@ class WebInterface:
         def get_statistics():
             """API для получения статистики"""
             try:
-                stats = self.get_system_statistics()
+                def render():
+                    return dumps({
+                        'status': 'success',
+                        'statistics': self.get_system_statistics()
+                    })
+                
+                return self.cached_response(self.config.WEB.CACHE_TTL_STATISTICS, render)
+            except Exception as e:
+                return jsonify({
+                    'status': 'error',
+                    'message': str(e)
+                }), 500
+        
+        @self.app.route('/api/data/latest')
+        def get_latest_data():
+            """Последние показания каждого устройства из памяти"""
+            return self.json_response({
+                'status': 'success',
+                'data': self.latest.snapshot()
+            })
+        
+        @self.app.route('/api/health')
+        def get_health():
+            """Легковесные метрики из памяти процесса, без запросов к БД"""
+            return self.json_response({
+                'status': 'success',
+                'health': {
+                    'uptime': round(time.time() - self.started_at, 1),
+                    'total_records': self.total_records,
+                    'last_record': self.last_record,
+                    'device_count': len(self.watchdog.devices),
+                    'stale_devices': len(self.watchdog.stale),
+                    'low_voltage_devices': len(self.watchdog.low_battery),
+                    'generation': self.last_data_id or 0,
+                    'replication': self.replication,
+                    'cache': {
+                        'hits': self.response_cache.hits,
+                        'misses': self.response_cache.misses
+                    }
+                }
+            })
+        
+        @self.app.route('/api/analytics')
+        def get_analytics():
+            """API для аналитики: перцентили, скользящие средние, аномалии"""
+            try:
+                device_id = request.args.get('device_id')
+                hours = float(request.args.get('hours', self.config.ANALYTICS.WINDOW_HOURS))
+
+                analytics = self.analytics.compute(hours, device_id)
+
+                return self.json_response({
+                    'status': 'success',
+                    'analytics': analytics,
+                    'timestamp': datetime.now().isoformat()
+                })
+            except Exception as e:
+                return jsonify({
+                    'status': 'error',
+                    'message': str(e)
+                }), 500
+
+        @self.app.route('/api/chart')
+        def get_chart():
+            """Ряды для графика: примерно одна точка на пиксель ширины"""
+            try:
+                hours = float(request.args.get('hours', 1))
+                width = max(10, min(int(request.args.get('width', 800)), self.config.WEB.CHART_MAX_WIDTH))
+                devices = [d for d in request.args.get('device_id', '').split(',') if d]
+                metrics = [m for m in request.args.get('metrics', '').split(',') if m] or list(METRICS)
+                # Явное окно start/end (секунды эпохи) для масштабирования,
+                # иначе последние hours часов
+                start = request.args.get('start', type=float)
+                end = request.args.get('end', type=float)
+                if (start is None) != (end is None) or (start is not None and start >= end):
+                    raise ValueError("start and end must be given together, start < end")
+                if hours <= 0:
+                    raise ValueError("hours must be positive")
+
+                def render():
+                    window_end = end if end is not None else time.time()
+                    window_start = start if start is not None else window_end - hours * 3600
+                    return dumps({
+                        'status': 'success',
+                        'chart': self.rollups.series(window_start, window_end, width, devices, metrics)
+                    })
+
+                return self.cached_response(self.config.WEB.CACHE_TTL_CHART, render)
+            except ValueError as e:
                 return jsonify({
+                    'status': 'error',
+                    'message': str(e)
+                }), 400
+            except Exception as e:
+                return jsonify({
+                    'status': 'error',
+                    'message': str(e)
+                }), 500
+
+        @self.app.route('/api/alerts')
+        def get_alerts():
+            """API для получения последних событий оповещений"""
+            try:
+                limit = int(request.args.get('limit', 50))
+                alerts = self.get_recent_alerts(limit)
+
+                return self.json_response({
                     'status': 'success',
-                    'statistics': stats
+                    'alerts': alerts,
+                    'count': len(alerts)
                 })
             except Exception as e:
                 return jsonify({
                     'status': 'error',
                     'message': str(e)
                 }), 500
+
+        @self.app.route('/api/stream')
+        def stream():
+            """Поток новых записей (Server-Sent Events) с фильтрами device_id и metrics"""
+            try:
+                stream_filter = StreamFilter.from_args(request.args)
+                last_id = parse_last_event_id(request.headers.get('Last-Event-ID')
+                                              or request.args.get('last_event_id'))
+            except ValueError as e:
+                return jsonify({
+                    'status': 'error',
+                    'message': str(e)
+                }), 400
+            
+            return self.app.response_class(
+                stream_events(self.feed, stream_filter, last_id, self.config.WEB.STREAM_HEARTBEAT),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
         
         @self.app.route('/api/data/export')
         def export_data():
             """API для экспорта данных"""
             try:
                 format_type = request.args.get('format', 'json')
-                data = self.get_recent_sensor_data(limit=1000)
                 
                 if format_type == 'csv':
+                    data = self.get_recent_sensor_data(limit=1000)
                     return self.export_to_csv(data)
                 else:
-                    return jsonify({
-                        'status': 'success',
-                        'data': data,
-                        'exported_at': datetime.now().isoformat()
-                    })
+                    exported_at = datetime.now().isoformat()
+                    conn = self.get_db_connection()
+                    cursor = self.query_recent_sensor_data(conn, limit=1000)
+                    return self.json_stream(conn, stream_rows(
+                        cursor, 'data', extra=lambda count, last, has_more: {'exported_at': exported_at}
+                    ))
             except Exception as e:
                 return jsonify({
                     'status': 'error',
                     'message': str(e)
                 }), 500
         
+        @self.app.route('/api/debug/profile', methods=['GET', 'POST'])
+        def debug_profile():
+            """Семплирующий профайлер: POST ?action=start|stop, GET - стеки в свернутом формате"""
+            if not self.config.PROFILING.ENABLED:
+                return jsonify({'status': 'error', 'message': 'Profiling is disabled'}), 404
+            if request.method == 'GET':
+                return self.app.response_class(self.profiler.collapsed(), mimetype='text/plain')
+            
+            action = request.args.get('action')
+            if action == 'start':
+                self.profiler.start()
+            elif action == 'stop':
+                self.profiler.stop()
+            else:
+                return jsonify({'status': 'error', 'message': f'Unknown action: {action}'}), 400
+            return jsonify({
+                'status': 'success',
+                'profiling': self.profiler.running,
+                'samples': self.profiler.samples
+            })
+        
+        @self.app.route('/api/debug/slow-queries', methods=['GET', 'POST'])
+        def debug_slow_queries():
+            """Медленные запросы с планами; POST ?threshold_ms= меняет порог (0 - выключить)"""
+            if not self.config.PROFILING.ENABLED:
+                return jsonify({'status': 'error', 'message': 'Profiling is disabled'}), 404
+            if request.method == 'POST':
+                threshold = request.args.get('threshold_ms', type=float)
+                if threshold is None or threshold < 0:
+                    return jsonify({'status': 'error', 'message': 'threshold_ms must be a non-negative number'}), 400
+                slow_queries.threshold_ms = threshold
+            return self.json_response({
+                'status': 'success',
+                'threshold_ms': slow_queries.threshold_ms,
+                'queries': slow_queries.snapshot()
+            })
+        
         @self.socketio.on('connect')
         def handle_connect():
             """Обработчик подключения WebSocket"""
             logging.info('WebSocket client connected - web_interface.py:108')
             self.socketio.emit('connected', {'message': 'Connected to sensor data stream'})
         
+        @self.socketio.on('resync')
+        def handle_resync(data):
+            """Клиент пропустил дельты или только подключился: отправляем ему срез"""
+            since = (data or {}).get('since')
+            emit('data_snapshot', self.get_stream_snapshot(since))
+        
         @self.socketio.on('disconnect')
         def handle_disconnect():
             """Обработчик отключения WebSocket"""
@@ -115,17 +415,47 @@ class WebInterface:
     
     def get_db_connection(self):
         """Создание подключения к базе данных"""
-        conn = sqlite3.connect(self.config.DATABASE.DB_PATH)
+        conn = connect(self.db_path)
         conn.row_factory = sqlite3.Row
+        apply_pragmas(conn, self.config.DATABASE.PRAGMAS)
+        # При нескольких файлах-шардах запросы читают их все сразу
+        attach_shards(conn, self.db_path, self.shards)
         return conn
     
-    def get_devices_from_db(self):
-        """Получение списка устройств из базы данных"""
+    def json_response(self, payload, status=200):
+        """JSON-ответ через быстрый сериализатор"""
+        return self.app.response_class(dumps(payload), status=status, mimetype='application/json')
+    
+    def cached_response(self, ttl, render):
+        """JSON-ответ из общего кэша: ключ - маршрут и параметры, сброс по поколению данных"""
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        entry = self.response_cache.get_or_compute(key, ttl, self.last_data_id or 0, render)
+        
+        if entry.etag in request.if_none_match:
+            response = self.app.response_class(status=304)
+        else:
+            response = self.app.response_class(entry.body, mimetype='application/json')
+        response.set_etag(entry.etag)
+        response.headers['Cache-Control'] = f'private, max-age={int(ttl)}'
+        return response
+    
+    def json_stream(self, conn, chunks):
+        """Потоковый JSON-ответ; соединение закрывается после отправки"""
+        def generate():
+            try:
+                yield from chunks
+            finally:
+                conn.close()
+        
+        return self.app.response_class(generate(), mimetype='application/json')
+    
+    def get_devices_from_db(self, limit=None, after=None):
+        """Получение страницы устройств из базы данных (ключ (last_seen, device_id))"""
         try:
             conn = self.get_db_connection()
             cursor = conn.cursor()
             
-            cursor.execute('''
+            query = '''
                 SELECT 
                     device_id,
                     device_type,
@@ -134,19 +464,21 @@ class WebInterface:
                     last_seen,
                     total_records
                 FROM devices 
-                ORDER BY last_seen DESC
-            ''')
+            '''
+            params = []
+            if after:
+                query += ' WHERE (last_seen, device_id) < (?, ?)'
+                params.extend(after)
+            query += ' ORDER BY last_seen DESC, device_id DESC'
+            if limit:
+                query += ' LIMIT ?'
+                params.append(limit)
             
-            devices = []
-            for row in cursor.fetchall():
-                devices.append({
-                    'device_id': row['device_id'],
-                    'device_type': row['device_type'],
-                    'location': row['location'],
-                    'first_seen': row['first_seen'],
-                    'last_seen': row['last_seen'],
-                    'total_records': row['total_records']
-                })
+            cursor.execute(query, params)
+            
+            devices = rows_to_dicts(cursor)
+            for device in devices:
+                device['status'] = self.watchdog.status(device['device_id'])
             
             conn.close()
             return devices
@@ -154,40 +486,66 @@ class WebInterface:
         except Exception as e:
             logging.error(f"Error getting devices: {e}")
             return []
+
+    def get_devices_by_id(self, device_ids):
+        """Получение устройств по списку идентификаторов (поиск по первичному ключу)"""
+        if not device_ids:
+            return []
+
+        try:
+            conn = self.get_db_connection()
+            cursor = conn.cursor()
+
+            placeholders = ','.join('?' * len(device_ids))
+            cursor.execute(f'''
+                SELECT device_id, device_type, location, first_seen, last_seen, total_records
+                FROM devices
+                WHERE device_id IN ({placeholders})
+            ''', device_ids)
+
+            devices = [dict(row, status=self.watchdog.status(row['device_id'])) for row in cursor.fetchall()]
+            conn.close()
+            return devices
+
+        except Exception as e:
+            logging.error(f"Error getting devices: {e}")
+            return []
     
-    def get_recent_sensor_data(self, device_id=None, limit=50):
+    def query_recent_sensor_data(self, conn, device_id=None, limit=50, after=None):
+        """Выполнение запроса последних данных (ключ страницы (ts, id)), возвращает курсор"""
+        cursor = conn.cursor()
+        # Кортежи вместо sqlite3.Row: строки сразу уходят в сериализатор
+        cursor.row_factory = None
+        
+        conditions = []
+        params = []
+        if device_id:
+            conditions.append('device_id = ?')
+            params.append(device_id)
+        if after:
+            if not all(isinstance(value, int) for value in after):
+                raise ValueError("Invalid cursor")
+            conditions.append('(ts, id) < (?, ?)')
+            params.extend(after)
+        
+        # Фильтр и сортировка по целочисленным ts и id идут по индексам sensor_readings
+        query = '''
+            SELECT id, device_id, temperature, humidity, light_level, voltage, timestamp, received_at, ts
+            FROM sensor_data
+        '''
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY ts DESC, id DESC LIMIT ?'
+        params.append(limit)
+        
+        cursor.execute(query, params)
+        return cursor
+    
+    def get_recent_sensor_data(self, device_id=None, limit=50, after=None):
         """Получение последних данных сенсоров"""
         try:
             conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            if device_id:
-                cursor.execute('''
-                    SELECT * FROM sensor_data 
-                    WHERE device_id = ? 
-                    ORDER BY timestamp DESC 
-                    LIMIT ?
-                ''', (device_id, limit))
-            else:
-                cursor.execute('''
-                    SELECT * FROM sensor_data 
-                    ORDER BY timestamp DESC 
-                    LIMIT ?
-                ''', (limit,))
-            
-            data = []
-            for row in cursor.fetchall():
-                data.append({
-                    'id': row['id'],
-                    'device_id': row['device_id'],
-                    'temperature': row['temperature'],
-                    'humidity': row['humidity'],
-                    'light_level': row['light_level'],
-                    'voltage': row['voltage'],
-                    'timestamp': row['timestamp'],
-                    'received_at': row['received_at']
-                })
-            
+            data = rows_to_dicts(self.query_recent_sensor_data(conn, device_id, limit, after))
             conn.close()
             return data
             
@@ -201,24 +559,18 @@ class WebInterface:
             conn = self.get_db_connection()
             cursor = conn.cursor()
             
-            # Общая статистика
-            cursor.execute('SELECT COUNT(*) as total_records FROM sensor_data')
-            total_records = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(DISTINCT device_id) as device_count FROM sensor_data')
-            device_count = cursor.fetchone()[0]
-            
-            # Статистика по устройствам
-            cursor.execute('''
+            # Статистика по устройствам: группировка по ключу в порядке первичного
+            # ключа вместе с итогами архивированных записей
+            cursor.execute(f'''
                 SELECT 
-                    device_id,
-                    COUNT(*) as record_count,
-                    AVG(temperature) as avg_temperature,
-                    AVG(humidity) as avg_humidity,
-                    AVG(light_level) as avg_light,
-                    MAX(timestamp) as last_update
-                FROM sensor_data 
-                GROUP BY device_id
+                    k.device_id,
+                    s.record_count,
+                    s.avg_temperature,
+                    s.avg_humidity,
+                    s.avg_light_level as avg_light,
+                    datetime(s.last_ts / 1000, 'unixepoch') as last_update
+                FROM ({DEVICE_TOTALS}) s JOIN device_keys k ON k.device_key = s.device_key
+                ORDER BY k.device_id
             ''')
             
             device_stats = []
@@ -235,8 +587,10 @@ class WebInterface:
             conn.close()
             
             return {
-                'total_records': total_records,
-                'device_count': device_count,
+                # Каждая запись учтена ровно у одного устройства
+                'total_records': sum(device['record_count'] for device in device_stats),
+                # Одна строка на устройство: отдельный COUNT(DISTINCT) не нужен
+                'device_count': len(device_stats),
                 'device_statistics': device_stats,
                 'last_updated': datetime.now().isoformat()
             }
@@ -245,6 +599,195 @@ class WebInterface:
             logging.error(f"Error getting statistics: {e}")
             return {}
     
+    def get_recent_alerts(self, limit=50):
+        """Получение последних событий оповещений"""
+        try:
+            conn = self.get_db_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT * FROM alerts
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (limit,))
+
+            alerts = [dict(row) for row in cursor.fetchall()]
+            conn.close()
+            return alerts
+
+        except Exception as e:
+            logging.error(f"Error getting alerts: {e}")
+            return []
+
+    def get_new_alerts(self):
+        """Получение оповещений, появившихся после последней отправки"""
+        try:
+            conn = self.get_db_connection()
+            cursor = conn.cursor()
+
+            if self.last_alert_id is None:
+                # При старте не пересылаем старые оповещения
+                cursor.execute('SELECT COALESCE(MAX(id), 0) FROM alerts')
+                self.last_alert_id = cursor.fetchone()[0]
+                conn.close()
+                return []
+
+            cursor.execute('''
+                SELECT * FROM alerts
+                WHERE id > ?
+                ORDER BY id
+            ''', (self.last_alert_id,))
+
+            alerts = [dict(row) for row in cursor.fetchall()]
+            if alerts:
+                self.last_alert_id = alerts[-1]['id']
+
+            conn.close()
+            return alerts
+
+        except Exception as e:
+            logging.error(f"Error getting new alerts: {e}")
+            return []
+
+    def seed_watchdog(self):
+        """Начальное заполнение сторожа по таблице устройств (один раз при старте)"""
+        try:
+            conn = self.get_db_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT COALESCE(MAX(id), 0), COUNT(*) + (SELECT COALESCE(SUM(count), 0) FROM archive_totals), MAX(ts)
+                FROM sensor_readings
+            ''')
+            self.last_data_id, self.total_records, last_ts = cursor.fetchone()
+            self.last_record = from_epoch_ms(last_ts)
+
+            cursor.execute('SELECT device_id, last_seen FROM devices')
+            for row in cursor.fetchall():
+                if row['last_seen']:
+                    seen_at = datetime.fromisoformat(str(row['last_seen'])).timestamp()
+                    self.watchdog.observe(row['device_id'], seen_at)
+
+            conn.close()
+
+        except Exception as e:
+            logging.error(f"Error seeding watchdog: {e}")
+
+    def poll_new_readings(self):
+        """Получение записей, добавленных после последнего опроса"""
+        try:
+            conn = self.get_db_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT id, device_id, temperature, humidity, light_level,
+                       voltage, timestamp, received_at
+                FROM sensor_data
+                WHERE id > ? AND id <= COALESCE(?, id)
+                ORDER BY id
+            ''', (self.last_data_id or 0, settled_id(self.shards)))
+
+            rows = [dict(row) for row in cursor.fetchall()]
+            conn.close()
+            return rows
+
+        except Exception as e:
+            logging.error(f"Error polling new readings: {e}")
+            return []
+
+    def update_replication(self):
+        """Отставание реплики для /api/health"""
+        try:
+            conn = self.get_db_connection()
+            try:
+                self.replication = replication_status(conn)
+            finally:
+                conn.close()
+        except Exception as e:
+            logging.error(f"Error reading replication state: {e}")
+
+    def record_reading(self, reading):
+        """Учет новой записи: сторож, последние показания и счетчики"""
+        seen_at = datetime.fromisoformat(reading['received_at']).timestamp()
+        self.watchdog.observe(reading['device_id'], seen_at, reading.get('voltage'))
+        self.latest.update(reading)
+        
+        with self.counters_lock:
+            self.total_records += 1
+            self.last_record = reading['received_at']
+            self.last_data_id = max(self.last_data_id or 0, reading['id'])
+            self.pending_readings.append(reading)
+        self.feed.append(reading)
+
+    def take_stream_delta(self):
+        """Новые записи с прошлой рассылки: {from, seq, columns, rows}.
+
+        seq - идентификатор последней записи. Клиент принимает дельту,
+        если from не больше его seq, иначе запрашивает resync.
+        """
+        with self.counters_lock:
+            readings, self.pending_readings = self.pending_readings, []
+            previous = self.broadcast_seq
+            self.broadcast_seq = self.last_data_id or 0
+            seq = self.broadcast_seq
+
+        if not readings:
+            return None
+        readings.sort(key=lambda reading: reading['id'])
+        return {
+            'from': previous,
+            'seq': seq,
+            'columns': STREAM_COLUMNS,
+            'rows': [[reading.get(column) for column in STREAM_COLUMNS] for reading in readings]
+        }
+
+    def get_stream_snapshot(self, since=None):
+        """Записи после since (не больше STREAM_RESYNC_ROWS последних) для resync.
+
+        Если клиент отстал больше чем на STREAM_RESYNC_ROWS записей, срез
+        помечается reset: клиент начинает заново, а не склеивает данные
+        с пропуском.
+        """
+        limit = self.config.WEB.STREAM_RESYNC_ROWS
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {', '.join(STREAM_COLUMNS)}
+                FROM sensor_data
+                WHERE id > ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (since or 0, limit + 1))
+            rows = [list(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+        truncated = len(rows) > limit
+        rows = rows[:limit][::-1]
+        return {
+            'seq': rows[-1][0] if rows else max(since or 0, self.last_data_id or 0),
+            'reset': since is None or truncated,
+            'columns': STREAM_COLUMNS,
+            'rows': rows
+        }
+
+    def subscribe(self):
+        """Подписка на события сервера данных во встроенном режиме"""
+        # Шарды фиксируют записи независимо, и id приходят не по порядку:
+        # тогда записи читаются из базы до устоявшегося id, как без шины
+        if self.shards == 1:
+            self.bus.subscribe('reading', self.record_reading)
+        self.bus.subscribe('alert', lambda event: self.emit('alert', event))
+
+    def update_watchdog(self):
+        """Передача новых записей сторожу и проверка молчащих устройств"""
+        if not self.bus or self.shards > 1:
+            for row in self.poll_new_readings():
+                self.record_reading(row)
+
+        return self.watchdog.tick()
+
     def export_to_csv(self, data):
         """Экспорт данных в CSV формат"""
         import csv
@@ -282,47 +825,88 @@ class WebInterface:
     
     def start_realtime_updates(self):
         """Запуск потока для обновления данных в реальном времени"""
+        self.seed_watchdog()
+        self.broadcast_seq = self.last_data_id or 0
+        self.feed.reset(self.broadcast_seq)
+        if self.bus:
+            self.subscribe()
+        
         def update_loop():
             while True:
                 try:
-                    # Получаем последние данные
-                    recent_data = self.get_recent_sensor_data(limit=10)
+                    # Новые записи и устройства, переставшие присылать данные
+                    silent = self.update_watchdog()
                     
-                    # Отправляем через WebSocket
-                    self.socketio.emit('data_update', {
-                        'data': recent_data,
-                        'timestamp': datetime.now().isoformat()
-                    })
+                    # Отправляем через WebSocket только новые записи
+                    delta = self.take_stream_delta()
+                    if delta:
+                        self.emit('data_delta', delta)
+                        # Новые записи сразу сворачиваются в агрегаты для графиков
+                        self.rollups.refresh()
                     
-                    # Обновляем статистику каждые 10 секунд
-                    stats = self.get_system_statistics()
-                    self.socketio.emit('stats_update', {
-                        'statistics': stats,
-                        'timestamp': datetime.now().isoformat()
-                    })
+                    # Архивируются только записи, уже свернутые в агрегаты
+                    if self.archive:
+                        self.archive.run_if_due()
+                    
+                    if self.use_replica:
+                        self.update_replication()
+                    
+                    # Статистика пересчитывается только когда появились данные
+                    if self.last_data_id != self.stats_generation:
+                        self.stats_generation = self.last_data_id
+                        self.emit('stats_update', {
+                            'statistics': self.get_system_statistics(),
+                            'timestamp': datetime.now().isoformat()
+                        })
+                    
+                    # Новые оповещения от сервера данных (со встроенной
+                    # шиной они отправляются сразу при срабатывании)
+                    if not self.bus:
+                        for alert in self.get_new_alerts():
+                            self.emit('alert', alert)
+                    
+                    if silent:
+                        self.emit('device_status', {
+                            'stale': silent,
+                            'timestamp': datetime.now().isoformat()
+                        })
                     
                 except Exception as e:
                     logging.error(f"Error in update loop: {e}")
                 
-                time.sleep(5)  # Обновление каждые 5 секунд
+                time.sleep(self.config.WEB.UPDATE_INTERVAL)
         
         # Запускаем поток обновлений
         update_thread = threading.Thread(target=update_loop, daemon=True)
         update_thread.start()
     
-    def run(self, host='localhost', port=5000, debug=False):
+    def run(self, host=None, port=None, debug=False):
         """Запуск веб-сервера"""
+        host = host or self.config.WEB.HOST
+        port = port or self.config.WEB.PORT
+        if self.config.WEB.MODE == 'asgi':
+            # uvicorn нужен только веб-интерфейсу, поэтому проверяется здесь,
+            # а не при загрузке общей конфигурации
+            if importlib.util.find_spec('uvicorn') is None:
+                raise ConfigError("web.mode 'asgi' requires uvicorn (pip install uvicorn)")
+            # Запросы к БД в пуле потоков, WebSocket и рассылка в цикле событий
+            from async_web import AsyncWebServer
+            server = AsyncWebServer(self, db_threads=self.config.WEB.DB_THREADS)
+            self.start_realtime_updates()
+            logging.info(f"Starting web interface (ASGI) on http://{host}:{port}")
+            server.run(host, port)
+            return
         self.start_realtime_updates()
         logging.info(f"Starting web interface on http://{host}:{port}")
         self.socketio.run(self.app, host=host, port=port, debug=debug, allow_unsafe_werkzeug=True)
 
 def main():
     """Основная функция запуска веб-интерфейса"""
-    config = Config()
+    config = Config.load()
     config.initialize_directories()
     
     web_interface = WebInterface(config)
-    web_interface.run(host='localhost', port=5000, debug=True)
+    web_interface.run(debug=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file